@@ -87,8 +87,6 @@ import json
 import pandas as pd
 from typing import Dict, Any, List, Optional
 from datetime import datetime
-import asyncio
-import google.generativeai as genai
 from dotenv import load_dotenv
  
 from agents.base_agent import BaseAgent
@@ -97,6 +95,7 @@ from state import (
     ValidationStatus, RiskLevel
 )
 from utils.logger import StructuredLogger
+from utils.llm_backend import get_llm_backend
  
 load_dotenv()
  
@@ -113,18 +112,9 @@ class AuditAgent(BaseAgent):
         self.audit_output_dir = os.path.join("output", "audit")
         os.makedirs(self.audit_output_dir, exist_ok=True)
  
-        # Gemini model setup
-        self.gemini_key = (
-            os.getenv("GEMINI_API_KEY_4")
-            or os.getenv("GEMINI_API_KEY")
-            or os.getenv("GEMINI_API_KEY_1")
-        )
+        # Gemini model setup (pluggable backend: Gemini gateway or offline fake)
+        self.llm = get_llm_backend(self.config.get("llm_backend"))
         self.gemini_model = os.getenv("GEMINI_MODEL", "gemini-2.0-flash-exp")
-        if self.gemini_key:
-            try:
-                genai.configure(api_key=self.gemini_key)
-            except Exception:
-                pass
  
     # ----------------------------------------------------------------------
     # Preconditions / Postconditions
@@ -316,8 +306,7 @@ class AuditAgent(BaseAgent):
         """Summarize audit report in human-readable form (Gemini optional)."""
         summary = ""
         try:
-            if self.gemini_key:
-                model = genai.GenerativeModel(self.gemini_model)
+            if self.llm.available:
                 prompt = f"""
                 Generate a short professional audit report summary.
                 Include compliance status, invoice number, risk level, and final payment outcome.
@@ -328,8 +317,7 @@ class AuditAgent(BaseAgent):
                 Compliance:
                 {json.dumps(compliance_results, indent=2)}
                 """
-                resp = await asyncio.to_thread(model.generate_content, prompt)
-                summary = (resp.text or "").strip()
+                summary = (await self.llm.generate(prompt, self.gemini_model) or "").strip()
         except Exception as e:
             self.logger.warning(f"Gemini summary failed: {e}")
  
@@ -393,7 +381,7 @@ class AuditAgent(BaseAgent):
         return {
             "agent": self.agent_name,
             "status": "healthy",
-            "gemini_enabled": bool(self.gemini_key),
+            "gemini_enabled": self.llm.available,
             "audit_output_dir": self.audit_output_dir,
         }
  
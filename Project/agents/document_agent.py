@@ -124,11 +124,7 @@
 import os
 import re
 import json
-import fitz  # PyMuPDF
-import pdfplumber
-import asyncio
-from typing import Dict, Any, List, Optional
-import google.generativeai as genai
+from typing import Dict, Any, List, Optional, Tuple
 from dotenv import load_dotenv
  
 from agents.base_agent import BaseAgent
@@ -137,34 +133,95 @@ from state import (
     InvoiceData,
     ItemDetail,
     ProcessingStatus,
+    RiskAssessment,
+    RiskLevel,
 )
 from utils.logger import StructuredLogger
+from utils.extraction_cache import ExtractionCache, content_hash
+from utils.llm_cache import LLMResponseCache
+from utils.llm_backend import get_llm_backend
+from utils.pdf_extraction import get_extraction_service
+from utils.invoice_templates import TemplateParser
+from utils.layout_templates import LayoutTemplateStore
+from utils.duplicate_index import get_duplicate_index, invoice_fingerprints
  
 load_dotenv()
  
  
 class DocumentAgent(BaseAgent):
     """Agent responsible for document processing and invoice data extraction."""
+
+    # Bump whenever the extraction prompt or its JSON schema changes so cached
+    # LLM responses produced by the old prompt are no longer served.
+    PROMPT_SCHEMA_VERSION = "invoice_v1"
  
     def __init__(self, config: Dict[str, Any] = None):
         super().__init__(agent_name="document_agent")
         self.config = config or {}
         self.logger = StructuredLogger("DocumentAgent")
  
-        # --- API Configuration ---
-        self.api_key = (
-            os.getenv("GEMINI_API_KEY_1")
-            or os.getenv("GEMINI_API_KEY")
-        )
+        # --- API Configuration (pluggable backend: Gemini gateway or offline fake) ---
+        self.llm = get_llm_backend(self.config.get("llm_backend"))
         self.model_name = os.getenv("GEMINI_MODEL", "gemini-2.0-flash-exp")
  
-        if self.api_key:
-            genai.configure(api_key=self.api_key)
- 
         # --- Extraction settings ---
         self.extraction_methods = self.config.get("extraction_methods", ["pymupdf", "pdfplumber"])
         self.ai_confidence_threshold = float(self.config.get("ai_confidence_threshold", 0.7))
         self.retry_on_failure = bool(self.config.get("retry_on_failure", True))
+
+        # --- Extraction cache (content-hash keyed, memory + disk) ---
+        self.extraction_cache = ExtractionCache(
+            cache_dir=self.config.get(
+                "extraction_cache_dir", os.path.join("output", "cache", "pdf_text")
+            ),
+            max_memory_items=int(self.config.get("extraction_cache_memory_items", 256)),
+            max_disk_bytes=int(self.config.get("extraction_cache_max_bytes", 128 * 1024 * 1024)),
+            enabled=bool(self.config.get("extraction_cache_enabled", True)),
+        )
+
+        # --- LLM response cache (persistent, TTL + capacity eviction) ---
+        self.llm_cache = LLMResponseCache(
+            db_path=self.config.get(
+                "llm_cache_path", os.path.join("output", "cache", "llm_responses.sqlite3")
+            ),
+            ttl_seconds=float(self.config.get("llm_cache_ttl_seconds", 7 * 24 * 3600)),
+            max_entries=int(self.config.get("llm_cache_max_entries", 10000)),
+            enabled=bool(self.config.get("llm_cache_enabled", True)),
+        )
+
+        # --- Off-loop extraction (process pool shared across agent instances) ---
+        self.extraction_service = get_extraction_service(
+            max_workers=self.config.get("extraction_workers"),
+            max_concurrent=self.config.get("extraction_max_concurrent"),
+            recycle_after=int(self.config.get("extraction_recycle_after", 200)),
+            timeout_s=float(self.config.get("extraction_timeout_s", 30.0)),
+            executor=self.config.get("extraction_executor", "process"),
+        )
+
+        # --- Deterministic template fast-path ahead of Gemini ---
+        self.template_parsing_enabled = bool(self.config.get("template_parsing_enabled", True))
+        self.template_parser = TemplateParser()
+        self._template_stats = {"attempts": 0, "hits": 0, "low_confidence": 0, "no_match": 0}
+
+        # --- Layout templates learned from earlier Gemini extractions ---
+        self.layout_templates = LayoutTemplateStore(
+            path=self.config.get(
+                "layout_template_path", os.path.join("output", "cache", "layout_templates.json")
+            ),
+            max_mismatches=int(self.config.get("layout_template_max_mismatches", 2)),
+            enabled=bool(self.config.get("layout_templates_enabled", True)),
+        )
+
+        # --- Duplicate-invoice index (Bloom filter + exact fingerprint store) ---
+        self.duplicate_index = None
+        if bool(self.config.get("duplicate_check_enabled", True)):
+            self.duplicate_index = get_duplicate_index(
+                self.config.get(
+                    "duplicate_index_path", os.path.join("output", "duplicates", "invoice_fingerprints.sqlite3")
+                ),
+                int(self.config.get("duplicate_bloom_capacity", 1_000_000)),
+                float(self.config.get("duplicate_bloom_error_rate", 0.001)),
+            )
  
     def _resolve_file_path(self, file_name: str) -> str:
         """
@@ -204,6 +261,9 @@ class DocumentAgent(BaseAgent):
 
     def _validate_preconditions(self, state: InvoiceProcessingState) -> bool:
         """Check if the PDF file exists before extraction."""
+        if state.document_bytes:
+            return True
+
         resolved_path = self._resolve_file_path(state.file_name)
         state.file_name = resolved_path  # update in place
 
@@ -226,21 +286,27 @@ class DocumentAgent(BaseAgent):
         state.current_agent = self.agent_name
         state.overall_status = ProcessingStatus.IN_PROGRESS
         # file_name = state.file_name
-        file_name = self._resolve_file_path(state.file_name)
+        pdf_bytes = state.document_bytes
+        source = "memory" if pdf_bytes else "file"
+        file_name = state.file_name if pdf_bytes else self._resolve_file_path(state.file_name)
         state.file_name = file_name
-        self.logger.info(f"Extracting invoice from file: {file_name}")
+        self.logger.info(f"Extracting invoice from {source}: {file_name}")
  
         try:
             if not self._validate_preconditions(state):
                 raise FileNotFoundError(f"Invoice file not found: {file_name}")
  
-            # 1️⃣ Extract text
-            raw_text = await self._extract_text_from_pdf(file_name)
+            # 1️⃣ Extract text (in-memory documents never touch the filesystem)
+            if pdf_bytes is None:
+                with open(file_name, "rb") as f:
+                    pdf_bytes = f.read()
+            state.document_bytes = None
+            raw_text = await self._extract_text_from_pdf(file_name, pdf_bytes)
             if not raw_text.strip():
                 raise ValueError("Extracted text is empty from the PDF file.")
  
-            # 2️⃣ Parse structured data via Gemini -> returns dict
-            parsed = await self._parse_invoice_with_ai(raw_text)
+            # 2️⃣ Parse structured data (templates first, Gemini fallback) -> returns dict
+            parsed, extraction_method = await self._parse_invoice(raw_text, pdf_bytes)
             # parsed must be: {"invoice_data": {...}, "overall_status": "...", "current_agent": "document_agent"}
  
             # 3️⃣ Clean & construct InvoiceData
@@ -256,6 +322,9 @@ class DocumentAgent(BaseAgent):
             confidence = self._calculate_extraction_confidence(invoice_data, raw_text)
             invoice_data.extraction_confidence = confidence
  
+            # 6️⃣ Duplicate check (PDF hash + vendor / number / total) before any downstream stage
+            duplicate = self._check_duplicate(state, invoice_data, pdf_bytes)
+
             # ✅ Save to state (keep workflow fields in state, not in InvoiceData)
             state.invoice_data = invoice_data
             state.current_agent = parsed.get("current_agent", "document_agent")
@@ -268,9 +337,11 @@ class DocumentAgent(BaseAgent):
                 status="completed",
                 details={
                     "file": file_name,
-                    "extraction_method": "multi-method+AI",
+                    "source": source,
+                    "extraction_method": extraction_method,
                     "confidence": confidence,
                     "fields_extracted": len(invoice_data.model_dump(exclude_none=True)),
+                    "duplicate_of": duplicate.get("original_process_id") if duplicate else None,
                 },
                 duration_ms=self._stop_timer(start),
             )
@@ -292,36 +363,134 @@ class DocumentAgent(BaseAgent):
  
         return state
  
+    # ------------------------------------------------------------------
+    # Duplicate Detection
+    # ------------------------------------------------------------------
+    def _check_duplicate(
+        self, state: InvoiceProcessingState, invoice_data: InvoiceData, pdf_bytes: bytes
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Claim this invoice's fingerprints; on a duplicate, mark the state for
+        escalation (the graph routes it there straight from extraction).
+        """
+        if self.duplicate_index is None:
+            return None
+        fingerprints = invoice_fingerprints(
+            invoice_data.customer_name, invoice_data.invoice_number, invoice_data.total, content_hash(pdf_bytes)
+        )
+        try:
+            duplicate = self.duplicate_index.check_and_register(fingerprints, state.process_id, state.file_name)
+        except Exception as e:
+            # the index must not block extraction; downstream checks still apply
+            self.logger.error(f"Duplicate check failed: {e}")
+            return None
+        if not duplicate:
+            return None
+
+        reason = (
+            f"Duplicate of {duplicate['original_process_id']} "
+            f"({'identical PDF' if duplicate['match'] == 'doc' else 'same vendor, invoice number and total'})"
+        )
+        self.logger.warning(f"Invoice {invoice_data.invoice_number}: {reason}")
+        state.duplicate_of = duplicate
+        state.escalation_required = True
+        state.human_review_required = True
+        # escalation expects a risk assessment; risk and payment are skipped
+        state.risk_assessment = RiskAssessment(
+            risk_level=RiskLevel.HIGH,
+            risk_score=1.0,
+            fraud_indicators=["Duplicate invoice"],
+            recommendation="reject",
+            reason=reason,
+            requires_human_review=True,
+        )
+        return duplicate
+
     # ------------------------------------------------------------------
     # Text Extraction
     # ------------------------------------------------------------------
-    async def _extract_text_from_pdf(self, file_name: str) -> str:
-        """Try multiple extraction methods and return text."""
-        text = ""
-        errors = []
-        for method in self.extraction_methods:
-            try:
-                if method == "pymupdf":
-                    with fitz.open(file_name) as doc:
-                        for page in doc:
-                            text += page.get_text("text")
-                elif method == "pdfplumber":
-                    with pdfplumber.open(file_name) as pdf:
-                        for page in pdf.pages:
-                            text += page.extract_text() or ""
-                else:
-                    continue
- 
-                if len(text.strip()) > 100:
-                    self.logger.info(f"Extraction succeeded with {method}")
-                    return text
-            except Exception as e:
-                errors.append(f"{method}: {e}")
- 
-        if not text and errors:
-            self.logger.warning(f"All extraction methods failed: {errors}")
+    async def _extract_text_from_pdf(self, file_name: str, data: Optional[bytes] = None) -> str:
+        """Return PDF text, served from the extraction cache when the same bytes were seen before."""
+        if data is None:
+            with open(file_name, "rb") as f:
+                data = f.read()
+
+        cache_key = ExtractionCache.make_key(content_hash(data), self.extraction_methods)
+        cached = self.extraction_cache.get(cache_key)
+        if cached is not None:
+            self.logger.info(f"Extraction cache hit for {os.path.basename(file_name)}")
+            return cached
+
+        text = await self.extraction_service.extract_text(data, self.extraction_methods)
+        if text.strip():
+            self.logger.info(f"Extracted {len(text)} chars from {os.path.basename(file_name)}")
+            self.extraction_cache.put(cache_key, text)
         return text
+
+    async def _extract_words_from_pdf(self, data: bytes) -> List[list]:
+        """Positioned words for layout templates; cached alongside the text."""
+        cache_key = ExtractionCache.make_key(content_hash(data), ["words"])
+        cached = self.extraction_cache.get(cache_key)
+        if cached is not None:
+            return json.loads(cached)
+
+        words = await self.extraction_service.extract_words(data)
+        if words:
+            self.extraction_cache.put(cache_key, json.dumps(words))
+        return words
  
+    # ------------------------------------------------------------------
+    # Parsing strategy
+    # ------------------------------------------------------------------
+    async def _parse_invoice(self, text: str, data: Optional[bytes] = None) -> Tuple[Dict[str, Any], str]:
+        """
+        Use a known layout template when it is confident enough, then a layout
+        learned from earlier Gemini extractions, otherwise ask Gemini (and learn
+        the layout from its answer).
+        """
+        if self.template_parsing_enabled:
+            self._template_stats["attempts"] += 1
+            result = self.template_parser.parse(text)
+            if result is None:
+                self._template_stats["no_match"] += 1
+            elif result.confidence >= self.ai_confidence_threshold:
+                self._template_stats["hits"] += 1
+                self.logger.info(f"Template '{result.template}' parsed invoice — skipping Gemini")
+                parsed = {
+                    "invoice_data": self._clean_parsed_invoice_dict(result.invoice_data),
+                    "overall_status": "in_progress",
+                    "current_agent": "document_agent",
+                }
+                return parsed, f"template:{result.template}"
+            else:
+                self._template_stats["low_confidence"] += 1
+                self.logger.info(
+                    f"Template '{result.template}' below confidence threshold for "
+                    f"{result.low_confidence_fields(self.ai_confidence_threshold)} — falling back to Gemini"
+                )
+
+        words: List[list] = []
+        if self.layout_templates.enabled and data:
+            try:
+                words = await self._extract_words_from_pdf(data)
+            except Exception as e:
+                self.logger.warning(f"Word extraction failed, skipping learned layouts: {e}")
+            learned = self.layout_templates.extract(words) if words else None
+            if learned is not None:
+                fingerprint, invoice_data = learned
+                self.logger.info(f"Learned layout {fingerprint[:12]} parsed invoice — skipping Gemini")
+                parsed = {
+                    "invoice_data": self._clean_parsed_invoice_dict(invoice_data),
+                    "overall_status": "in_progress",
+                    "current_agent": "document_agent",
+                }
+                return parsed, f"learned_layout:{fingerprint[:12]}"
+
+        parsed = await self._parse_invoice_with_ai(text)
+        if words:
+            self.layout_templates.learn(words, parsed.get("invoice_data") or {})
+        return parsed, "multi-method+AI"
+
     # ------------------------------------------------------------------
     # AI-based JSON Parsing (Gemini)
     # ------------------------------------------------------------------
@@ -356,8 +525,6 @@ class DocumentAgent(BaseAgent):
           "current_agent": "document_agent"
         }
         """
-        if not self.api_key:
-            raise RuntimeError("Gemini API key not configured for DocumentAgent")
         if not text.strip():
             raise ValueError("PDF text is empty — cannot extract invoice details.")
  
@@ -401,18 +568,23 @@ Invoice text:
 {text[:5000]}
         """.strip()
  
-        # Call Gemini
-        model = genai.GenerativeModel(self.model_name)
-        response = await asyncio.to_thread(model.generate_content, prompt)
- 
-        # Extract raw text
-        raw_output = ""
-        if hasattr(response, "text") and response.text:
-            raw_output = response.text.strip()
-        elif hasattr(response, "parts") and response.parts:
-            raw_output = " ".join(str(p.text) for p in response.parts if hasattr(p, "text"))
-        if not raw_output:
-            raise ValueError("Empty response from Gemini model")
+        # Serve identical prompts from the response cache
+        # keyed per backend so offline fake responses never answer real runs
+        cache_model = f"{self.llm.name}:{self.model_name}"
+        cache_key = LLMResponseCache.make_key(prompt, cache_model, self.PROMPT_SCHEMA_VERSION)
+        cached_output = self.llm_cache.get(cache_key)
+        if cached_output is not None:
+            self.logger.info("LLM cache hit — skipping Gemini call")
+            raw_output = cached_output
+        else:
+            if not self.llm.available:
+                raise RuntimeError("Gemini API key not configured for DocumentAgent")
+
+            # Call Gemini
+            raw_output = await self.llm.generate(prompt, self.model_name)
+            if not raw_output:
+                raise ValueError("Empty response from Gemini model")
+        response_text = raw_output
  
         # Remove code fences if any
         raw_output = raw_output.strip()
@@ -428,6 +600,10 @@ Invoice text:
  
         # Parse JSON
         parsed = json.loads(json_str)
+
+        # Only responses that parsed cleanly are worth replaying
+        if cached_output is None:
+            self.llm_cache.put(cache_key, response_text, cache_model)
  
  
         # Detect if mock test flat JSON (no 'invoice_data' key)
@@ -636,6 +812,12 @@ Invoice text:
             "agent": self.agent_name,
             "status": "healthy",
             "model": self.model_name,
-            "api_key_loaded": bool(self.api_key),
+            "api_key_loaded": self.llm.available,
+            "llm_backend": self.llm.stats(),
             "methods": self.extraction_methods,
+            "extraction_cache": self.extraction_cache.stats(),
+            "llm_cache": self.llm_cache.stats(),
+            "extraction_service": self.extraction_service.stats(),
+            "template_parser": dict(self._template_stats),
+            "layout_templates": self.layout_templates.stats(),
         }
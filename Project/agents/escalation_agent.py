@@ -90,7 +90,6 @@ from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from typing import Dict, Any, Optional
 from datetime import datetime, timedelta
-import google.generativeai as genai
 from dotenv import load_dotenv
 
 from agents.base_agent import BaseAgent
@@ -99,6 +98,7 @@ from state import (
     RiskLevel, ValidationStatus
 )
 from utils.logger import StructuredLogger
+from utils.llm_backend import get_llm_backend
 
 load_dotenv()
 
@@ -121,14 +121,9 @@ class EscalationAgent(BaseAgent):
         self.fraud_email = os.getenv("FRAUD_EMAIL", "fraud@enterprise.com")
         self.procurement_email = os.getenv("PROCUREMENT_EMAIL", "procurement@enterprise.com")
 
-        # Gemini optional setup
-        self.gemini_key = os.getenv("GEMINI_API_KEY_5") or os.getenv("GEMINI_API_KEY")
+        # Gemini optional setup (pluggable backend: Gemini gateway or offline fake)
+        self.llm = get_llm_backend(self.config.get("llm_backend"))
         self.gemini_model = os.getenv("GEMINI_MODEL", "gemini-2.0-flash-exp")
-        if self.gemini_key:
-            try:
-                genai.configure(api_key=self.gemini_key)
-            except Exception:
-                pass
 
         # SLA configurations
         self.sla_hours = {"low": 24, "medium": 12, "high": 6, "critical": 3}
@@ -224,6 +219,10 @@ class EscalationAgent(BaseAgent):
         val = state.validation_result
         inv = state.invoice_data
 
+        if state.duplicate_of:
+            return "duplicate_invoice"
+        if state.po_reservation and state.po_reservation.get("over_billed"):
+            return "po_over_billing"
         if risk.risk_level in (RiskLevel.HIGH, RiskLevel.CRITICAL):
             return "high_risk"
         if val and val.validation_status == ValidationStatus.REQUIRES_APPROVAL:
@@ -255,6 +254,8 @@ class EscalationAgent(BaseAgent):
             return {"name": "CFO", "email": self.executive_email}
         if escalation_type == "fraud_suspicion":
             return {"name": "Fraud Team Lead", "email": self.fraud_email}
+        if escalation_type in ("duplicate_invoice", "po_over_billing"):
+            return {"name": "Finance Manager", "email": self.manager_email}
         return {"name": "Procurement Lead", "email": self.procurement_email}
 
     def _parse_date(self, date_str: str) -> Optional[datetime.date]:
@@ -275,8 +276,7 @@ class EscalationAgent(BaseAgent):
                                            escalation_type: str, approver_info: Dict[str, Any]) -> str:
         """Generate concise escalation summary (Gemini optional)."""
         try:
-            if self.gemini_key:
-                model = genai.GenerativeModel(self.gemini_model)
+            if self.llm.available:
                 prompt = f"""
                 Create a professional escalation summary (max 4 bullet points)
                 explaining reason, risk level, total amount, and next approver.
@@ -287,8 +287,7 @@ class EscalationAgent(BaseAgent):
                 Invoice: {getattr(state.invoice_data, "invoice_number", "")}
                 Approver: {approver_info.get("name")}
                 """
-                resp = await asyncio.to_thread(model.generate_content, prompt)
-                return (resp.text or "").strip()
+                return (await self.llm.generate(prompt, self.gemini_model) or "").strip()
         except Exception:
             pass
 
@@ -422,7 +421,7 @@ class EscalationAgent(BaseAgent):
             "agent": self.agent_name,
             "status": "healthy",
             "smtp_configured": bool(self.smtp_password),
-            "gemini_enabled": bool(self.gemini_key),
+            "gemini_enabled": self.llm.available,
             "sla_hours": self.sla_hours,
         }
 
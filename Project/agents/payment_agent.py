@@ -557,10 +557,9 @@ import requests
 from typing import Dict, Any, Optional
 from datetime import datetime, timedelta
 import asyncio
-import google.generativeai as genai
 from dotenv import load_dotenv
 
-from agents.base_agent import BaseAgent
+from agents.base_agent import BaseAgent, agent_registry
 from state import (
     InvoiceProcessingState,
     PaymentStatus,
@@ -569,6 +568,8 @@ from state import (
     ProcessingStatus,
 )
 from utils.logger import StructuredLogger
+from utils.llm_backend import get_llm_backend
+from utils.po_ledger import release_reservation
 
 load_dotenv()
 
@@ -595,14 +596,9 @@ class PaymentAgent(BaseAgent):
         )
         self.payment_api_key = os.getenv("PAYMENT_API_KEY", "")
 
-        # Gemini optional
-        self.gemini_key = os.getenv("GEMINI_API_KEY_4") or os.getenv("GEMINI_API_KEY")
+        # Gemini optional (pluggable backend: Gemini gateway or offline fake)
+        self.llm = get_llm_backend(self.config.get("llm_backend"))
         self.gemini_model = os.getenv("GEMINI_MODEL", "gemini-2.0-flash-exp")
-        if self.gemini_key:
-            try:
-                genai.configure(api_key=self.gemini_key)
-            except Exception:
-                pass
 
         self.retry_attempts = 3
         self.retry_delay_seconds = 2
@@ -690,6 +686,14 @@ class PaymentAgent(BaseAgent):
                 result = await self._execute_payment(inv, decision)
                 decision = self._update_payment_decision(decision, result)
                 state.payment_decision = decision
+                if decision.get("transaction_id"):
+                    # paid invoices form the vendor's amount baseline
+                    risk_agent = agent_registry.get("risk_agent")
+                    if risk_agent is not None:
+                        risk_agent.record_approved_amount(state)
+            elif status == PaymentStatus.REJECTED.value:
+                # a rejected invoice no longer consumes its PO balance
+                await release_reservation(state.po_reservation, state.process_id)
 
             self.logger.info(
                 "PaymentAgent Output: status=%s approved_amount=%s method=%s scheduled=%s",
@@ -916,20 +920,18 @@ class PaymentAgent(BaseAgent):
         validation_result,
         risk_assessment,
     ) -> str:
-        if not self.gemini_key:
+        if not self.llm.available:
             return (
                 f"Payment decision: {payment_decision.get('payment_status')}. "
                 f"Risk: {risk_assessment.risk_level}."
             )
         try:
-            model = genai.GenerativeModel(self.gemini_model)
             prompt = f"""
             Generate a short justification for the following payment:
             Invoice: {invoice_data.invoice_number}, Amount: {invoice_data.total},
             Risk Level: {risk_assessment.risk_level}, Decision: {payment_decision.get('payment_status')}.
             """
-            resp = model.generate_content(prompt)
-            return resp.text.strip()
+            return (await self.llm.generate(prompt, self.gemini_model)).strip()
         except Exception:
             return "AI justification unavailable."
 
@@ -938,7 +940,7 @@ class PaymentAgent(BaseAgent):
             "agent": self.agent_name,
             "status": "healthy",
             "api_url": self.payment_api_url,
-            "gemini_enabled": bool(self.gemini_key),
+            "gemini_enabled": self.llm.available,
         }
 
 
@@ -79,11 +79,9 @@
 import os
 import json
 import re
-from typing import Dict, Any, List
-import google.generativeai as genai
+from typing import Dict, Any, List, Optional
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
-import asyncio
 
 from agents.base_agent import BaseAgent
 from state import (
@@ -91,6 +89,13 @@ from state import (
     ValidationStatus, ProcessingStatus
 )
 from utils.logger import StructuredLogger
+from utils.llm_backend import get_llm_backend
+from utils.near_duplicate_index import get_near_duplicate_index
+from utils.check_graph import Check, CheckGraph
+from utils.risk_model import get_risk_history, load_risk_model, invoice_features
+from utils.vendor_stats import get_vendor_stats
+from utils.velocity import get_velocity_counter
+from utils.po_repository import normalize_name, normalize_key
 
 load_dotenv()
 
@@ -103,15 +108,9 @@ class RiskAgent(BaseAgent):
         self.config = config or {}
         self.logger = StructuredLogger("RiskAgent")
 
-        # Gemini config
-        self.api_key = (
-            os.getenv("GEMINI_API_KEY_3")
-            or os.getenv("GEMINI_API_KEY")
-            or os.getenv("GEMINI_API_KEY_1")
-        )
+        # Gemini config (pluggable backend: Gemini gateway or offline fake)
+        self.llm = get_llm_backend(self.config.get("llm_backend"))
         self.model_name = os.getenv("GEMINI_MODEL", "gemini-2.0-flash-exp")
-        if self.api_key:
-            genai.configure(api_key=self.api_key)
 
         # Thresholds from config (with sensible defaults)
         thresholds = self.config.get("risk_thresholds", {})
@@ -127,6 +126,78 @@ class RiskAgent(BaseAgent):
         self.fraud_detection_enabled = bool(self.config.get("fraud_detection_enabled", True))
         self.compliance_checks = self.config.get("compliance_checks", ["SOX", "GDPR"])
 
+        # how far the AI risk hint may move the deterministic score. Unbounded
+        # by default: a "critical" hint forces CRITICAL and "low" can clear a
+        # high score. Setting a cap (e.g. 0.3) is a risk-policy change; it is
+        # also what lets the short-circuit below skip hints.
+        max_shift = self.config.get("ai_hint_max_shift")
+        self.ai_hint_max_shift = None if max_shift is None else float(max_shift)
+        # skip the AI hint when no hint could change the risk level (with
+        # unbounded hints every level stays reachable, so none are skipped)
+        self.ai_hint_short_circuit = bool(self.config.get("ai_hint_short_circuit", True))
+        self._metrics.update(
+            {"ai_hint_calls": 0, "ai_hint_skipped": 0, "ai_hint_model": 0, "ai_hint_skip_rate": 0.0}
+        )
+
+        # assessment history (training data) and the local model trained on it
+        self.risk_history = None
+        if bool(self.config.get("risk_history_enabled", True)):
+            self.risk_history = get_risk_history(
+                self.config.get("risk_history_path", os.path.join("output", "risk_history", "risk_history.jsonl"))
+            )
+        self.risk_model = None
+        self.risk_model_path = self.config.get("risk_model_path", os.path.join("output", "models", "risk_model.npz"))
+        # below this probability the LLM is asked instead
+        self.risk_model_min_confidence = float(self.config.get("risk_model_min_confidence", 0.8))
+        if bool(self.config.get("risk_model_enabled", True)):
+            try:
+                self.risk_model = load_risk_model(self.risk_model_path)
+            except Exception as e:
+                self.logger.warning(f"Risk model {self.risk_model_path} not loaded: {e}")
+
+        # per-check timeouts (seconds) of the concurrent risk checks
+        self.check_timeouts = {
+            "fraud_indicators": 5.0, "ai_hint": 10.0,
+            **{k: float(v) for k, v in (self.config.get("risk_check_timeouts") or {}).items()},
+        }
+
+        # running amount statistics per vendor for the unusual-amount check
+        self.vendor_stats = None
+        if bool(self.config.get("vendor_stats_enabled", True)):
+            self.vendor_stats = get_vendor_stats(
+                self.config.get("vendor_stats_path", os.path.join("output", "vendor_stats", "vendor_stats.sqlite3")),
+                float(self.config.get("vendor_ewma_alpha", 0.1)),
+            )
+        # invoices a vendor needs before its own history replaces the fixed anchor
+        self.vendor_min_history = int(self.config.get("vendor_min_history", 5))
+        self.vendor_zscore_threshold = float(self.config.get("vendor_zscore_threshold", 3.0))
+
+        # sliding-window invoice counts per vendor and per order
+        self.vendor_velocity = self.order_velocity = None
+        if bool(self.config.get("velocity_enabled", True)):
+            max_keys = int(self.config.get("velocity_max_keys", 100_000))
+            self.vendor_velocity = get_velocity_counter(
+                "vendor", float(self.config.get("velocity_vendor_window_s", 3600)), 60, max_keys
+            )
+            self.order_velocity = get_velocity_counter(
+                "order", float(self.config.get("velocity_order_window_s", 86400)), 48, max_keys
+            )
+        # most invoices per window before they are flagged
+        self.velocity_vendor_max = int(self.config.get("velocity_vendor_max", 20))
+        self.velocity_order_max = int(self.config.get("velocity_order_max", 3))
+
+        # MinHash/LSH index over the raw text of every assessed invoice
+        self.near_duplicate_index = None
+        if bool(self.config.get("near_duplicate_enabled", True)):
+            self.near_duplicate_index = get_near_duplicate_index(
+                self.config.get(
+                    "near_duplicate_index_path", os.path.join("output", "duplicates", "near_duplicates.sqlite3")
+                ),
+                float(self.config.get("near_duplicate_threshold", 0.8)),
+                int(self.config.get("near_duplicate_num_perm", 128)),
+                int(self.config.get("near_duplicate_shingle_size", 3)),
+            )
+
     # -----------------------------------------------------
     # Preconditions / Postconditions
     # -----------------------------------------------------
@@ -229,17 +300,14 @@ class RiskAgent(BaseAgent):
             inv = state.invoice_data
             val = state.validation_result
 
-            # 1️⃣ Fraud indicators (rule-based)
-            fraud_indicators = await self._detect_fraud_indicators(inv, val)
-
-            # 2️⃣ Compliance issues (SOX/GDPR)
-            compliance_issues = await self._check_compliance(inv, state)
-
-            # 3️⃣ Base risk score (deterministic rules)
-            base_score = await self._calculate_base_risk_score(inv, val)
-
-            # 4️⃣ AI assist (optional)
-            ai_assessment = await self._ai_risk_assessment(inv, val, fraud_indicators)
+            # 1️⃣-4️⃣ Fraud indicators, compliance, base score and AI assist run
+            # concurrently (the AI hint waits for the fraud indicators)
+            features = self._risk_features(inv, val) if (self.risk_model or self.risk_history) else None
+            results, check_timings = await self._run_risk_checks(inv, val, state, features)
+            fraud_indicators = results["fraud_indicators"]
+            compliance_issues = results["compliance"]
+            base_score = results["base_score"]
+            ai_assessment = results["ai_hint"]
 
             # 5️⃣ Combine all factors
             risk_score = self._combine_risk_factors(
@@ -266,6 +334,12 @@ class RiskAgent(BaseAgent):
             state.risk_assessment = risk_assessment
             state.overall_status = ProcessingStatus.IN_PROGRESS
 
+            if self.risk_history and features is not None:
+                self.risk_history.record_assessment(
+                    state.process_id, inv.customer_name, features, risk_level.value,
+                    ai_assessment.get("source") or ai_assessment.get("skipped") or "llm",
+                )
+
             # 8️⃣ Log structured output
             output_json = {
                 "risk_assessment": {
@@ -289,7 +363,7 @@ class RiskAgent(BaseAgent):
                 agent_name=self.agent_name,
                 action="risk_assessment",
                 status="completed",
-                details=output_json["risk_assessment"],
+                details={**output_json["risk_assessment"], "check_timings": check_timings},
                 duration_ms=self._stop_timer(start),
             )
 
@@ -326,16 +400,47 @@ class RiskAgent(BaseAgent):
             if diff_ratio > self.amount_tolerance:
                 score += 0.30
 
-        # Unusual amount (heuristic — no history provided)
-        anchor = max(1.0, self.high_value_threshold / 5.0)
-        if total >= self.unusual_amount_multiplier * anchor:
-            score += 0.25
+        # Unusual amount: against the vendor's own history once it has enough,
+        # else the fixed anchor heuristic
+        z = self._vendor_amount_z(invoice_data)
+        if z is not None:
+            if z >= self.vendor_zscore_threshold:
+                score += 0.25
+        else:
+            anchor = max(1.0, self.high_value_threshold / 5.0)
+            if total >= self.unusual_amount_multiplier * anchor:
+                score += 0.25
 
         # Due date risk (overdue or near due)
         score += self._calculate_due_date_risk(invoice_data.due_date or "")
 
         return min(max(score, 0.0), 1.0)
 
+    def _risk_features(self, invoice_data, validation_result) -> Dict[str, float]:
+        due_date = None
+        try:
+            due_date = self._parse_date(invoice_data.due_date or "")
+        except Exception:
+            pass
+        vendor = self.risk_history.vendor_history(invoice_data.customer_name) if self.risk_history else None
+        return invoice_features(invoice_data, validation_result, due_date, vendor)
+
+    def _vendor_amount_z(self, invoice_data) -> Optional[float]:
+        if not self.vendor_stats or not invoice_data.total:
+            return None
+        return self.vendor_stats.zscore(invoice_data.customer_name, invoice_data.total, self.vendor_min_history)
+
+    def record_approved_amount(self, state: InvoiceProcessingState) -> bool:
+        """
+        Add an approved or paid invoice to its vendor's amount baseline
+        (called by PaymentAgent and the human review; a process id counts once).
+        Assessed but rejected, duplicate or unusual invoices stay out of it.
+        """
+        inv = state.invoice_data
+        if not self.vendor_stats or inv is None or not (inv.total or 0) > 0:
+            return False
+        return self.vendor_stats.update(inv.customer_name, inv.total, state.process_id)
+
     def _calculate_due_date_risk(self, due_date_str: str) -> float:
         if not due_date_str:
             return 0.0
@@ -369,10 +474,68 @@ class RiskAgent(BaseAgent):
             return datetime(y, mo, d).date()
         raise ValueError(f"Unrecognized date format: {date_str}")
 
+    # -----------------------------------------------------
+    # Check graph
+    # -----------------------------------------------------
+    async def _run_risk_checks(self, inv, val, state: InvoiceProcessingState, features: Optional[Dict[str, float]] = None):
+        """
+        Run the risk checks as a dependency graph, each under its own timeout.
+        The AI hint waits for the deterministic checks and is skipped when
+        their result already fixes the risk level; otherwise the local risk
+        model answers when confident and the LLM only when it is not.
+        Fraud indicators touch SQLite (near-duplicate index) and shared
+        counters, so they run in a worker thread under their timeout.
+        Compliance and the base score are in-memory rules taking microseconds;
+        they run on the loop without a timeout (one could never fire there).
+        Fallbacks: no AI hint (deterministic score only); for the rule checks
+        an indicator / issue saying they did not finish, and a medium base
+        score, so an incomplete assessment still lands in review.
+        """
+        t = self.check_timeouts
+
+        def fraud_indicators():
+            return self._detect_fraud_indicators(inv, val, state.process_id, state.file_name)
+
+        async def compliance():
+            return await self._check_compliance(inv, state)
+
+        async def base_score():
+            return await self._calculate_base_risk_score(inv, val)
+
+        async def ai_hint(fraud_indicators, compliance, base_score):
+            if self.ai_hint_short_circuit:
+                low, high = self._hint_score_bounds(base_score, fraud_indicators, compliance)
+                if self._determine_risk_level(low) == self._determine_risk_level(high):
+                    self._count_ai_hint("decided")
+                    return {"risk_hint": "", "skipped": "decided", "score_bounds": [round(low, 4), round(high, 4)]}
+            if self.risk_model is not None and features is not None:
+                level, confidence = self.risk_model.predict(features)
+                if confidence >= self.risk_model_min_confidence:
+                    self._count_ai_hint("model")
+                    return {"risk_hint": level, "source": "model", "confidence": round(confidence, 3)}
+            self._count_ai_hint("llm")
+            return await self._ai_risk_assessment(inv, val, fraud_indicators)
+
+        graph = CheckGraph([
+            Check("fraud_indicators", fraud_indicators, timeout_s=t["fraud_indicators"],
+                  fallback=lambda: ["Fraud indicator checks did not complete"], blocking=True),
+            Check("compliance", compliance, fallback=lambda: ["Compliance checks did not complete"]),
+            Check("base_score", base_score, fallback=self.med_th),
+            Check("ai_hint", ai_hint, deps=["fraud_indicators", "compliance", "base_score"],
+                  timeout_s=t["ai_hint"], fallback=dict),
+        ])
+        results, timings = await graph.run()
+        for name, timing in timings.items():
+            if timing["status"] != "ok":
+                self.logger.warning(f"Risk check '{name}' {timing['status']} after {timing['ms']}ms; using fallback")
+        return results, timings
+
     # -----------------------------------------------------
     # Fraud indicators (rule-based)
     # -----------------------------------------------------
-    async def _detect_fraud_indicators(self, invoice_data, validation_result) -> List[str]:
+    def _detect_fraud_indicators(
+        self, invoice_data, validation_result, process_id: Optional[str] = None, file_name: Optional[str] = None
+    ) -> List[str]:
         indicators: List[str] = []
 
         total = float(invoice_data.total or 0.0)
@@ -399,11 +562,25 @@ class RiskAgent(BaseAgent):
                 indicators.append("Rate mismatch")
             if "item name mismatch" in low:
                 indicators.append("Item mismatch")
+            if "po over-billing" in low:
+                indicators.append("PO over-billed across invoices")
+
+        # Amount far above the vendor's usual invoices
+        z = self._vendor_amount_z(invoice_data)
+        if z is not None and z >= self.vendor_zscore_threshold:
+            mean = self.vendor_stats.get(invoice_data.customer_name)["mean"]
+            indicators.append(f"Unusual amount for vendor ({z:.1f} std above its mean of {mean:,.2f})")
+
+        # Invoice velocity (many invoices from one vendor / for one order in a short window)
+        indicators.extend(self._velocity_indicators(invoice_data, process_id))
 
         # New vendor heuristic (no vendor master provided)
         if invoice_data.customer_name and "new" in invoice_data.customer_name.lower():
             indicators.append("First-time vendor")
 
+        # Near-duplicate of an earlier invoice (edited / re-typed copy)
+        indicators.extend(self._near_duplicate_indicators(invoice_data, process_id, file_name))
+
         # De-duplicate while preserving order
         seen = set()
         result = []
@@ -413,6 +590,41 @@ class RiskAgent(BaseAgent):
                 seen.add(i)
         return result
 
+    def _velocity_indicators(self, invoice_data, process_id: Optional[str]) -> List[str]:
+        if not self.vendor_velocity:
+            return []
+        indicators = []
+        vendor = normalize_name(invoice_data.customer_name)
+        if vendor:
+            n = self.vendor_velocity.hit(vendor, process_id)
+            if n > self.velocity_vendor_max:
+                minutes = round(self.vendor_velocity.window_s / 60)
+                indicators.append(f"High invoice velocity: {n} invoices from this vendor in {minutes} min")
+        order = normalize_key(invoice_data.order_id)
+        if order:
+            n = self.order_velocity.hit(order, process_id)
+            if n > self.velocity_order_max:
+                hours = round(self.order_velocity.window_s / 3600, 1)
+                indicators.append(f"Order {invoice_data.order_id} billed {n} times in {hours:g} h")
+        return indicators
+
+    def _near_duplicate_indicators(self, invoice_data, process_id: Optional[str], file_name: Optional[str]) -> List[str]:
+        """Look the raw text up in the MinHash index, then add it for later invoices."""
+        if self.near_duplicate_index is None or not process_id or not invoice_data.raw_text:
+            return []
+        try:
+            matches = self.near_duplicate_index.check_and_add(
+                invoice_data.raw_text, process_id, invoice_data.invoice_number, file_name
+            )
+        except Exception as e:
+            self.logger.warning(f"Near-duplicate lookup failed: {e}")
+            return []
+        return [
+            f"Near-duplicate of invoice {m['invoice_number'] or m['file_name'] or m['process_id']} "
+            f"({m['similarity']:.0%} similar)"
+            for m in matches[:3]
+        ]
+
     # -----------------------------------------------------
     # Compliance checks (SOX/GDPR-lite)
     # -----------------------------------------------------
@@ -443,7 +655,7 @@ class RiskAgent(BaseAgent):
     # Gemini assist (best-effort)
     # -----------------------------------------------------
     async def _ai_risk_assessment(self, invoice_data, validation_result, fraud_indicators: List[str]) -> Dict[str, Any]:
-        if not self.api_key:
+        if not self.llm.available:
             return {}
 
         try:
@@ -473,9 +685,7 @@ class RiskAgent(BaseAgent):
             Fraud indicators: {fraud_indicators}
             """
 
-            model = genai.GenerativeModel(self.model_name)
-            response = await asyncio.to_thread(model.generate_content, prompt)
-            text = (response.text or "{}").strip()
+            text = (await self.llm.generate(prompt, self.model_name) or "{}").strip()
             json_text = self._clean_json_response(text)
             data = json.loads(json_text)
             hint = (data.get("risk_hint") or "").lower().strip()
@@ -505,24 +715,52 @@ class RiskAgent(BaseAgent):
         compliance_issues: List[str],
         ai_assessment: Dict[str, Any]
     ) -> float:
+        score = self._deterministic_score(base_score, fraud_indicators, compliance_issues)
+        score = self._apply_risk_hint(score, (ai_assessment.get("risk_hint") or "").lower())
+        return min(max(score, 0.0), 1.0)
+
+    def _deterministic_score(self, base_score: float, fraud_indicators: List[str], compliance_issues: List[str]) -> float:
         score = base_score
 
         if self.fraud_detection_enabled:
             score += min(0.05 * len(fraud_indicators), 0.20)  # cap +0.20
 
         score += min(0.05 * len(compliance_issues), 0.15)  # cap +0.15
+        return score
 
-        hint = (ai_assessment.get("risk_hint") or "").lower()
+    def _apply_risk_hint(self, score: float, hint: str) -> float:
+        target = score
         if hint == "high":
-            score = max(score, self.high_th + 0.05)
+            target = max(score, self.high_th + 0.05)
         elif hint == "critical":
-            score = max(score, self.critical_th)
+            target = max(score, self.critical_th)
         elif hint == "medium":
-            score = max(score, self.med_th - 0.05)
+            target = max(score, self.med_th - 0.05)
         elif hint == "low":
-            score = min(score, (self.low_th + self.med_th) / 2)
-
-        return min(max(score, 0.0), 1.0)
+            target = min(score, (self.low_th + self.med_th) / 2)
+
+        if self.ai_hint_max_shift is not None:
+            target = min(max(target, score - self.ai_hint_max_shift), score + self.ai_hint_max_shift)
+        return target
+
+    def _hint_score_bounds(self, base_score: float, fraud_indicators: List[str], compliance_issues: List[str]):
+        """Lowest and highest final score over every possible AI hint (none included)."""
+        score = self._deterministic_score(base_score, fraud_indicators, compliance_issues)
+        finals = [
+            min(max(self._apply_risk_hint(score, hint), 0.0), 1.0)
+            for hint in ("", "low", "medium", "high", "critical")
+        ]
+        return min(finals), max(finals)
+
+    def _count_ai_hint(self, source: str):
+        if source == "llm":
+            self._metrics["ai_hint_calls"] += 1
+        else:
+            self._metrics["ai_hint_skipped"] += 1
+            if source == "model":
+                self._metrics["ai_hint_model"] += 1
+        total = self._metrics["ai_hint_calls"] + self._metrics["ai_hint_skipped"]
+        self._metrics["ai_hint_skip_rate"] = round(self._metrics["ai_hint_skipped"] / total, 3)
 
     # -----------------------------------------------------
     # Level mapping
@@ -586,7 +824,20 @@ class RiskAgent(BaseAgent):
             "agent": self.agent_name,
             "status": "healthy",
             "model": self.model_name,
-            "api_key_loaded": bool(self.api_key),
+            "api_key_loaded": self.llm.available,
+            "ai_hint": {
+                "calls": self._metrics["ai_hint_calls"],
+                "skipped": self._metrics["ai_hint_skipped"],
+                "from_model": self._metrics["ai_hint_model"],
+                "skip_rate": self._metrics["ai_hint_skip_rate"],
+            },
+            "risk_model": self.risk_model.meta if self.risk_model else None,
+            "risk_history": self.risk_history.stats() if self.risk_history else None,
+            "vendor_stats": self.vendor_stats.stats() if self.vendor_stats else None,
+            "velocity": {
+                "vendor": self.vendor_velocity.stats(),
+                "order": self.order_velocity.stats(),
+            } if self.vendor_velocity else None,
             "thresholds": {
                 "low": self.low_th,
                 "medium": self.med_th,
@@ -62,8 +62,7 @@
 """Validation Agent for Invoice Processing"""
  
 import os
-import pandas as pd
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 from fuzzywuzzy import fuzz
 import numpy as np
  
@@ -73,6 +72,12 @@ from state import (
     ProcessingStatus
 )
 from utils.logger import StructuredLogger
+from utils.po_repository import get_po_repository, normalize_key, item_key, parse_item_name
+from utils.receipt_store import get_receipt_store, ReceiptBatchLoader
+from utils.line_item_matcher import LineItemMatcher
+from utils.po_store import get_po_store
+from utils.po_ledger import get_po_ledger
+from utils.fuzzy_matcher import best_index, preprocess, select_hits, token_set_scores
  
  
 class ValidationAgent(BaseAgent):
@@ -86,8 +91,65 @@ class ValidationAgent(BaseAgent):
         # self.po_file_path = self.config.get("po_file_path", "data/purchase_orders.csv")
         self.po_file_path = self.config.get("po_file_path", "Project/data/purchase_orders.csv")
         self.fuzzy_threshold = int(self.config.get("fuzzy_threshold", 80))
+        # cap on fuzzy customer-name matches per invoice (None keeps all above the threshold)
+        self.fuzzy_top_k = self.config.get("fuzzy_top_k")
+        # n-gram / phonetic blocking: only fuzzy-score POs that share enough with the invoice
+        self.po_blocking_enabled = bool(self.config.get("po_blocking_enabled", True))
+        self.po_blocking_params = {
+            "ngram": int(self.config.get("po_blocking_ngram", 3)),
+            "min_overlap": float(self.config.get("po_blocking_min_overlap", 0.3)),
+            "max_candidates": self.config.get("po_blocking_max_candidates", 500),
+        }
+        # order ids differ by a digit between unrelated orders, so near matches need a stricter bar
+        self.order_id_similarity_threshold = int(self.config.get("order_id_similarity_threshold", 90))
         self.amount_tolerance = float(self.config.get("amount_tolerance", 0.05))
-        self.enable_three_way_match = bool(self.config.get("enable_three_way_match", True))
+        # invoice / PO / goods-receipt match; off unless a receipts export is configured:
+        #   {"enable_three_way_match": True, "receipts_path": "<receipts .csv, or .sqlite / .db>"}
+        # (CSV schema and SQLite import in utils/receipt_store.py). Concurrent validations
+        # share one bulk receipt lookup per batching window.
+        self.enable_three_way_match = bool(self.config.get("enable_three_way_match", False))
+        self.receipts_path = self.config.get("receipts_path")
+        self.receipt_loader = None
+        if self.enable_three_way_match:
+            if self.receipts_path and os.path.exists(self.receipts_path):
+                self.receipt_loader = ReceiptBatchLoader(
+                    get_receipt_store(self.receipts_path),
+                    window_ms=float(self.config.get("receipt_batch_window_ms", 2.0)),
+                )
+            else:
+                self.logger.warning(f"Three-way match skipped: receipts not found at {self.receipts_path}")
+        # invoice items <-> PO lines assignment (name similarity, quantity / rate deltas)
+        self.line_item_matcher = LineItemMatcher(
+            name_weight=float(self.config.get("line_match_name_weight", 0.6)),
+            quantity_weight=float(self.config.get("line_match_quantity_weight", 0.2)),
+            rate_weight=float(self.config.get("line_match_rate_weight", 0.2)),
+            min_name_score=int(self.config.get("line_match_min_name_score", 40)),
+        )
+        # pair items carrying a SKU by exact lookup; fuzzy names only for the rest
+        self.sku_matching_enabled = bool(self.config.get("sku_matching_enabled", True))
+        # running per-order balance across invoices (catches split over-billing)
+        self.po_ledger = None
+        if bool(self.config.get("po_ledger_enabled", True)):
+            self.po_ledger = get_po_ledger(
+                self.config.get("po_ledger_path", os.path.join("output", "po_ledger", "po_ledger.jsonl")),
+                fsync=bool(self.config.get("po_ledger_fsync", False)),
+            )
+        # "memory": resident, indexed PO master shared by every agent using the same
+        # file; a background watcher swaps in new versions (master reloads, deltas).
+        # "sqlite": indexed on-disk store for masters too large to keep resident.
+        self.po_backend = str(self.config.get("po_backend", "memory")).lower()
+        if self.po_backend == "sqlite":
+            self.po_db_path = self.config.get("po_db_path", "output/po_store/purchase_orders.sqlite")
+            # loaded by ``python -m utils.po_store import``, not here: a full import
+            # at construction would block startup (and every agent built after it)
+            self.po_repository = get_po_store(self.po_db_path)
+        else:
+            self.po_repository = get_po_repository(
+                self.po_file_path,
+                delta_path=self.config.get("po_delta_path"),
+                check_interval_s=float(self.config.get("po_reload_interval_s", 5.0)),
+                watch=bool(self.config.get("po_watch_enabled", True)),
+            )
  
     # ------------------------------------------------------------------
     # Preconditions & Postconditions
@@ -96,7 +158,14 @@ class ValidationAgent(BaseAgent):
         if not state.invoice_data:
             self.logger.error("No invoice data found for validation.")
             return False
-        if not os.path.exists(self.po_file_path):
+        if self.po_backend == "sqlite":
+            if not self.po_repository.has_rows():
+                self.logger.error(
+                    f"PO store is empty: {self.po_db_path} "
+                    f"(load it with: python -m utils.po_store import --csv {self.po_file_path} --db {self.po_db_path})"
+                )
+                return False
+        elif not os.path.exists(self.po_file_path):
             self.logger.error(f"PO file not found: {self.po_file_path}")
             return False
         return True
@@ -113,30 +182,35 @@ class ValidationAgent(BaseAgent):
         state.current_agent = self.agent_name
         state.overall_status = ProcessingStatus.IN_PROGRESS
         invoice_data = state.invoice_data
+        snap = None
  
         try:
-            # 1. Load PO data
-            po_df = self._load_purchase_orders()
+            # 1. Pin the current PO version for the whole validation
+            snap = self._load_purchase_orders()
  
             # 2. Find candidate POs using fuzzy matching
-            matching_pos = await self._find_matching_pos(invoice_data)
+            matching_pos = await self._find_matching_pos(invoice_data, snap)
  
             # 3. Validate invoice against PO(s)
             validation_result = await self._validate_against_pos(invoice_data, matching_pos)
  
-            # 4. Assign results to state
+            # 4. Book the invoice against the order's running balance
+            await self._reserve_po_balance(state, invoice_data, validation_result)
+
+            # 5. Assign results to state
             state.validation_result = validation_result
  
-            # 5. Confidence & status
+            # 6. Confidence & status
             validation_result.confidence_score = self._calculate_validation_confidence(validation_result, matching_pos)
             validation_result.validation_status = self._determine_validation_status(validation_result)
  
-            # 6. Escalation check
-            if self._should_escalate_validation(validation_result, invoice_data):
+            # 7. Escalation check
+            over_billed = bool(state.po_reservation and state.po_reservation.get("over_billed"))
+            if over_billed or self._should_escalate_validation(validation_result, invoice_data):
                 state.escalation_required = True
                 state.human_review_required = True
  
-            # 7. Log audit
+            # 8. Log audit
             state.log_action(
                 agent_name=self.agent_name,
                 action="validate_against_po",
@@ -145,7 +219,9 @@ class ValidationAgent(BaseAgent):
                     "po_found": validation_result.po_found,
                     "validation_status": validation_result.validation_status,
                     "confidence_score": validation_result.confidence_score,
-                    "discrepancies": len(validation_result.discrepancies or [])
+                    "discrepancies": len(validation_result.discrepancies or []),
+                    "po_version": snap.version,
+                    "po_billed": state.po_reservation.get("billed") if state.po_reservation else None,
                 },
                 duration_ms=self._stop_timer(start)
             )
@@ -161,6 +237,8 @@ class ValidationAgent(BaseAgent):
                 error_message=str(e)
             )
             state.overall_status = ProcessingStatus.FAILED
+        finally:
+            self._release_purchase_orders(snap)
  
         print("validation agent o/p",state)
         return state
@@ -168,28 +246,110 @@ class ValidationAgent(BaseAgent):
     # ------------------------------------------------------------------
     # PO Handling
     # ------------------------------------------------------------------
-    def _load_purchase_orders(self) -> pd.DataFrame:
+    def _load_purchase_orders(self):
         try:
-            po_df = pd.read_csv(self.po_file_path)
-            po_df.columns = [col.strip().lower() for col in po_df.columns]
-            return po_df
+            return self.po_repository.snapshot()
         except Exception as e:
             self.logger.error(f"Error loading PO file: {e}")
             raise
- 
-    async def _find_matching_pos(self, invoice_data) -> List[Dict[str, Any]]:
-        """Use fuzzy string matching to find similar POs."""
-        po_df = self._load_purchase_orders()
-        candidates = []
-        for _, row in po_df.iterrows():
-            customer_score = fuzz.token_set_ratio(
-                str(invoice_data.customer_name or ""), str(row.get("customer_name", ""))
-            )
-            if customer_score >= self.fuzzy_threshold:
-                candidates.append(row.to_dict())
+
+    @staticmethod
+    def _release_purchase_orders(snap):
+        # SQLite views hold a read transaction; in-memory snapshots need nothing
+        close = getattr(snap, "close", None)
+        if close is not None:
+            close()
+ 
+    async def _find_matching_pos(self, invoice_data, snap=None) -> List[Dict[str, Any]]:
+        """Candidate POs for one invoice (see ``find_matching_pos_batch``)."""
+        candidates = (await self.find_matching_pos_batch([invoice_data], snap))[0]
         self.logger.info(f"Found {len(candidates)} potential PO matches")
         return candidates
  
+    async def find_matching_pos_batch(self, invoices: List[Any], snap=None) -> List[List[Dict[str, Any]]]:
+        """
+        Candidate POs for several invoices at once.
+ 
+        Each invoice is first resolved through the repository indexes: exact
+        order_id, then invoice_number, then a near-identical order_id (e.g. an
+        OCR slip) found through the order_id blocking index, then normalized
+        customer name. The invoices none of those resolve are fuzzy-matched on
+        customer name: against the blocking candidates only, or (blocking
+        disabled) against every distinct PO customer in one score matrix.
+        Every candidate has to clear ``fuzzy_threshold`` on the customer
+        name, as before.
+
+        All lookups go to one PO version: ``snap`` if given, else the current one.
+        """
+        owned = snap is None
+        if owned:
+            snap = self._load_purchase_orders()
+        try:
+            return self._match_pos_batch(invoices, snap)
+        finally:
+            if owned:
+                self._release_purchase_orders(snap)
+
+    def _match_pos_batch(self, invoices: List[Any], snap) -> List[List[Dict[str, Any]]]:
+        results: List[List[Dict[str, Any]]] = [[] for _ in invoices]
+        pending = []
+        for i, invoice_data in enumerate(invoices):
+            results[i] = self._indexed_candidates(invoice_data, snap)
+            if not results[i]:
+                pending.append(i)
+ 
+        if pending:
+            names = [str(invoices[i].customer_name or "") for i in pending]
+            top_k = int(self.fuzzy_top_k) if self.fuzzy_top_k else None
+            if self.po_blocking_enabled:
+                matched = [self._blocked_matches(snap, "customer", name, top_k) for name in names]
+            else:
+                matcher = snap.customer_matcher()
+                matched = [
+                    [matcher.choices[idx] for idx, _ in hits]
+                    for hits in matcher.match(names, top_k=top_k, threshold=self.fuzzy_threshold)
+                ]
+            for i, keys in zip(pending, matched):
+                results[i] = self.po_repository.rows_for_keys("customer", keys, snap)
+        return results
+ 
+    def _blocked_matches(
+        self, snap, field: str, query: str, top_k: Optional[int] = None, threshold: Optional[int] = None
+    ) -> List[str]:
+        """Index keys of ``field`` that clear the threshold, scoring blocking candidates only."""
+        keys = snap.blocking_index(field, **self.po_blocking_params).candidates(query)
+        scores = token_set_scores([preprocess(query)], [preprocess(k) for k in keys])[0]
+        threshold = self.fuzzy_threshold if threshold is None else threshold
+        return [keys[idx] for idx, _ in select_hits(scores, threshold, top_k)]
+ 
+    def _indexed_candidates(self, invoice_data, snap) -> List[Dict[str, Any]]:
+        customer = str(invoice_data.customer_name or "")
+        repo = self.po_repository
+ 
+        def _similar_order_ids() -> List[Dict[str, Any]]:
+            if not self.po_blocking_enabled or not invoice_data.order_id:
+                return []
+            keys = self._blocked_matches(
+                snap, "order_id", str(invoice_data.order_id), top_k=1,
+                threshold=self.order_id_similarity_threshold,
+            )
+            return repo.rows_for_keys("order_id", keys, snap)
+ 
+        for lookup in (
+            lambda: repo.by_order_id(invoice_data.order_id, snap),
+            lambda: repo.by_invoice_number(invoice_data.invoice_number, snap),
+            _similar_order_ids,
+            lambda: repo.by_customer(customer, snap),
+        ):
+            rows = lookup()
+            candidates = [
+                po for po in rows
+                if fuzz.token_set_ratio(customer, str(po.get("customer_name", ""))) >= self.fuzzy_threshold
+            ]
+            if candidates:
+                return candidates
+        return []
+ 
     # ------------------------------------------------------------------
     # Validation Logic
     # ------------------------------------------------------------------
@@ -203,23 +363,75 @@ class ValidationAgent(BaseAgent):
                 confidence_score=0.0
             )
  
-        best_match = max(
-            matching_pos,
-            key=lambda po: fuzz.token_set_ratio(str(invoice_data.order_id or ""), str(po.get("order_id", ""))),
-        )
+        best_match = matching_pos[best_index(
+            str(invoice_data.order_id or ""), [str(po.get("order_id", "")) for po in matching_pos]
+        )]
+        # every line of the chosen order billed on this invoice, not just the best row
+        order_key = normalize_key(best_match.get("order_id"))
+        order_lines = [po for po in matching_pos if normalize_key(po.get("order_id")) == order_key] or [best_match]
+        po_lines = self._invoice_po_lines(invoice_data, order_lines)
+        invoice_total = sum(float(po.get("expected_amount", 0) or 0) for po in po_lines)
+        order_total = sum(float(po.get("expected_amount", 0) or 0) for po in order_lines)
  
         discrepancies: List[str] = []
         quantity_match = rate_match = amount_match = True
  
-        # Validate each item in the invoice
-        for item in invoice_data.item_details or []:
-            item_discrepancies = self._validate_item_against_po(item, best_match)
+        # Pair invoice items with PO lines (optimal assignment), then validate each pair
+        items = list(invoice_data.item_details or [])
+        if self.sku_matching_enabled:
+            assignment = self.line_item_matcher.match(
+                items,
+                po_lines,
+                [parse_item_name(self._item_name(it))["sku"] for it in items],
+                [normalize_key(po.get("sku")) or parse_item_name(po.get("item_name"))["sku"] for po in po_lines],
+            )
+        else:
+            assignment = self.line_item_matcher.match(items, po_lines)
+        multi_line = len(items) > 1
+        line_matches: List[Dict[str, Any]] = []
+        for (i, j), name_score, cost, exact in zip(
+            assignment.pairs, assignment.name_scores, assignment.costs, assignment.exact
+        ):
+            item_discrepancies = self._validate_item_against_po(items[i], po_lines[j], sku_match=exact)
             if item_discrepancies:
-                discrepancies.extend(item_discrepancies)
+                prefix = f"Line {i + 1}: " if multi_line else ""
+                discrepancies.extend(prefix + d for d in item_discrepancies)
+                quantity_match = False
+                rate_match = rate_match and not any(d.startswith("Rate mismatch") for d in item_discrepancies)
+            line_matches.append({
+                "item_index": i,
+                "item_name": self._item_name(items[i]),
+                "po_item_name": po_lines[j].get("item_name"),
+                "sku": po_lines[j].get("sku") if exact else None,
+                "match": "sku" if exact else "fuzzy",
+                "name_score": name_score,
+                "cost": cost,
+                "issues": item_discrepancies,
+            })
+        for i in assignment.unmatched_items:
+            discrepancies.append(f"Item name mismatch: '{self._item_name(items[i])}' not on PO {best_match.get('order_id')}")
+            quantity_match = False
+        for j in assignment.unmatched_po_lines:
+            po = po_lines[j]
+            discrepancies.append(
+                f"Quantity mismatch: PO line '{po.get('item_name')}' not invoiced (Expected {po.get('quantity')}, Found 0)"
+            )
+            quantity_match = False
+ 
+        # Three-way match: invoiced vs received vs ordered quantities
+        three_way_match = None
+        if self.receipt_loader is not None:
+            received = await self.receipt_loader.load(best_match.get("order_id"))
+            receipt_discrepancies = self._three_way_match(
+                items, po_lines, assignment, received, line_matches, best_match.get("order_id")
+            )
+            three_way_match = not receipt_discrepancies
+            if receipt_discrepancies:
+                discrepancies.extend(receipt_discrepancies)
                 quantity_match = False
  
-        # Validate total amounts
-        total_discrepancies = self._validate_totals(invoice_data, best_match)
+        # Validate total amounts against the PO lines of this invoice
+        total_discrepancies = self._validate_totals(invoice_data, dict(best_match, expected_amount=invoice_total))
         if total_discrepancies:
             discrepancies.extend(total_discrepancies)
             amount_match = False
@@ -235,10 +447,63 @@ class ValidationAgent(BaseAgent):
             validation_result="; ".join(discrepancies) if discrepancies else "All fields match",
             discrepancies=discrepancies,
             confidence_score=0.0,
-            expected_amount=float(best_match.get("expected_amount", 0.0)),
-            po_data=best_match
+            expected_amount=float(invoice_total),
+            # the ledger books every invoice of the order against the order's total
+            po_data=dict(best_match, order_total=round(order_total, 2)),
+            line_matches=line_matches,
+            three_way_match=three_way_match
         )
  
+    async def _reserve_po_balance(self, state: InvoiceProcessingState, invoice_data, validation_result: ValidationResult):
+        """Reserve the invoice total against its order; an exceeded balance becomes a discrepancy."""
+        po = validation_result.po_data
+        if self.po_ledger is None or not validation_result.po_found or not po or not po.get("order_id"):
+            return
+        reservation = await self.po_ledger.reserve(
+            po.get("order_id"),
+            state.process_id,
+            float(invoice_data.total or 0.0),
+            po.get("order_total", validation_result.expected_amount),
+            self.amount_tolerance,
+        )
+        state.po_reservation = reservation
+        if reservation["over_billed"]:
+            validation_result.discrepancies = list(validation_result.discrepancies or []) + [
+                f"PO over-billing: order {po.get('order_id')} already billed {reservation['billed_before']:.2f} "
+                f"of {reservation['po_total']:.2f}; this invoice adds {reservation['amount']:.2f}"
+            ]
+            validation_result.amount_match = False
+            validation_result.validation_result = "; ".join(validation_result.discrepancies)
+
+    def _three_way_match(
+        self, items, po_lines: List[Dict[str, Any]], assignment, received: Dict[str, float],
+        line_matches: List[Dict[str, Any]], order_id: Any
+    ) -> List[str]:
+        """Receipt discrepancies of the assigned lines; records ``received_quantity`` on each line match."""
+        if not received:
+            return [f"Receipt quantity mismatch: no goods receipt for order {order_id}"]
+        issues: List[str] = []
+        multi_line = len(items) > 1
+        for (i, j), line in zip(assignment.pairs, line_matches):
+            po = po_lines[j]
+            received_qty = received.get(item_key(po.get("item_name"), po.get("sku")), 0.0)
+            line["received_quantity"] = received_qty
+            item = items[i]
+            invoiced_qty = float((item.get("quantity") if isinstance(item, dict) else item.quantity) or 0)
+            ordered_qty = float(po.get("quantity", 0) or 0)
+            prefix = f"Line {i + 1}: " if multi_line else ""
+            if invoiced_qty > received_qty:
+                issues.append(f"{prefix}Receipt quantity mismatch: Invoiced {invoiced_qty}, Received {received_qty}")
+            if received_qty > ordered_qty:
+                issues.append(f"{prefix}Receipt quantity mismatch: Received {received_qty}, Ordered {ordered_qty}")
+        return issues
+ 
+    @staticmethod
+    def _item_name(item) -> str:
+        if isinstance(item, dict):
+            return str(item.get("item_name", "")).strip()
+        return str(getattr(item, "item_name", "") or "").strip()
+ 
     # def _validate_item_against_po(self, item, po_data: Dict[str, Any]) -> List[str]:
     #     issues = []
     #     item_name_score = fuzz.token_set_ratio(
@@ -259,8 +524,11 @@ class ValidationAgent(BaseAgent):
  
     #     return issues
  
-    def _validate_item_against_po(self, item, po_data: Dict[str, Any]) -> List[str]:
-        """Compare a single invoice item with PO entry, supporting both dict and ItemDetail."""
+    def _validate_item_against_po(self, item, po_data: Dict[str, Any], sku_match: bool = False) -> List[str]:
+        """
+        Compare a single invoice item with PO entry, supporting both dict and ItemDetail.
+        ``sku_match``: the pair shares a SKU, so the names are not compared.
+        """
         issues = []
  
         # ✅ Normalize invoice item data
@@ -278,10 +546,11 @@ class ValidationAgent(BaseAgent):
         po_qty = float(po_data.get("quantity", 0))
         po_rate = float(po_data.get("rate", 0))
  
-        # 🧩 Fuzzy compare item names
-        item_name_score = fuzz.token_set_ratio(item_name, po_item_name)
-        if item_name_score < self.fuzzy_threshold:
-            issues.append(f"Item name mismatch (similarity {item_name_score}%)")
+        # 🧩 Fuzzy compare item names (same SKU: same product)
+        if not sku_match:
+            item_name_score = fuzz.token_set_ratio(item_name, po_item_name)
+            if item_name_score < self.fuzzy_threshold:
+                issues.append(f"Item name mismatch (similarity {item_name_score}%)")
  
         # 🧩 Compare quantity
         if invoice_qty != po_qty:
@@ -309,7 +578,16 @@ class ValidationAgent(BaseAgent):
     #         issues.append(f"Discount applied: {discount} not in PO")
  
     #     return issues
- 
+
+    @staticmethod
+    def _invoice_po_lines(invoice_data, order_lines: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Lines of the order billed on this invoice (an order can be split across invoices); all of them when unknown."""
+        invoice_key = normalize_key(invoice_data.invoice_number)
+        if not invoice_key:
+            return order_lines
+        billed = [po for po in order_lines if normalize_key(po.get("invoice_number")) == invoice_key]
+        return billed or order_lines
+
     def _validate_totals(self, invoice_data, po_data: Dict[str, Any]) -> List[str]:
         issues = []
         try:
@@ -371,6 +649,9 @@ class ValidationAgent(BaseAgent):
             "agent": self.agent_name,
             "status": "healthy",
             "po_file_exists": os.path.exists(self.po_file_path),
+            "po_repository": self.po_repository.stats(),
+            "receipts": self.receipt_loader.store.stats() if self.receipt_loader else None,
+            "po_ledger": self.po_ledger.stats() if self.po_ledger else None,
             "fuzzy_threshold": self.fuzzy_threshold,
             "amount_tolerance": self.amount_tolerance,
         }
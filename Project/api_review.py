@@ -182,4 +182,11 @@ def create_fastapi_app():
             "overall_status": status,
         }
 
+    @app.post("/api/invoices/{process_id}/cancel")
+    async def cancel_invoice(process_id: str):
+        # same workflow instance: its in-memory PO balances see the release at once
+        result = await workflow.cancel(process_id)
+        db.collection("pending_reviews").document(process_id).delete()
+        return {"ok": True, **result}
+
     return app
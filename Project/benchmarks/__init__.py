@@ -0,0 +1,10 @@
+"""
+Benchmarks for the invoice workflow
+
+Contains:
+- synthetic.py: Synthetic SuperStore-layout invoice PDFs and matching purchase orders
+- throughput.py: End-to-end throughput / per-node latency benchmark over process_batch
+- blocking_recall.py: Recall of the PO blocking index against brute-force fuzzy matching
+"""
+
+__all__ = []
@@ -0,0 +1,255 @@
+"""
+Synthetic invoice generator.
+
+Writes invoice PDFs in the same SuperStore layout as ``data/invoices`` (so the
+template parsers, layout learning and the fake LLM all treat them like real
+uploads) plus a ``purchase_orders.csv`` with the repo's column layout. The PO
+file can be scaled far beyond the number of invoices (10 to 100k+ rows) to
+measure how validation behaves against a large PO master; the extra rows are
+orders that never get invoiced.
+
+A configurable share of invoices is billed at a different rate than its PO, so
+the benchmark also exercises the discrepancy, risk and escalation paths.
+
+Usage:
+    python -m benchmarks.synthetic --invoices 200 --pos 10000 --out output/benchmarks/data
+"""
+
+import os
+import csv
+import random
+import argparse
+import textwrap
+from datetime import date, timedelta
+from typing import Dict, Any, List, Optional
+
+PO_COLUMNS = ["invoice_number", "order_id", "customer_name", "item_name", "quantity", "rate", "expected_amount"]
+
+FIRST_NAMES = ["Bill", "Darren", "Anna", "Maria", "Tom", "Grace", "Ken", "Sara", "Luis", "Nina",
+               "Omar", "Priya", "Chen", "Eva", "Jonas", "Fatima", "Igor", "Helen", "Raj", "Mei"]
+LAST_NAMES = ["Eplett", "Koutras", "Andreadis", "Lopez", "Nguyen", "Schmidt", "Rossi", "Tanaka",
+              "Okafor", "Dubois", "Kowalski", "Larsen", "Haddad", "Silva", "Brennan", "Ivanova"]
+PLACES = [
+    ("Kingswood", "England", "United Kingdom"), ("Lyon", "Auvergne-Rhone-Alpes", "France"),
+    ("Leipzig", "Saxony", "Germany"), ("Monterrey", "Nuevo Leon", "Mexico"),
+    ("Seattle", "Washington", "United States"), ("Turin", "Piedmont", "Italy"),
+    ("Brisbane", "Queensland", "Australia"), ("Toronto", "Ontario", "Canada"),
+]
+REGIONS = ["ES", "MX", "US", "CA", "IT", "IN", "ID", "AU"]
+SHIP_MODES = ["Standard Class", "Second Class", "First Class", "Same Day"]
+CATALOG = [
+    # (name, sub-category, category, sku prefix, rate range)
+    ("Canon Wireless Fax", "Copiers", "Technology", "TEC-CO", (300, 2500)),
+    ("KitchenAid Stove", "Appliances", "Office Supplies", "OFF-AP", (150, 2000)),
+    ("Hon Executive Chair", "Chairs", "Furniture", "FUR-CH", (90, 900)),
+    ("Bretford Conference Table", "Tables", "Furniture", "FUR-TA", (200, 1800)),
+    ("Samsung Smart Phone", "Phones", "Technology", "TEC-PH", (100, 1200)),
+    ("Eldon File Cart", "Storage", "Office Supplies", "OFF-ST", (20, 400)),
+    ("Logitech Wireless Keyboard", "Accessories", "Technology", "TEC-AC", (15, 250)),
+    ("Avery Binder Set", "Binders", "Office Supplies", "OFF-BI", (5, 80)),
+    ("Sauder Bookcase", "Bookcases", "Furniture", "FUR-BO", (80, 700)),
+    ("Xerox Copy Paper", "Paper", "Office Supplies", "OFF-PA", (5, 60)),
+]
+
+
+def _money(value: float) -> str:
+    return f"${value:,.2f}"
+
+
+# ----------------------------------------------------------------------
+# Record generation
+# ----------------------------------------------------------------------
+def make_order(rng: random.Random, invoice_number: int, max_items: int = 3) -> Dict[str, Any]:
+    """One invoice-worth of data: header fields plus 1..max_items priced items."""
+    first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+    region = rng.choice(REGIONS)
+    order_date = date(2025, 1, 1) + timedelta(days=rng.randrange(0, 300))
+    items = []
+    for _ in range(rng.randint(1, max(1, max_items))):
+        name, sub_category, category, sku, (low, high) = rng.choice(CATALOG)
+        rate = round(rng.uniform(low, high), 2)
+        quantity = rng.randint(1, 9)
+        items.append({
+            "item_name": f"{name}, {sub_category}, {category}, {sku}-{rng.randint(1000, 9999)}",
+            "quantity": quantity,
+            "rate": rate,
+            "amount": round(quantity * rate, 2),
+        })
+    subtotal = round(sum(it["amount"] for it in items), 2)
+    discount_pct = rng.choice([0, 0, 0, 10, 20])
+    discount = round(subtotal * discount_pct / 100, 2)
+    shipping = round(rng.uniform(5, 300), 2)
+    return {
+        "invoice_number": str(invoice_number),
+        "order_id": f"{region}-2025-{first[0]}{last[0]}{rng.randint(10000000, 99999999)}-{41000 + rng.randint(0, 999)}",
+        "customer_name": f"{first} {last}",
+        "ship_to": rng.choice(PLACES),
+        "ship_mode": rng.choice(SHIP_MODES),
+        "due_date": (order_date + timedelta(days=30)).strftime("%b %d %Y"),
+        "items": items,
+        "subtotal": subtotal,
+        "discount_pct": discount_pct,
+        "discount": discount,
+        "shipping_cost": shipping,
+        "total": round(subtotal - discount + shipping, 2),
+    }
+
+
+def overbill(rng: random.Random, order: Dict[str, Any], low: float = 0.08, high: float = 0.3) -> Dict[str, Any]:
+    """Copy of ``order`` whose first item is billed above the PO rate."""
+    billed = dict(order, items=[dict(it) for it in order["items"]])
+    item = billed["items"][0]
+    item["rate"] = round(item["rate"] * (1 + rng.uniform(low, high)), 2)
+    item["amount"] = round(item["quantity"] * item["rate"], 2)
+    billed["subtotal"] = round(sum(it["amount"] for it in billed["items"]), 2)
+    billed["discount"] = round(billed["subtotal"] * billed["discount_pct"] / 100, 2)
+    billed["total"] = round(billed["subtotal"] - billed["discount"] + billed["shipping_cost"], 2)
+    return billed
+
+
+# ----------------------------------------------------------------------
+# PDF rendering
+# ----------------------------------------------------------------------
+def render_invoice_pdf(order: Dict[str, Any], path: str):
+    """Draw ``order`` in the SuperStore layout (text order matches the originals)."""
+    import fitz  # PyMuPDF
+
+    doc = fitz.open()
+    page = doc.new_page(width=612, height=792)
+
+    def text(x: float, y: float, value: str, size: float = 9.75, bold: bool = False):
+        page.insert_text((x, y), value, fontsize=size, fontname="hebo" if bold else "helv")
+
+    # header
+    text(461, 52, "INVOICE", size=27.75)
+    text(529, 70, f"# {order['invoice_number']}", size=12)
+    text(48, 37, "SuperStore", bold=True)
+    text(48, 134, "Bill To:")
+    text(48, 150, order["customer_name"], bold=True)
+    city, state, country = order["ship_to"]
+    text(182, 134, "Ship To:")
+    text(182, 150, f"{city}, {state},", bold=True)
+    text(182, 162, country, bold=True)
+    text(508, 142, order["ship_mode"])
+    text(518, 166, _money(order["total"]), size=11.25, bold=True)
+    text(413, 142, "Ship Mode:")
+    text(392, 166, "Balance Due:", size=11.25, bold=True)
+
+    # item table
+    text(44, 224, "Item")
+    text(373, 224, "Quantity")
+    text(472, 224, "Rate")
+    text(534, 224, "Amount")
+    y = 250
+    for item in order["items"]:
+        name_lines = textwrap.wrap(item["item_name"], 30) or [""]
+        text(44, y, name_lines[0], bold=True)
+        text(373, y, str(item["quantity"]))
+        text(449, y, _money(item["rate"]))
+        text(524, y, _money(item["amount"]))
+        for extra in name_lines[1:]:
+            y += 15
+            text(44, y, extra)
+        y += 25
+
+    # summary block: values first, then labels (as in the originals)
+    labels = [("Subtotal:", order["subtotal"])]
+    if order["discount"]:
+        labels.append((f"Discount ({order['discount_pct']}%):", order["discount"]))
+    labels += [("Shipping:", order["shipping_cost"]), ("Total:", order["total"])]
+    y = max(y + 20, 329)
+    rows = [(y + 22 * i, label, value) for i, (label, value) in enumerate(labels)]
+    for row_y, _, value in rows:
+        text(524, row_y, _money(value))
+    for row_y, label, _ in rows:
+        text(424, row_y, label)
+
+    footer = rows[-1][0] + 54
+    text(48, footer, "Notes:")
+    text(48, footer + 17, "Thanks for your business!")
+    text(48, footer + 45, "Terms:")
+    text(513, 121, order["due_date"])
+    text(417, 121, "Due Date:")
+    text(48, footer + 61, f"Order ID : {order['order_id']}")
+
+    doc.save(path, garbage=3, deflate=True)
+    doc.close()
+
+
+# ----------------------------------------------------------------------
+# Dataset
+# ----------------------------------------------------------------------
+def generate_dataset(
+    out_dir: str,
+    invoices: int = 50,
+    pos: Optional[int] = None,
+    mismatch_rate: float = 0.1,
+    max_items: int = 3,
+    seed: int = 0,
+) -> Dict[str, Any]:
+    """
+    Write ``invoices`` PDFs to ``out_dir/invoices`` and a PO master with at
+    least ``pos`` orders to ``out_dir/purchase_orders.csv``.
+
+    Every invoice has a PO; ``mismatch_rate`` of them are over-billed. Returns
+    a manifest with the file paths and counts.
+    """
+    rng = random.Random(seed)
+    invoices = max(0, int(invoices))
+    pos = max(invoices, int(pos if pos is not None else invoices))
+    invoice_dir = os.path.join(out_dir, "invoices")
+    os.makedirs(invoice_dir, exist_ok=True)
+    po_path = os.path.join(out_dir, "purchase_orders.csv")
+
+    files: List[str] = []
+    mismatched = 0
+    po_rows = 0
+    tmp_path = po_path + ".tmp"
+    with open(tmp_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(PO_COLUMNS)
+        for i in range(pos):
+            order = make_order(rng, 10000 + i, max_items)
+            for item in order["items"]:
+                writer.writerow([order["invoice_number"], order["order_id"], order["customer_name"],
+                                 item["item_name"], item["quantity"], f"{item['rate']:.2f}", item["amount"]])
+                po_rows += 1
+            if i >= invoices:
+                continue
+            billed = order
+            if rng.random() < mismatch_rate:
+                billed = overbill(rng, order)
+                mismatched += 1
+            path = os.path.join(invoice_dir, f"Synthetic-{i + 1:06d}.pdf")
+            render_invoice_pdf(billed, path)
+            files.append(os.path.abspath(path))
+    os.replace(tmp_path, po_path)
+
+    return {
+        "invoice_files": files,
+        "po_file": os.path.abspath(po_path),
+        "invoices": len(files),
+        "purchase_orders": pos,
+        "po_rows": po_rows,
+        "mismatched": mismatched,
+        "seed": seed,
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Generate synthetic invoice PDFs and a PO master")
+    parser.add_argument("--invoices", type=int, default=50)
+    parser.add_argument("--pos", type=int, default=None, help="PO master size (default: one per invoice)")
+    parser.add_argument("--mismatch-rate", type=float, default=0.1)
+    parser.add_argument("--max-items", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=os.path.join("output", "benchmarks", "data"))
+    args = parser.parse_args(argv)
+
+    manifest = generate_dataset(args.out, args.invoices, args.pos, args.mismatch_rate, args.max_items, args.seed)
+    print(f"Wrote {manifest['invoices']} invoices ({manifest['mismatched']} over-billed) and "
+          f"{manifest['purchase_orders']} POs ({manifest['po_rows']} rows) to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
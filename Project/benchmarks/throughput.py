@@ -0,0 +1,230 @@
+"""
+End-to-end throughput benchmark.
+
+Generates a synthetic dataset (see ``benchmarks.synthetic``), runs it through
+``InvoiceProcessingGraph.process_batch`` with the offline ``fake`` LLM backend
+and reports invoices/sec plus p50/p95/p99 latency per node. Node latencies are
+the per-agent durations ``BaseAgent.run`` records in each final state's
+``agent_metrics`` (one execution per node per invoice).
+
+Caches (PDF text, LLM responses, learned layouts) live in the run directory,
+so every run starts cold unless ``--warm-runs`` replays the batch first.
+
+Results are written as JSON to ``output/benchmarks/`` so runs can be compared
+over time.
+
+Usage:
+    python -m benchmarks.throughput --invoices 200 --pos 10000 --concurrency 10
+    python -m benchmarks.throughput --invoices 50 --no-templates --llm-latency-ms 400
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import subprocess
+import contextlib
+from datetime import datetime
+from collections import Counter, defaultdict
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+
+from benchmarks.synthetic import generate_dataset
+
+NODES = ["document_agent", "validation_agent", "risk_agent", "payment_agent", "audit_agent", "escalation_agent"]
+PERCENTILES = (50, 95, 99)
+
+
+def summarize(values: List[float]) -> Dict[str, Any]:
+    """Count, mean and p50/p95/p99 (linear interpolation) of ``values`` in ms."""
+    if not values:
+        return {"count": 0}
+    arr = np.asarray(values, dtype=float)
+    summary = {"count": int(arr.size), "mean_ms": round(float(arr.mean()), 2)}
+    for p in PERCENTILES:
+        summary[f"p{p}_ms"] = round(float(np.percentile(arr, p)), 2)
+    summary["max_ms"] = round(float(arr.max()), 2)
+    return summary
+
+
+def node_latencies(states: List[Any]) -> Dict[str, Dict[str, Any]]:
+    samples: Dict[str, List[float]] = defaultdict(list)
+    for state in states:
+        for agent, metrics in (state.agent_metrics or {}).items():
+            if metrics.executions:
+                samples[agent].append(metrics.average_duration_ms)
+    return {node.replace("_agent", ""): summarize(samples.get(node, [])) for node in NODES}
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5)
+        return out.stdout.strip() or None
+    except Exception:
+        return None
+
+
+def _configure_fake_llm(args: argparse.Namespace):
+    # read once by the lru-cached backend factory, so set before any agent exists
+    os.environ["LLM_BACKEND"] = "fake"
+    os.environ["FAKE_LLM_LATENCY_MS"] = str(args.llm_latency_ms)
+    os.environ["FAKE_LLM_LATENCY_DIST"] = args.llm_latency_dist
+    os.environ["FAKE_LLM_ERROR_RATE"] = str(args.llm_error_rate)
+    os.environ["FAKE_LLM_429_RATE"] = str(args.llm_429_rate)
+    os.environ["FAKE_LLM_SEED"] = str(args.seed)
+
+
+def build_config(args: argparse.Namespace, run_dir: str, po_file: str) -> Dict[str, Any]:
+    cache_dir = os.path.join(run_dir, "cache")
+    return {
+        "llm_backend": "fake",
+        "po_file_path": po_file,
+        "extraction_cache_dir": os.path.join(cache_dir, "pdf_text"),
+        "llm_cache_path": os.path.join(cache_dir, "llm_responses.sqlite3"),
+        "layout_template_path": os.path.join(cache_dir, "layout_templates.json"),
+        "template_parsing_enabled": not args.no_templates,
+        "layout_templates_enabled": not args.no_templates,
+        "extraction_executor": args.extraction_executor,
+        "duplicate_index_path": os.path.join(run_dir, "invoice_fingerprints.sqlite3"),
+        # warm runs replay the same invoices, which the index would (rightly) flag
+        "duplicate_check_enabled": not args.warm_runs,
+        "near_duplicate_index_path": os.path.join(run_dir, "near_duplicates.sqlite3"),
+        "near_duplicate_enabled": not args.warm_runs,
+        "po_ledger_path": os.path.join(run_dir, "po_ledger.jsonl"),
+        "po_ledger_enabled": not args.warm_runs,
+        "velocity_enabled": not args.warm_runs,
+        "risk_history_path": os.path.join(run_dir, "risk_history.jsonl"),
+        "vendor_stats_path": os.path.join(run_dir, "vendor_stats.sqlite3"),
+        # no model unless one is given: runs stay comparable
+        "risk_model_path": args.risk_model or "",
+    }
+
+
+async def run_batch(workflow, files: List[str], concurrency: int, quiet: bool):
+    sink = open(os.devnull, "w") if quiet else None
+    try:
+        with contextlib.redirect_stdout(sink) if quiet else contextlib.nullcontext():
+            start = time.perf_counter()
+            states = await workflow.process_batch(files, max_concurrent=concurrency)
+            elapsed = time.perf_counter() - start
+    finally:
+        if sink:
+            sink.close()
+    return states, elapsed
+
+
+async def run_benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    _configure_fake_llm(args)
+
+    from graph import InvoiceProcessingGraph
+    from agents.base_agent import agent_registry
+    from utils.llm_backend import get_llm_backend
+    from utils.logger import setup_logging
+
+    setup_logging(args.log_level)
+
+    stamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+    run_dir = os.path.join(args.out, f"run_{stamp}")
+    gen_start = time.perf_counter()
+    manifest = generate_dataset(
+        os.path.join(run_dir, "data"), args.invoices, args.pos, args.mismatch_rate, args.max_items, args.seed
+    )
+    generation_s = time.perf_counter() - gen_start
+
+    workflow = InvoiceProcessingGraph(config=build_config(args, run_dir, manifest["po_file"]))
+    files = manifest["invoice_files"]
+    for _ in range(args.warm_runs):
+        await run_batch(workflow, files, args.concurrency, not args.verbose)
+
+    states, elapsed = await run_batch(workflow, files, args.concurrency, not args.verbose)
+
+    statuses = Counter(str(getattr(s.overall_status, "value", s.overall_status)) for s in states)
+    visits = Counter(agent for s in states for agent, m in (s.agent_metrics or {}).items() if m.executions)
+    llm_stats = get_llm_backend("fake").stats()
+    llm_stats.pop("keys", None)
+    risk_metrics = agent_registry.get("risk_agent").get_metrics()
+
+    return {
+        "benchmark": "invoice_throughput",
+        "timestamp": datetime.utcnow().isoformat(),
+        "git_revision": _git_revision(),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "parameters": {
+            "invoices": manifest["invoices"],
+            "purchase_orders": manifest["purchase_orders"],
+            "po_rows": manifest["po_rows"],
+            "mismatched_invoices": manifest["mismatched"],
+            "concurrency": args.concurrency,
+            "warm_runs": args.warm_runs,
+            "templates_enabled": not args.no_templates,
+            "extraction_executor": args.extraction_executor,
+            "llm_latency_ms": args.llm_latency_ms,
+            "llm_latency_dist": args.llm_latency_dist,
+            "llm_error_rate": args.llm_error_rate,
+            "llm_429_rate": args.llm_429_rate,
+            "seed": args.seed,
+            "risk_model": args.risk_model,
+        },
+        "dataset_generation_s": round(generation_s, 3),
+        "elapsed_s": round(elapsed, 3),
+        "invoices_per_sec": round(len(states) / elapsed, 3) if elapsed else None,
+        "node_latency": node_latencies(states),
+        "node_visits": {node.replace("_agent", ""): visits.get(node, 0) for node in NODES},
+        "final_status": dict(statuses),
+        "llm": llm_stats,
+        # over all runs, warm ones included
+        "risk_ai_hint": {k: risk_metrics.get(f"ai_hint_{k}") for k in ("calls", "skipped", "model", "skip_rate")},
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="End-to-end invoice workflow throughput benchmark")
+    parser.add_argument("--invoices", type=int, default=50)
+    parser.add_argument("--pos", type=int, default=None, help="PO master size, 10 to 100k+ (default: one per invoice)")
+    parser.add_argument("--mismatch-rate", type=float, default=0.1)
+    parser.add_argument("--max-items", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=5, help="process_batch max_concurrent")
+    parser.add_argument("--warm-runs", type=int, default=0, help="untimed passes over the batch first")
+    parser.add_argument("--no-templates", action="store_true", help="force every invoice through the LLM")
+    parser.add_argument("--extraction-executor", choices=["process", "thread"], default="process")
+    parser.add_argument("--llm-latency-ms", type=float, default=800.0)
+    parser.add_argument("--llm-latency-dist", default="lognormal")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--llm-429-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--risk-model", default=None, help="trained risk model (.npz) to answer risk hints")
+    parser.add_argument("--out", default=os.path.join("output", "benchmarks"))
+    parser.add_argument("--log-level", default="ERROR")
+    parser.add_argument("--verbose", action="store_true", help="keep agent stdout output")
+    args = parser.parse_args(argv)
+
+    result = asyncio.run(run_benchmark(args))
+
+    os.makedirs(args.out, exist_ok=True)
+    path = os.path.join(args.out, f"throughput_{result['timestamp'][:19].replace(':', '').replace('-', '')}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+
+    print(f"{result['parameters']['invoices']} invoices in {result['elapsed_s']}s "
+          f"-> {result['invoices_per_sec']} invoices/sec")
+    for node, summary in result["node_latency"].items():
+        if summary["count"]:
+            print(f"  {node:<11} n={summary['count']:<5} p50={summary['p50_ms']:>8}ms "
+                  f"p95={summary['p95_ms']:>8}ms p99={summary['p99_ms']:>8}ms")
+    hint = result["risk_ai_hint"]
+    print(f"  risk AI hint: {hint['calls']} calls, {hint['skipped']} skipped "
+          f"({hint['model']} by the risk model; skip rate {hint['skip_rate']})")
+    print(f"Results written to {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,7 +3,7 @@
 """LangGraph workflow orchestrator"""
  
 import asyncio
-from typing import Dict, Any, List, Optional, Literal
+from typing import Dict, Any, List, Optional, Literal, Union, BinaryIO, AsyncIterable
 # from datetime import datetime
 from langgraph.graph import StateGraph
 # from firestore_checkpointer import FirestoreCheckpointer
@@ -43,18 +43,21 @@ class InvoiceProcessingGraph:
         self.workflow_graph = self._create_workflow_graph()
         self.compiled_graph = self.workflow_graph
         self.db = db
+        # In-memory PDFs by process_id, handed to the document node only so the
+        # payload never enters the checkpointed workflow state
+        self._pending_documents: Dict[str, bytes] = {}
  
  
     # ----------------------------------------------------------------------
     # Initialize and register agents
     # ----------------------------------------------------------------------
     def _initialize_agents(self):
-        agent_registry.register(DocumentAgent())
-        agent_registry.register(ValidationAgent())
-        agent_registry.register(RiskAgent())
-        agent_registry.register(PaymentAgent())
-        agent_registry.register(AuditAgent())
-        agent_registry.register(EscalationAgent())
+        agent_registry.register(DocumentAgent(self.config))
+        agent_registry.register(ValidationAgent(self.config))
+        agent_registry.register(RiskAgent(self.config))
+        agent_registry.register(PaymentAgent(self.config))
+        agent_registry.register(AuditAgent(self.config))
+        agent_registry.register(EscalationAgent(self.config))
  
     async def resume(self, process_id: str, value: dict):
         self.logger.info(f"[RESUME] Resume requested for {process_id}")
@@ -110,19 +113,25 @@ class InvoiceProcessingGraph:
         # ------------------------------------------
         self.logger.info(f"[RESUME] Calling workflow_graph.ainvoke() for {process_id}")
 
-        result = await self.compiled_graph.ainvoke(
-            saved_state,
-            config={"configurable": {
-                "thread_id": process_id,
-                "checkpoint_ns": "invoice_workflow",
-                "db": self.db
-            }}
-        )
+        try:
+            result = await self.compiled_graph.ainvoke(
+                saved_state,
+                config={"configurable": {
+                    "thread_id": process_id,
+                    "checkpoint_ns": "invoice_workflow",
+                    "db": self.db
+                }}
+            )
+        except BaseException:
+            await self._release_po_reservation(process_id, "resumed run raised")
+            raise
 
         self.logger.info(f"[RESUME] Workflow returned result: {result}")
 
         final_state = self._extract_final_state(result, None)
         self.logger.info(f"[RESUME] Final state extracted: {final_state}")
+        if self._failed(final_state):
+            await self._release_po_reservation(process_id, "resumed run failed")
 
         return final_state
 
@@ -259,6 +268,7 @@ class InvoiceProcessingGraph:
     #     return state
 
     async def _document_agent_node(self, state: InvoiceProcessingState):
+        state.document_bytes = self._pending_documents.pop(state.process_id, None)
         new_state = await agent_registry.get("document_agent").run(state)
         return new_state
 
@@ -302,6 +312,12 @@ class InvoiceProcessingGraph:
             self.logger.log_escalation("document_agent", state.process_id, "Document extraction failed.")
             state.escalation_required = True
             return "escalation"
+        if state.duplicate_of:
+            self.logger.log_escalation(
+                "document_agent", state.process_id,
+                f"Duplicate invoice (original {state.duplicate_of.get('original_process_id')})."
+            )
+            return "escalation"
         return "validation"
  
     # def _route_after_validation(self, state: InvoiceProcessingState) -> Literal["risk", "escalation", "end"]:
@@ -473,13 +489,61 @@ class InvoiceProcessingGraph:
     ) -> InvoiceProcessingState:
         """Run full workflow for a single invoice."""
         # process_id = f"proc_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}"
+        process_id = self._new_process_id()
+        try:
+            import streamlit as st
+            st.session_state["current_process_id"] = process_id
+        except ImportError:
+            pass  # headless use (API, benchmarks)
+        print("DEBUG saved current_process_id =", process_id)
+        state = self._new_state(process_id, file_name, workflow_type)
+        return await self._run_workflow(state, workflow_type)
+
+    async def process_invoice_bytes(
+        self,
+        data: Union[bytes, bytearray, memoryview],
+        file_name: str = "upload.pdf",
+        workflow_type: str = "standard",
+        config: Dict[str, Any] = None,
+    ) -> InvoiceProcessingState:
+        """
+        Run the full workflow on a PDF held in memory (e.g. an HTTP request body).
+        Nothing is written to disk; ``file_name`` is only used for logs and audit.
+        """
+        if not data:
+            raise ValueError("Empty PDF payload")
+        state = self._new_state(self._new_process_id(), file_name, workflow_type)
+        # bytes, not a memoryview: the extraction worker pool has to pickle it
+        self._pending_documents[state.process_id] = data if isinstance(data, bytes) else bytes(data)
+        try:
+            return await self._run_workflow(state, workflow_type)
+        finally:
+            self._pending_documents.pop(state.process_id, None)
+
+    async def process_invoice_stream(
+        self,
+        stream: Union[BinaryIO, AsyncIterable[bytes]],
+        file_name: str = "upload.pdf",
+        workflow_type: str = "standard",
+        config: Dict[str, Any] = None,
+    ) -> InvoiceProcessingState:
+        """Read a file-like object or async chunk iterator into memory and process it."""
+        if hasattr(stream, "__aiter__"):
+            buffer = bytearray()
+            async for chunk in stream:
+                buffer.extend(chunk)
+            data = bytes(buffer)
+        else:
+            data = stream.read()
+        return await self.process_invoice_bytes(data, file_name, workflow_type, config)
+
+    def _new_process_id(self) -> str:
         import uuid
         unique_id = uuid.uuid4().hex[:8]  # unique 8-char identifier
-        process_id = f"proc_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}_{unique_id}"
-        import streamlit as st
-        st.session_state["current_process_id"] = process_id
-        print("DEBUG saved current_process_id =", process_id)
-        state = InvoiceProcessingState(
+        return f"proc_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}_{unique_id}"
+
+    def _new_state(self, process_id: str, file_name: str, workflow_type: str) -> InvoiceProcessingState:
+        return InvoiceProcessingState(
             process_id=process_id,
             file_name=file_name,
             overall_status=ProcessingStatus.IN_PROGRESS,
@@ -487,30 +551,62 @@ class InvoiceProcessingGraph:
             created_at=datetime.utcnow(),
             updated_at=datetime.utcnow()
         )
-           # ✅ THEN assign Firestore client to state
-     
- 
+
+    async def _run_workflow(self, state: InvoiceProcessingState, workflow_type: str) -> InvoiceProcessingState:
+        process_id, file_name = state.process_id, state.file_name
         self.logger.log_workflow_start(workflow_type, process_id, file=file_name)
  
  
-        result = await self.workflow_graph.ainvoke(
-            state,
-            config={
-                "configurable": {
-                    "thread_id": process_id,
-                    "checkpoint_ns": "invoice_workflow",
-                    "db": self.db 
+        try:
+            result = await self.workflow_graph.ainvoke(
+                state,
+                config={
+                    "configurable": {
+                        "thread_id": process_id,
+                        "checkpoint_ns": "invoice_workflow",
+                        "db": self.db 
+                    }
                 }
-            }
-        )
+            )
+        except BaseException:
+            # errors and cancellation: the invoice will not be paid
+            await self._release_po_reservation(process_id, "workflow raised")
+            raise
  
  
         final_state = self._extract_final_state(result, state)
+        if self._failed(final_state):
+            await self._release_po_reservation(process_id, "workflow failed")
         self.logger.log_workflow_complete(workflow_type, process_id, duration_ms=0)
         print(f"✅ Created process_id: {process_id} for {file_name}")
  
         return final_state
  
+    async def cancel(self, process_id: str) -> Dict[str, Any]:
+        """
+        Cancel an unfinished or abandoned run (e.g. one paused for review that
+        will never be decided): release its PO balance reservation in this
+        process's ledger, so other invoices see the balance immediately.
+        """
+        released = await self._release_po_reservation(process_id, "cancelled")
+        return {"process_id": process_id, "po_released": released}
+
+    async def _release_po_reservation(self, process_id: str, reason: str) -> Optional[Dict[str, Any]]:
+        ledger = getattr(agent_registry.get("validation_agent"), "po_ledger", None)
+        if ledger is None:
+            return None
+        released = await ledger.release(process_id)
+        if released:
+            self.logger.info(
+                f"Released {released['amount']} reserved on order {released['order']} for {process_id} ({reason})"
+            )
+        return released
+
+    @staticmethod
+    def _failed(state: Optional[InvoiceProcessingState]) -> bool:
+        status = getattr(state, "overall_status", None)
+        return str(getattr(status, "value", status)) == ProcessingStatus.FAILED.value
+
     async def process_batch(
         self, file_names: List[str], workflow_type: str = "standard", max_concurrent: int = 5
     ) -> List[InvoiceProcessingState]:
@@ -95,6 +95,8 @@ from datetime import datetime, timezone
 
 from state import InvoiceProcessingState, ProcessingStatus, PaymentStatus
 from utils.logger import StructuredLogger
+from utils.po_ledger import release_reservation
+from agents.base_agent import agent_registry
 
 UTC = timezone.utc
 
@@ -230,6 +232,26 @@ async def human_review_node(state: InvoiceProcessingState, config=None) -> Invoi
 
     logger.info(f"[HRN] Final decision stored: {json.dumps(state.payment_decision, indent=2)}")
 
+    # reviewer decisions label the risk model's training data
+    risk_agent = agent_registry.get("risk_agent")
+    if risk_agent is not None and getattr(risk_agent, "risk_history", None):
+        risk_agent.risk_history.record_outcome(process_id, decision)
+    # approved invoices join the vendor's amount baseline
+    if risk_agent is not None and payment_status == PaymentStatus.APPROVED:
+        risk_agent.record_approved_amount(state)
+
+    # rejected invoices free the PO balance they reserved during validation
+    if payment_status == PaymentStatus.REJECTED:
+        released = await release_reservation(state.po_reservation, process_id)
+        if released:
+            logger.info(f"[HRN] Released {released['amount']} reserved on order {released['order']}")
+        # a corrected resubmission of a rejected invoice is not a duplicate
+        document_agent = agent_registry.get("document_agent")
+        if document_agent is not None and getattr(document_agent, "duplicate_index", None):
+            dropped = document_agent.duplicate_index.release(process_id)
+            if dropped:
+                logger.info(f"[HRN] Released {dropped} duplicate fingerprints of {process_id}")
+
     state.overall_status = ProcessingStatus.COMPLETED
     state.human_review_required = False
     state.updated_at = datetime.utcnow()
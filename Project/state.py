@@ -204,6 +204,8 @@ class ValidationResult(BaseModel):
     confidence_score: Optional[float] = None
     expected_amount: Optional[float] = None
     po_data: Optional[Dict[str, Any]] = None
+    line_matches: Optional[List[Dict[str, Any]]] = []
+    three_way_match: Optional[bool] = None
  
  
 class RiskAssessment(BaseModel):
@@ -268,6 +270,9 @@ class InvoiceProcessingState(BaseModel):
     process_id: Optional[str] = Field(default_factory=lambda: f"proc_{uuid4().hex[:8]}")
     file_name: str
     resume: Optional[dict] = None
+    # Raw PDF for in-memory ingestion; file_name is then only a display name.
+    # Transient: attached by the document node and cleared once extracted.
+    document_bytes: Optional[bytes] = Field(default=None, exclude=True, repr=False)
    
 
  
@@ -295,6 +300,10 @@ class InvoiceProcessingState(BaseModel):
     human_review_required: bool = False
     escalation_record: Optional[Dict[str, Any]] = None
     notification_info: Optional[Dict[str, Any]] = None
+    # earlier claim of this invoice's fingerprints (set by the duplicate check)
+    duplicate_of: Optional[Dict[str, Any]] = None
+    # amount booked against the PO balance ledger (set by validation, released on rejection)
+    po_reservation: Optional[Dict[str, Any]] = None
 
  
     # Workflow control
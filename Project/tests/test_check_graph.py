@@ -0,0 +1,86 @@
+import time
+import asyncio
+
+import pytest
+
+from utils.check_graph import Check, CheckGraph
+
+
+def _run(graph):
+    return asyncio.run(graph.run())
+
+
+def test_dependencies_receive_results():
+    async def a():
+        return 2
+
+    async def b():
+        return 3
+
+    async def total(a, b):
+        return a + b
+
+    results, timings = _run(CheckGraph([Check("total", total, deps=["a", "b"]), Check("a", a), Check("b", b)]))
+    assert results == {"a": 2, "b": 3, "total": 5}
+    assert list(timings) == ["a", "b", "total"]
+    assert all(t["status"] == "ok" for t in timings.values())
+
+
+def test_independent_checks_overlap():
+    async def slow():
+        await asyncio.sleep(0.2)
+        return True
+
+    start = time.perf_counter()
+    _run(CheckGraph([Check(f"c{i}", slow) for i in range(5)]))
+    assert time.perf_counter() - start < 0.6
+
+
+def test_timeout_and_error_use_fallbacks():
+    async def hangs():
+        await asyncio.sleep(5)
+
+    async def fails():
+        raise ValueError("boom")
+
+    async def uses(hangs, fails):
+        return (hangs, fails)
+
+    results, timings = _run(CheckGraph([
+        Check("hangs", hangs, timeout_s=0.05, fallback=list),
+        Check("fails", fails, fallback="fallback"),
+        Check("uses", uses, deps=["hangs", "fails"]),
+    ]))
+    assert results["uses"] == ([], "fallback")
+    assert timings["hangs"]["status"] == "timeout"
+    assert timings["fails"]["status"] == "error" and timings["fails"]["error"] == "boom"
+
+
+def test_blocking_checks_run_in_threads_and_time_out():
+    def blocks(seconds):
+        time.sleep(seconds)
+        return seconds
+
+    start = time.perf_counter()
+    results, timings = _run(CheckGraph([
+        Check("a", lambda: blocks(0.2), blocking=True),
+        Check("b", lambda: blocks(0.2), blocking=True),
+        Check("stuck", lambda: blocks(1.0), timeout_s=0.05, fallback="late", blocking=True),
+    ]))
+    assert results == {"a": 0.2, "b": 0.2, "stuck": "late"}
+    assert timings["stuck"]["status"] == "timeout"
+    # the timed-out thread is awaited by asyncio.run's executor shutdown, the checks themselves overlap
+    assert timings["a"]["ms"] < 400 and timings["b"]["ms"] < 400
+    assert time.perf_counter() - start < 2.0
+
+
+def test_invalid_graphs_are_rejected():
+    async def f(**_):
+        return None
+
+    with pytest.raises(ValueError):
+        CheckGraph([Check("a", f, deps=["missing"])])
+    with pytest.raises(ValueError):
+        CheckGraph([Check("a", f, deps=["b"]), Check("b", f, deps=["a"])])
+    with pytest.raises(ValueError):
+        CheckGraph([Check("a", f), Check("a", f)])
@@ -0,0 +1,52 @@
+from utils.duplicate_index import BloomFilter, DuplicateInvoiceIndex, invoice_fingerprints
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    keys = [f"inv:{i}" for i in range(1000)]
+    for key in keys:
+        bloom.add(key)
+    assert all(key in bloom for key in keys)
+    false_positives = sum(f"other:{i}" in bloom for i in range(10000))
+    assert false_positives < 300
+
+
+def test_second_process_is_a_duplicate(tmp_path):
+    index = DuplicateInvoiceIndex(str(tmp_path / "fp.sqlite3"))
+    keys = invoice_fingerprints("Acme Corp", "INV-1", 100.0, doc_hash="abc")
+    assert index.check_and_register(keys, "p1", "a.pdf") is None
+    duplicate = index.check_and_register(keys, "p2", "b.pdf")
+    assert duplicate["original_process_id"] == "p1"
+    assert duplicate["original_file"] == "a.pdf"
+
+
+def test_same_process_rerun_is_not_a_duplicate(tmp_path):
+    index = DuplicateInvoiceIndex(str(tmp_path / "fp.sqlite3"))
+    keys = invoice_fingerprints("Acme Corp", "INV-1", 100.0)
+    assert index.check_and_register(keys, "p1") is None
+    assert index.check_and_register(keys, "p1") is None
+
+
+def test_instances_sharing_a_file_see_each_others_claims(tmp_path):
+    path = str(tmp_path / "fp.sqlite3")
+    first, second = DuplicateInvoiceIndex(path), DuplicateInvoiceIndex(path)
+    assert first.check_and_register(["doc:x"], "p1") is None
+    duplicate = second.check_and_register(["doc:x"], "p2")
+    assert duplicate is not None and duplicate["original_process_id"] == "p1"
+    assert second.stats()["shared_conflicts"] == 1
+
+
+def test_duplicate_claims_nothing(tmp_path):
+    index = DuplicateInvoiceIndex(str(tmp_path / "fp.sqlite3"))
+    assert index.check_and_register(["doc:a"], "p1") is None
+    assert index.check_and_register(["doc:b", "doc:a"], "p2") is not None
+    # doc:b was rolled back with the duplicate claim
+    assert index.check_and_register(["doc:b"], "p3") is None
+
+
+def test_release_allows_resubmission(tmp_path):
+    index = DuplicateInvoiceIndex(str(tmp_path / "fp.sqlite3"))
+    assert index.check_and_register(["doc:a"], "p1") is None
+    assert index.release("p1") == 1
+    assert index.check_and_register(["doc:a"], "p2") is None
+    assert index.stats()["bloom_false_positives"] == 1
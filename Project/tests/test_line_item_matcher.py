@@ -0,0 +1,52 @@
+import itertools
+
+import numpy as np
+import pytest
+
+import utils.line_item_matcher as lim
+from utils.line_item_matcher import LineItemMatcher, _solve
+
+
+def _brute_force(cost):
+    n, m = cost.shape
+    return min(sum(cost[i, cols[i]] for i in range(n)) for cols in itertools.permutations(range(m), n))
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_solve_matches_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    n = int(rng.integers(1, 6))
+    m = int(rng.integers(n, 7))
+    # integer costs make ties (several optima) common
+    cost = rng.integers(0, 5, size=(n, m)).astype(float) if seed % 2 else rng.random((n, m))
+
+    cols = _solve(cost)
+    assert len(set(cols.tolist())) == n and cols.min() >= 0 and cols.max() < m
+    assert cost[np.arange(n), cols].sum() == pytest.approx(_brute_force(cost))
+
+
+@pytest.mark.parametrize("shape", [(4, 2), (3, 3), (2, 5)])
+def test_fallback_assignment_handles_both_orientations(shape, monkeypatch):
+    monkeypatch.setattr(lim, "_scipy_lsa", None)
+    cost = np.random.default_rng(sum(shape)).random(shape)
+    rows, cols = lim.linear_sum_assignment(cost)
+    assert len(rows) == min(shape) and len(set(cols.tolist())) == min(shape)
+    best = _brute_force(cost) if shape[0] <= shape[1] else _brute_force(cost.T)
+    assert cost[rows, cols].sum() == pytest.approx(best)
+
+
+def test_match_pairs_by_sku_then_by_name():
+    items = [
+        {"item_name": "Steel bolts M8", "quantity": 10, "rate": 2.0},
+        {"item_name": "Office chair", "quantity": 2, "rate": 150.0},
+        {"item_name": "Printer paper", "quantity": 5, "rate": 4.0},
+    ]
+    po_lines = [
+        {"item_name": "Printer paper A4", "quantity": 5, "rate": 4.0},
+        {"item_name": "Bolts, steel, M8", "quantity": 10, "rate": 2.0},
+        {"item_name": "Conference table", "quantity": 1, "rate": 900.0},
+    ]
+    result = LineItemMatcher().match(items, po_lines, ["SKU-1", "", ""], ["", "SKU-1", ""])
+    assert result.pairs == [(0, 1), (2, 0)]
+    assert result.exact == [True, False]
+    assert result.unmatched_items == [1] and result.unmatched_po_lines == [2]
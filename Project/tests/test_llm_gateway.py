@@ -0,0 +1,49 @@
+import asyncio
+
+from utils.fake_llm import FakeLLM, make_fake_gateway
+
+
+def _in_flight(gateway):
+    return [k["in_flight"] for k in gateway.stats()["keys"]]
+
+
+def test_cancelled_calls_release_their_key():
+    gateway = make_fake_gateway(FakeLLM(latency_ms=300, distribution="fixed"), keys=2)
+
+    async def run():
+        calls = [asyncio.create_task(gateway.generate("Return JSON only.", "m")) for _ in range(4)]
+        await asyncio.sleep(0.05)
+        for call in calls:
+            call.cancel()
+        await asyncio.gather(*calls, return_exceptions=True)
+
+    asyncio.run(run())
+    assert _in_flight(gateway) == [0, 0]
+    assert sum(k["cancelled"] for k in gateway.stats()["keys"]) == 4
+    gateway.shutdown()
+
+
+def test_caller_timeout_releases_key():
+    gateway = make_fake_gateway(FakeLLM(latency_ms=300, distribution="fixed"), keys=1)
+
+    async def run():
+        try:
+            await asyncio.wait_for(gateway.generate("Return JSON only.", "m"), 0.05)
+        except asyncio.TimeoutError:
+            pass
+
+    asyncio.run(run())
+    assert _in_flight(gateway) == [0]
+    gateway.shutdown()
+
+
+def test_successful_calls_release_their_key():
+    gateway = make_fake_gateway(FakeLLM(latency_ms=1, distribution="fixed"), keys=2)
+
+    async def run():
+        return await asyncio.gather(*(gateway.generate("Return JSON only.", "m") for _ in range(6)))
+
+    assert len(asyncio.run(run())) == 6
+    assert _in_flight(gateway) == [0, 0]
+    assert gateway.stats()["successes"] == 6
+    gateway.shutdown()
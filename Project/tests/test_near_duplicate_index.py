@@ -0,0 +1,57 @@
+import random
+
+from utils.near_duplicate_index import MinHasher, NearDuplicateIndex, shingles
+
+WORDS = [f"word{i}" for i in range(500)]
+
+
+def _invoice(seed, length=200):
+    rng = random.Random(seed)
+    return " ".join(rng.choice(WORDS) for _ in range(length))
+
+
+def _edit(text, changes, seed=0):
+    rng = random.Random(seed)
+    words = text.split()
+    for pos in rng.sample(range(len(words)), changes):
+        words[pos] = "edited"
+    return " ".join(words)
+
+
+def _jaccard(a, b):
+    sa, sb = set(shingles(a)), set(shingles(b))
+    return len(sa & sb) / len(sa | sb)
+
+
+def test_signature_agreement_estimates_jaccard():
+    hasher = MinHasher(num_perm=256)
+    base = _invoice(1)
+    for changes in (2, 10, 40):
+        other = _edit(base, changes)
+        estimate = (hasher.signature(base) == hasher.signature(other)).mean()
+        assert abs(estimate - _jaccard(base, other)) < 0.1
+
+
+def test_edited_copy_is_found_and_unrelated_invoices_are_not(tmp_path):
+    index = NearDuplicateIndex(str(tmp_path / "near.sqlite3"), merge_every=4)
+    for i in range(20):
+        assert index.check_and_add(_invoice(i), f"p{i}") == []
+
+    matches = index.check_and_add(_edit(_invoice(7), 3), "copy")
+    assert [m["process_id"] for m in matches] == ["p7"]
+    assert matches[0]["similarity"] >= index.threshold
+    assert index.query(_invoice(99)) == []
+    # a re-run of p7 does not report itself, only the edited copy
+    assert [m["process_id"] for m in index.query(_invoice(7), exclude_process_id="p7")] == ["copy"]
+
+
+def test_rows_persist_and_are_seen_across_instances(tmp_path):
+    path = str(tmp_path / "near.sqlite3")
+    first = NearDuplicateIndex(path)
+    second = NearDuplicateIndex(path)
+    assert first.add("p1", _invoice(1))
+    assert not first.add("p1", _invoice(1))  # already stored
+
+    # written by another instance after this one started
+    assert [m["process_id"] for m in second.query(_edit(_invoice(1), 2))] == ["p1"]
+    assert [m["process_id"] for m in NearDuplicateIndex(path).query(_invoice(1))] == ["p1"]
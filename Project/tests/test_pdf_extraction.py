@@ -0,0 +1,63 @@
+import os
+import time
+import asyncio
+
+import pytest
+
+from utils.pdf_extraction import PdfExtractionService
+
+
+def _sleep_and_report(seconds):
+    time.sleep(seconds)
+    return os.getpid()
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    # a terminated child stays a zombie until reaped; check its state
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().split()[2] != "Z"
+    except OSError:
+        return False
+
+
+def test_timeout_leaves_other_documents_on_the_pool_running():
+    service = PdfExtractionService(max_workers=2, max_concurrent=3, timeout_s=1.0, executor="process")
+
+    async def run():
+        hung = asyncio.ensure_future(service._run(_sleep_and_report, 30))
+        await asyncio.sleep(0.9)
+        # submitted to the same pool just before the first call times out
+        others = [asyncio.ensure_future(service._run(_sleep_and_report, 0.3)) for _ in range(2)]
+        return await asyncio.gather(hung, *others, return_exceptions=True)
+
+    try:
+        results = asyncio.run(run())
+        assert isinstance(results[0], TimeoutError)
+        assert all(isinstance(r, int) for r in results[1:])
+        assert service.stats()["timeouts"] == 1
+        # the old pool ended once only the hung call was left on it
+        assert service._retired == {}
+        # later documents run on a fresh pool
+        assert isinstance(asyncio.run(service._run(_sleep_and_report, 0)), int)
+    finally:
+        service.shutdown(wait=False)
+
+
+def test_hung_worker_process_is_terminated():
+    service = PdfExtractionService(max_workers=1, timeout_s=0.3, executor="process")
+    try:
+        # learn the single worker's pid first
+        pid = asyncio.run(service._run(_sleep_and_report, 0))
+        with pytest.raises(TimeoutError):
+            asyncio.run(service._run(_sleep_and_report, 30))
+        deadline = time.time() + 5
+        while time.time() < deadline and _alive(pid):
+            time.sleep(0.05)
+        assert not _alive(pid)
+    finally:
+        service.shutdown(wait=False)
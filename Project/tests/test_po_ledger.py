@@ -0,0 +1,93 @@
+import asyncio
+
+from utils.po_ledger import POBalanceLedger
+
+
+def _reserve(ledger, order, process_id, amount, total=100.0):
+    return asyncio.run(ledger.reserve(order, process_id, amount, total, tolerance=0.05))
+
+
+def test_invoices_add_up_against_the_order(tmp_path):
+    ledger = POBalanceLedger(str(tmp_path / "ledger.jsonl"))
+    first = _reserve(ledger, "PO-1", "p1", 60.0)
+    assert not first["over_billed"] and first["remaining"] == 40.0
+    second = _reserve(ledger, "po-1", "p2", 60.0)
+    assert second["billed_before"] == 60.0 and second["billed"] == 120.0
+    assert second["over_billed"]
+
+
+def test_single_invoice_over_its_po_is_not_over_billing(tmp_path):
+    ledger = POBalanceLedger(str(tmp_path / "ledger.jsonl"))
+    assert not _reserve(ledger, "PO-1", "p1", 150.0)["over_billed"]
+
+
+def test_rereserving_a_process_replaces_its_amount(tmp_path):
+    ledger = POBalanceLedger(str(tmp_path / "ledger.jsonl"))
+    _reserve(ledger, "PO-1", "p1", 60.0)
+    again = _reserve(ledger, "PO-1", "p1", 70.0)
+    assert again["billed"] == 70.0 and again["billed_before"] == 0.0
+
+
+def test_release_frees_the_balance(tmp_path):
+    ledger = POBalanceLedger(str(tmp_path / "ledger.jsonl"))
+    _reserve(ledger, "PO-1", "p1", 60.0)
+    released = asyncio.run(ledger.release("p1"))
+    assert released["amount"] == 60.0
+    assert ledger.balance("PO-1")["billed"] == 0.0
+    assert asyncio.run(ledger.release("p1")) is None
+    assert not _reserve(ledger, "PO-1", "p2", 60.0)["over_billed"]
+
+
+def test_replay_restores_balances(tmp_path):
+    path = str(tmp_path / "ledger.jsonl")
+    ledger = POBalanceLedger(path)
+    _reserve(ledger, "PO-1", "p1", 60.0)
+    _reserve(ledger, "PO-1", "p2", 30.0)
+    asyncio.run(ledger.release("p1"))
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"op": "reserve", "ord')  # torn last line of a crashed writer
+
+    replayed = POBalanceLedger(path)
+    assert replayed.balance("PO-1") == {"po_total": 100.0, "billed": 30.0, "reservations": {"p2": 30.0}}
+
+
+def test_compact_keeps_live_reservations(tmp_path):
+    path = str(tmp_path / "ledger.jsonl")
+    ledger = POBalanceLedger(path)
+    for i in range(5):
+        _reserve(ledger, "PO-1", f"p{i}", 10.0)
+    for i in range(3):
+        asyncio.run(ledger.release(f"p{i}"))
+    assert ledger.compact() == 2
+    assert POBalanceLedger(path).balance("PO-1")["billed"] == 20.0
+
+
+def test_concurrent_reservations_see_each_other(tmp_path):
+    ledger = POBalanceLedger(str(tmp_path / "ledger.jsonl"))
+
+    async def run():
+        return await asyncio.gather(*(ledger.reserve("PO-1", f"p{i}", 30.0, 100.0) for i in range(5)))
+
+    results = asyncio.run(run())
+    assert sorted(r["billed"] for r in results) == [30.0, 60.0, 90.0, 120.0, 150.0]
+    assert sum(r["over_billed"] for r in results) == 2
+
+
+def test_workflow_failures_and_cancellation_release_the_reservation(tmp_path, monkeypatch):
+    import graph
+    from state import ProcessingStatus
+    from types import SimpleNamespace
+
+    ledger = POBalanceLedger(str(tmp_path / "ledger.jsonl"))
+    monkeypatch.setattr(graph.agent_registry, "get", lambda name: SimpleNamespace(po_ledger=ledger))
+    workflow = graph.InvoiceProcessingGraph.__new__(graph.InvoiceProcessingGraph)
+    workflow.logger = graph.StructuredLogger("test")
+
+    assert workflow._failed(SimpleNamespace(overall_status=ProcessingStatus.FAILED))
+    assert not workflow._failed(SimpleNamespace(overall_status=ProcessingStatus.COMPLETED))
+
+    _reserve(ledger, "PO-1", "p1", 60.0)
+    result = asyncio.run(workflow.cancel("p1"))
+    assert result["po_released"]["amount"] == 60.0
+    assert ledger.balance("PO-1")["billed"] == 0.0
+    assert asyncio.run(workflow.cancel("p1"))["po_released"] is None
@@ -0,0 +1,38 @@
+import csv
+
+import pytest
+
+from utils.po_store import PO_COLUMNS, SQLitePOStore
+
+
+def _write_master(path, amount, orders=("PO-1", "PO-2")):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(PO_COLUMNS)
+        for i, order in enumerate(orders):
+            writer.writerow([f"INV-{i}", order, "Acme Corp", "Widget", 1, amount, amount])
+
+
+def test_view_reads_one_version_across_an_import(tmp_path):
+    master = tmp_path / "po.csv"
+    store = SQLitePOStore(str(tmp_path / "po.sqlite"))
+    _write_master(master, 100)
+    store.import_csv(str(master))
+
+    snap = store.snapshot()
+    assert snap.version == 1
+    _write_master(master, 200, orders=("PO-1", "PO-3"))
+    store.import_csv(str(master))
+
+    # the pinned view still sees version 1 everywhere, the store the new master
+    assert [r["expected_amount"] for r in store.by_order_id("PO-1", snap)] == [100]
+    assert set(store.by_order_ids(["PO-2", "PO-3"], snap)) == {"PO-2"}
+    assert store.by_order_id("PO-3", snap) == []
+    assert len(store.by_amount_range(50, 150, snap)) == 2
+    assert snap.blocking_index("order_id").candidates("PO-2")
+    assert [r["expected_amount"] for r in store.by_order_id("PO-1")] == [200]
+    assert store.snapshot().version == 2
+
+    snap.close()
+    with pytest.raises(RuntimeError):
+        store.by_order_id("PO-1", snap)
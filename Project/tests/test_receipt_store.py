@@ -0,0 +1,60 @@
+import asyncio
+
+from utils.receipt_store import ReceiptBatchLoader
+
+
+class _Store:
+    def __init__(self):
+        self.calls = []
+
+    def received_quantities(self, keys):
+        self.calls.append(sorted(keys))
+        return {k: {"SKU": 1.0} for k in keys}
+
+
+def test_loads_within_the_window_share_one_call():
+    store = _Store()
+    loader = ReceiptBatchLoader(store, window_ms=20)
+
+    async def run():
+        return await asyncio.gather(*(loader.load(f"PO-{i}") for i in range(3)))
+
+    assert asyncio.run(run()) == [{"SKU": 1.0}] * 3
+    assert store.calls == [["PO-0", "PO-1", "PO-2"]]
+
+
+def test_full_batch_does_not_shorten_the_next_window():
+    store = _Store()
+    loader = ReceiptBatchLoader(store, window_ms=100, max_batch=2)
+
+    async def run():
+        # the first batch fills up (flushed early); the next one starts 60ms later
+        await asyncio.gather(loader.load("PO-1"), loader.load("PO-2"))
+        await asyncio.sleep(0.06)
+        first = asyncio.ensure_future(loader.load("PO-3"))
+        # past the first batch's window, inside the second's
+        await asyncio.sleep(0.06)
+        flushed_early = first.done()
+        second = asyncio.ensure_future(loader.load("PO-4"))
+        await asyncio.gather(first, second)
+        return flushed_early
+
+    assert asyncio.run(run()) is False
+    assert store.calls == [["PO-1", "PO-2"], ["PO-3", "PO-4"]]
+
+
+def test_cancelling_one_caller_leaves_the_others_their_result():
+    store = _Store()
+    loader = ReceiptBatchLoader(store, window_ms=20)
+
+    async def run():
+        first = asyncio.ensure_future(loader.load("O1"))
+        second = asyncio.ensure_future(loader.load("O1"))
+        await asyncio.sleep(0)
+        first.cancel()
+        return first, await second
+
+    first, received = asyncio.run(run())
+    assert first.cancelled()
+    assert received == {"SKU": 1.0}
+    assert store.calls == [["O1"]]
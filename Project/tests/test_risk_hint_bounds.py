@@ -0,0 +1,28 @@
+from agents.risk_agent import RiskAgent
+
+
+def _agent(**config):
+    return RiskAgent({
+        "llm_backend": "fake",
+        "near_duplicate_enabled": False,
+        "risk_history_enabled": False,
+        "risk_model_enabled": False,
+        "vendor_stats_enabled": False,
+        "velocity_enabled": False,
+        **config,
+    })
+
+
+def test_unbounded_hints_reach_every_level_by_default():
+    agent = _agent()
+    assert agent.ai_hint_max_shift is None
+    low, high = agent._hint_score_bounds(0.0, [], [])
+    assert agent._determine_risk_level(low) != agent._determine_risk_level(high)
+    # a critical hint still forces CRITICAL on a low score
+    assert agent._combine_risk_factors(0.3, [], [], {"risk_hint": "critical"}) >= agent.critical_th
+
+
+def test_capped_hints_let_a_clear_score_skip_the_call():
+    agent = _agent(ai_hint_max_shift=0.1)
+    low, high = agent._hint_score_bounds(0.0, [], [])
+    assert agent._determine_risk_level(low) == agent._determine_risk_level(high)
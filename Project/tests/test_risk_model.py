@@ -0,0 +1,33 @@
+import numpy as np
+
+from utils.risk_model import LEVELS, RiskHistory, training_examples
+
+
+def _features(amount):
+    return {"log_amount": float(np.log1p(amount)), "discrepancies": 0.0}
+
+
+def test_training_examples_skip_model_hinted_assessments(tmp_path):
+    path = str(tmp_path / "history.jsonl")
+    history = RiskHistory(path)
+    history.record_assessment("p1", "Acme", _features(100), "low", "llm")
+    history.record_assessment("p2", "Acme", _features(200), "high", "model")
+    # a later model re-assessment does not replace the LLM-labelled one
+    history.record_assessment("p3", "Acme", _features(300), "medium", "llm")
+    history.record_assessment("p3", "Acme", _features(300), "low", "model")
+
+    X, y = training_examples(path)
+    assert X.shape[0] == 2
+    assert sorted(LEVELS[i] for i in y) == ["low", "medium"]
+
+
+def test_reviewer_outcomes_adjust_labels(tmp_path):
+    path = str(tmp_path / "history.jsonl")
+    history = RiskHistory(path)
+    history.record_assessment("p1", "Acme", _features(100), "low", "llm")
+    history.record_assessment("p2", "Acme", _features(200), "critical", "llm")
+    history.record_outcome("p1", "rejected")
+    history.record_outcome("p2", "approved")
+
+    _, y = training_examples(path)
+    assert [LEVELS[i] for i in y] == ["high", "medium"]
@@ -0,0 +1,63 @@
+import asyncio
+import os
+
+from agents.validation_agent import ValidationAgent
+from state import InvoiceData, ItemDetail, ValidationStatus
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+
+# one order billed on two invoices (sample master rows)
+ORDER = [
+    {"invoice_number": "36552", "order_id": "CA-2025-AH10195140-41338", "customer_name": "Alan Haines",
+     "item_name": "36X48 HARDFLOOR CHAIRMAT Furnishings, Furniture, FUR-FU-2864",
+     "quantity": 2, "rate": 33.57, "expected_amount": 67.14},
+    {"invoice_number": "36551", "order_id": "CA-2025-AH10195140-41338", "customer_name": "Alan Haines",
+     "item_name": "Situations Contoured Folding Chairs, 4/Set Chairs, Furniture, FUR-CH-6016",
+     "quantity": 2, "rate": 99.37, "expected_amount": 198.74},
+]
+
+
+def _agent():
+    return ValidationAgent({
+        "po_file_path": os.path.join(DATA, "purchase_orders.csv"),
+        "po_watch_enabled": False,
+        "po_ledger_enabled": False,
+    })
+
+
+def _invoice(number):
+    return InvoiceData(
+        invoice_number=number,
+        order_id="CA-2025-AH10195140-41338",
+        customer_name="Alan Haines",
+        total=67.14,
+        item_details=[ItemDetail(item_name="36X48 HARDFLOOR CHAIRMAT", quantity=2, rate=33.57, amount=67.14)],
+    )
+
+
+def test_invoice_of_a_split_order_is_checked_against_its_own_lines():
+    result = asyncio.run(_agent()._validate_against_pos(_invoice("36552"), ORDER))
+    assert result.validation_status == ValidationStatus.VALID, result.discrepancies
+    assert result.expected_amount == 67.14
+    # the running balance still covers the whole order
+    assert result.po_data["order_total"] == 265.88
+
+
+def test_unknown_invoice_number_falls_back_to_the_whole_order():
+    result = asyncio.run(_agent()._validate_against_pos(_invoice(None), ORDER))
+    assert result.expected_amount == 265.88
+    assert any("not invoiced" in d for d in result.discrepancies)
+
+
+def test_three_way_match_is_opt_in(tmp_path):
+    assert _agent().receipt_loader is None
+    receipts = tmp_path / "receipts.csv"
+    receipts.write_text("receipt_id,order_id,sku,item_name,quantity_received,received_date\n", encoding="utf-8")
+    agent = ValidationAgent({
+        "po_file_path": os.path.join(DATA, "purchase_orders.csv"),
+        "po_watch_enabled": False,
+        "po_ledger_enabled": False,
+        "enable_three_way_match": True,
+        "receipts_path": str(receipts),
+    })
+    assert agent.receipt_loader is not None
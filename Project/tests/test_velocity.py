@@ -0,0 +1,45 @@
+from utils.velocity import SlidingWindowCounter
+
+
+def test_events_expire_bucket_by_bucket():
+    counter = SlidingWindowCounter(window_s=60, buckets=6)
+    assert counter.hit("acme", now=0) == 1
+    assert counter.hit("acme", now=25) == 2
+    assert counter.hit("acme", now=55) == 3
+    # the t=0 bucket leaves the window first, then t=25's
+    assert counter.count("acme", now=65) == 2
+    assert counter.count("acme", now=95) == 1
+    assert counter.count("acme", now=200) == 0
+    assert counter.hit("acme", now=200) == 1
+
+
+def test_matches_a_naive_count():
+    counter = SlidingWindowCounter(window_s=10, buckets=10)
+    times = [0.5, 1.2, 1.9, 4.0, 9.9, 10.1, 12.5, 12.6, 25.0, 26.0]
+    for i, t in enumerate(times):
+        expected = sum(1 for s in times[: i + 1] if int(s) > int(t) - 10)
+        assert counter.hit("k", now=t) == expected
+
+
+def test_repeated_event_ids_count_once():
+    counter = SlidingWindowCounter(window_s=60, buckets=6)
+    assert counter.hit("acme", "p1", now=0) == 1
+    assert counter.hit("acme", "p1", now=1) == 1
+    assert counter.hit("acme", "p2", now=2) == 2
+    assert counter.stats()["repeats"] == 1
+
+
+def test_late_events_outside_the_window_are_not_counted():
+    counter = SlidingWindowCounter(window_s=60, buckets=6)
+    counter.hit("acme", now=300)
+    assert counter.hit("acme", now=100) == 1
+
+
+def test_coldest_key_is_evicted():
+    counter = SlidingWindowCounter(window_s=60, buckets=6, max_keys=2)
+    counter.hit("a", now=0)
+    counter.hit("b", now=0)
+    counter.hit("a", now=1)
+    counter.hit("c", now=2)
+    assert counter.count("b", now=3) == 0 and counter.count("a", now=3) == 2
+    assert counter.stats()["evictions"] == 1
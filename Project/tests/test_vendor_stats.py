@@ -0,0 +1,59 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from agents.risk_agent import RiskAgent
+from utils.vendor_stats import VendorStatsStore
+
+AMOUNTS = [1200.0, 950.0, 1100.0, 1310.0, 1005.0, 990.0, 1250.0]
+
+
+def test_running_mean_and_std_match_numpy(tmp_path):
+    store = VendorStatsStore(str(tmp_path / "stats.sqlite3"))
+    for amount in AMOUNTS:
+        store.update("Acme Corp", amount)
+    stats = store.get("ACME corp.")
+    assert stats["count"] == len(AMOUNTS)
+    assert stats["mean"] == pytest.approx(np.mean(AMOUNTS))
+    assert stats["std"] == pytest.approx(np.std(AMOUNTS, ddof=1))
+
+    z = store.zscore("Acme Corp", 5000.0)
+    assert z == pytest.approx((5000.0 - np.mean(AMOUNTS)) / np.std(AMOUNTS, ddof=1))
+    assert store.zscore("Acme Corp", 5000.0, min_count=len(AMOUNTS) + 1) is None
+    assert store.zscore("Unknown Ltd", 5000.0) is None
+
+
+def test_constant_amounts_do_not_make_every_cent_an_outlier(tmp_path):
+    store = VendorStatsStore(str(tmp_path / "stats.sqlite3"))
+    for _ in range(10):
+        store.update("Acme Corp", 1000.0)
+    assert store.zscore("Acme Corp", 1001.0) == pytest.approx(0.1)
+
+
+def test_counted_processes_survive_a_restart(tmp_path):
+    path = str(tmp_path / "stats.sqlite3")
+    store = VendorStatsStore(path)
+    assert store.update("Acme Corp", 1000.0, "p1")
+    assert not store.update("Acme Corp", 1000.0, "p1")
+
+    reopened = VendorStatsStore(path)
+    assert not reopened.update("Acme Corp", 1000.0, "p1")  # a resume after restart
+    assert reopened.update("Acme Corp", 3000.0, "p2")
+    assert reopened.get("Acme Corp")["count"] == 2
+    assert reopened.get("Acme Corp")["mean"] == pytest.approx(2000.0)
+
+
+def test_only_approved_invoices_enter_the_baseline(tmp_path):
+    agent = RiskAgent({
+        "llm_backend": "fake",
+        "near_duplicate_enabled": False,
+        "risk_history_enabled": False,
+        "risk_model_enabled": False,
+        "velocity_enabled": False,
+        "vendor_stats_path": str(tmp_path / "stats.sqlite3"),
+    })
+    state = SimpleNamespace(process_id="p1", invoice_data=SimpleNamespace(customer_name="Acme Corp", total=1000.0))
+    assert agent.record_approved_amount(state)
+    assert not agent.record_approved_amount(state)
+    assert agent.vendor_stats.get("Acme Corp")["count"] == 1
@@ -3,6 +3,27 @@ Utility Modules for Invoice Processing Workflow
 
 Contains:
 - logger.py: Structured logging utilities
+- extraction_cache.py: Content-hash keyed cache for PDF text extraction
+- llm_cache.py: Persistent LLM response cache
+- pdf_extraction.py: Process-pool PDF text extraction service
+- invoice_templates.py: Deterministic parsers for known invoice layouts
+- layout_templates.py: Layout templates learned from past LLM extractions
+- llm_gateway.py: Shared Gemini gateway (per-key clients, rate limits, 429 backoff)
+- llm_backend.py: Pluggable LLM backend interface and registry
+- fake_llm.py: Deterministic offline Gemini stand-in for load testing
+- po_repository.py: Resident, versioned purchase-order master with hash / SKU / range indexes, hot reload and deltas
+- po_store.py: SQLite-backed purchase-order store with bulk CSV import and batched lookups
+- fuzzy_matcher.py: NumPy-backed batch fuzzy scoring with top-k selection
+- blocking_index.py: N-gram / phonetic blocking index for fuzzy candidate retrieval
+- line_item_matcher.py: Optimal invoice-item / PO-line assignment (Hungarian method)
+- receipt_store.py: Goods-receipt store (CSV / SQLite) with batched lookups for three-way matching
+- duplicate_index.py: Bloom-filter fronted duplicate-invoice fingerprint index
+- near_duplicate_index.py: MinHash / LSH near-duplicate index over invoice raw text
+- po_ledger.py: Running PO balance ledger (per-order async locks, append-only log)
+- check_graph.py: Concurrent dependency graph of async checks with per-check timeouts
+- risk_model.py: Risk assessment history and a NumPy logistic-regression risk model trained on it
+- vendor_stats.py: Per-vendor Welford / EWMA invoice-amount statistics for unusual-amount scoring
+- velocity.py: Sliding-window velocity counters (per-key ring buffers, LRU-bounded)
 """
 
 __all__ = []
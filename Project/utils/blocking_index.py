@@ -0,0 +1,239 @@
+"""
+Blocking index for fuzzy candidate retrieval.
+
+Fuzzy-scoring an invoice against every PO does not scale, even vectorized.
+``BlockingIndex`` narrows the field first: each key (a PO customer name or
+order id) is indexed by its character n-grams (per token, padded, so short
+tokens still produce grams) and by a phonetic key (sorted Soundex codes of its
+tokens). A query only retrieves keys that share enough n-grams with it -
+``min_overlap`` of the smaller gram set, which keeps token-subset matches such
+as "Bill" / "Bill Eplett" - or that sound the same. Only those candidates are
+then scored with the real fuzzy scorer. Grams carried by more than
+``max_posting_fraction`` of all keys (the "2025" of every order id) are
+stop-grams: they are not walked at query time, since they cannot tell keys
+apart and would make every lookup touch the whole index.
+
+Keys can be added and removed incrementally as the PO master changes.
+``measure_recall`` compares the candidates against a brute-force scan so
+``ngram`` / ``min_overlap`` / ``max_candidates`` can be tuned on real data.
+"""
+
+import time
+import threading
+from collections import defaultdict
+from typing import Dict, Any, Callable, Iterable, List, Optional, Set
+
+import numpy as np
+
+from utils.fuzzy_matcher import preprocess
+
+_SOUNDEX_CODES = {
+    **dict.fromkeys("bfpv", "1"), **dict.fromkeys("cgjkqsxz", "2"), **dict.fromkeys("dt", "3"),
+    "l": "4", **dict.fromkeys("mn", "5"), "r": "6",
+}
+
+
+def soundex(token: str) -> str:
+    """American Soundex (letter + 3 digits); digits-only tokens are returned as-is."""
+    letters = [ch for ch in token.lower() if ch.isalpha()]
+    if not letters:
+        return token
+    code = letters[0].upper()
+    previous = _SOUNDEX_CODES.get(letters[0], "")
+    for ch in letters[1:]:
+        digit = _SOUNDEX_CODES.get(ch, "")
+        if digit and digit != previous:
+            code += digit
+            if len(code) == 4:
+                break
+        if ch not in "hw":  # h/w do not separate equal codes
+            previous = digit
+    return code.ljust(4, "0")
+
+
+def phonetic_key(text: str) -> str:
+    return " ".join(sorted(soundex(token) for token in preprocess(text).split()))
+
+
+def ngrams(text: str, n: int = 3) -> Set[str]:
+    grams: Set[str] = set()
+    for token in preprocess(text).split():
+        padded = f"#{token}#"
+        if len(padded) <= n:
+            grams.add(padded)
+            continue
+        grams.update(padded[i:i + n] for i in range(len(padded) - n + 1))
+    return grams
+
+
+class BlockingIndex:
+    """Inverted n-gram lists plus a phonetic key index over a mutable set of keys."""
+
+    def __init__(
+        self,
+        ngram: int = 3,
+        min_overlap: float = 0.3,
+        max_candidates: Optional[int] = 500,
+        phonetic: bool = True,
+        max_posting_fraction: float = 0.05,
+    ):
+        self.ngram = max(2, int(ngram))
+        self.min_overlap = min(1.0, max(0.0, float(min_overlap)))
+        self.max_candidates = int(max_candidates) if max_candidates else None
+        self.phonetic = phonetic
+        self.max_posting_fraction = float(max_posting_fraction)
+
+        self._grams: Dict[str, Set[str]] = {}
+        self._phonetic: Dict[str, str] = {}
+        self._postings: Dict[str, Set[str]] = defaultdict(set)
+        self._sounds: Dict[str, Set[str]] = defaultdict(set)
+        self._lock = threading.Lock()
+        self._stats = {"queries": 0, "candidates": 0}
+
+    def __len__(self) -> int:
+        return len(self._grams)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._grams
+
+    # ------------------------------------------------------------------
+    # Maintenance
+    # ------------------------------------------------------------------
+    def add(self, key: str, text: Optional[str] = None):
+        """Index ``key`` (by ``text`` if given); re-adding a key replaces it."""
+        grams = ngrams(key if text is None else text, self.ngram)
+        sound = phonetic_key(key if text is None else text) if self.phonetic else ""
+        with self._lock:
+            if key in self._grams:
+                self._remove_locked(key)
+            self._grams[key] = grams
+            for gram in grams:
+                self._postings[gram].add(key)
+            if sound:
+                self._phonetic[key] = sound
+                self._sounds[sound].add(key)
+
+    def add_many(self, keys: Iterable[str]):
+        for key in keys:
+            self.add(key)
+
+    def remove(self, key: str) -> bool:
+        with self._lock:
+            return self._remove_locked(key)
+
+    def _remove_locked(self, key: str) -> bool:
+        grams = self._grams.pop(key, None)
+        if grams is None:
+            return False
+        for gram in grams:
+            posting = self._postings.get(gram)
+            if posting is not None:
+                posting.discard(key)
+                if not posting:
+                    del self._postings[gram]
+        sound = self._phonetic.pop(key, None)
+        if sound:
+            self._sounds[sound].discard(key)
+            if not self._sounds[sound]:
+                del self._sounds[sound]
+        return True
+
+    # ------------------------------------------------------------------
+    # Retrieval
+    # ------------------------------------------------------------------
+    def candidates(self, query: str) -> List[str]:
+        """Keys worth fuzzy-scoring against ``query``, strongest n-gram overlap first."""
+        grams = ngrams(query, self.ngram)
+        sound = phonetic_key(query) if self.phonetic else ""
+        with self._lock:
+            stop_size = max(50, int(self.max_posting_fraction * len(self._grams)))
+            postings = [self._postings[g] for g in grams if g in self._postings]
+            informative = [p for p in postings if len(p) <= stop_size] or postings
+            shared: Dict[str, int] = defaultdict(int)
+            for posting in informative:
+                for key in posting:
+                    shared[key] += 1
+
+            scored = []
+            for key, count in shared.items():
+                overlap = count / max(1, min(len(informative), len(self._grams[key])))
+                if overlap >= self.min_overlap:
+                    scored.append((overlap, count, key))
+            scored.sort(key=lambda s: (-s[0], -s[1]))
+            if self.max_candidates is not None:
+                scored = scored[:self.max_candidates]
+
+            result = [key for _, _, key in scored]
+            if sound:
+                seen = set(result)
+                result.extend(k for k in self._sounds.get(sound, ()) if k not in seen)
+
+        self._stats["queries"] += 1
+        self._stats["candidates"] += len(result)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        stats.update({
+            "keys": len(self._grams),
+            "grams": len(self._postings),
+            "avg_candidates": round(stats["candidates"] / stats["queries"], 1) if stats["queries"] else 0.0,
+            "ngram": self.ngram,
+            "min_overlap": self.min_overlap,
+            "max_candidates": self.max_candidates,
+            "max_posting_fraction": self.max_posting_fraction,
+        })
+        return stats
+
+
+def measure_recall(
+    index: BlockingIndex,
+    queries: List[str],
+    keys: List[str],
+    scorer: Callable[[List[str], List[str]], Any],
+    threshold: int = 80,
+) -> Dict[str, Any]:
+    """
+    Recall of ``index`` against brute force: for every query, the keys whose
+    ``scorer`` score clears ``threshold`` when scanning all ``keys`` versus
+    those found when scanning only the blocked candidates.
+
+    ``scorer(queries, choices)`` must return a ``len(queries) x len(choices)``
+    score matrix (e.g. ``fuzzy_matcher.token_set_scores`` on pre-processed text).
+    """
+    processed = [preprocess(k) for k in keys]
+    start = time.perf_counter()
+    brute = scorer([preprocess(q) for q in queries], processed)
+    brute_s = time.perf_counter() - start
+
+    position = {k: i for i, k in enumerate(keys)}
+    expected = found = candidates_total = 0
+    missed: List[Dict[str, Any]] = []
+    start = time.perf_counter()
+    for qi, query in enumerate(queries):
+        truth = {keys[j] for j in np.flatnonzero(np.asarray(brute[qi]) >= threshold)}
+        cands = [c for c in index.candidates(query) if c in position]
+        candidates_total += len(cands)
+        if cands:
+            scores = scorer([preprocess(query)], [processed[position[c]] for c in cands])[0]
+            hits = {c for c, s in zip(cands, scores) if s >= threshold}
+        else:
+            hits = set()
+        expected += len(truth)
+        found += len(truth & hits)
+        if truth - hits and len(missed) < 20:
+            missed.append({"query": query, "missed": sorted(truth - hits)[:5]})
+    blocked_s = time.perf_counter() - start
+
+    return {
+        "queries": len(queries),
+        "keys": len(keys),
+        "expected_matches": expected,
+        "found_matches": found,
+        "recall": round(found / expected, 4) if expected else 1.0,
+        "avg_candidates": round(candidates_total / len(queries), 1) if queries else 0.0,
+        "candidate_fraction": round(candidates_total / (len(queries) * len(keys)), 5) if queries and keys else 0.0,
+        "brute_force_s": round(brute_s, 4),
+        "blocked_s": round(blocked_s, 4),
+        "missed_examples": missed,
+    }
@@ -0,0 +1,114 @@
+"""
+Concurrent dependency graph of async checks.
+
+An agent step made of several checks that mostly do not depend on each other
+(rule checks, a score, an LLM hint) does not have to await them one after
+another. ``CheckGraph`` starts every check as soon as the checks it depends on
+have finished, passing their results in as keyword arguments, and gives each
+one its own timeout. A check that times out or raises yields its
+``fallback`` instead, so a slow LLM call degrades to the deterministic
+result rather than holding the invoice.
+
+Checks whose work blocks (SQLite, file I/O, heavy CPU) are declared with
+``blocking=True`` and given a plain function; it runs in a worker thread
+(``asyncio.to_thread``), so it overlaps the other checks and its timeout can
+actually fire. A timed-out thread cannot be stopped: its result is dropped
+and the fallback used while it finishes in the background. A blocking body
+behind an ``async def`` would hold the event loop and no timeout could fire.
+
+``run()`` returns ``(results, timings)``: each check's value (or fallback),
+and per check ``{"status": ok|timeout|error, "ms", "waited_ms"}`` for the
+audit trail (``waited_ms``: time spent waiting for dependencies).
+"""
+
+import time
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+
+class Check:
+    """
+    One node: ``func(**results_of_deps)`` awaited with ``timeout_s`` (called in a
+    worker thread when ``blocking``); ``fallback`` (or ``fallback()``) on failure.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        func: Callable[..., Awaitable[Any]],
+        deps: Iterable[str] = (),
+        timeout_s: Optional[float] = None,
+        fallback: Any = None,
+        blocking: bool = False,
+    ):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.timeout_s = timeout_s
+        self.fallback = fallback
+        self.blocking = bool(blocking)
+
+    def fallback_value(self) -> Any:
+        return self.fallback() if callable(self.fallback) else self.fallback
+
+
+class CheckGraph:
+    """Runs ``Check`` nodes concurrently in dependency order."""
+
+    def __init__(self, checks: List[Check]):
+        self.checks = {c.name: c for c in checks}
+        if len(self.checks) != len(checks):
+            raise ValueError("Check names must be unique")
+        for check in checks:
+            missing = [d for d in check.deps if d not in self.checks]
+            if missing:
+                raise ValueError(f"Check '{check.name}' depends on unknown checks: {', '.join(missing)}")
+        self.order = self._topological_order()
+
+    def _topological_order(self) -> List[str]:
+        order: List[str] = []
+        state: Dict[str, int] = {}  # 1: visiting, 2: done
+
+        def visit(name: str):
+            if state.get(name) == 2:
+                return
+            if state.get(name) == 1:
+                raise ValueError(f"Check dependency cycle through '{name}'")
+            state[name] = 1
+            for dep in self.checks[name].deps:
+                visit(dep)
+            state[name] = 2
+            order.append(name)
+
+        for name in self.checks:
+            visit(name)
+        return order
+
+    async def run(self) -> Tuple[Dict[str, Any], Dict[str, Dict[str, Any]]]:
+        tasks: Dict[str, asyncio.Task] = {}
+        timings: Dict[str, Dict[str, Any]] = {}
+
+        async def _run(check: Check) -> Any:
+            queued = time.perf_counter()
+            inputs = {dep: await tasks[dep] for dep in check.deps}
+            start = time.perf_counter()
+            timing: Dict[str, Any] = {"status": "ok"}
+            try:
+                call = asyncio.to_thread(check.func, **inputs) if check.blocking else check.func(**inputs)
+                value = await asyncio.wait_for(call, check.timeout_s)
+            except asyncio.TimeoutError:
+                value = check.fallback_value()
+                timing["status"] = "timeout"
+            except Exception as e:
+                value = check.fallback_value()
+                timing.update(status="error", error=str(e))
+            timing["ms"] = round((time.perf_counter() - start) * 1000, 2)
+            timing["waited_ms"] = round((start - queued) * 1000, 2)
+            timings[check.name] = timing
+            return value
+
+        # dependencies first, so every awaited task exists
+        for name in self.order:
+            tasks[name] = asyncio.create_task(_run(self.checks[name]), name=f"check:{name}")
+        values = await asyncio.gather(*tasks.values())
+        return dict(zip(tasks, values)), {name: timings[name] for name in self.order}
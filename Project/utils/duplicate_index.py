@@ -0,0 +1,221 @@
+"""
+Duplicate-invoice index.
+
+Every extracted invoice is fingerprinted twice:
+
+- ``doc:<sha256>``: the raw PDF bytes (byte-identical resubmission)
+- ``inv:<vendor>|<invoice_number>|<total>``: normalized customer name,
+  invoice number and total to the cent (a re-scan or re-export of the same
+  invoice)
+
+Fingerprints are claimed in a persistent SQLite table. An in-memory Bloom
+filter over the fingerprints this process has seen answers the common case -
+a new invoice - without a lookup: a Bloom miss is claimed with a plain INSERT,
+and only Bloom hits are confirmed with an exact SELECT first. Other processes
+sharing the file claim fingerprints this filter never saw, so a primary-key
+conflict on the INSERT is looked up as well. A fingerprint already claimed by
+another process id is a duplicate. Re-running the same process id (retries,
+resumes) is not.
+
+The filter is rebuilt from the table on start-up and grows in place; its
+size comes from ``capacity`` and ``error_rate`` (false-positive rate at
+capacity), and false positives only cost one indexed SELECT.
+"""
+
+import os
+import math
+import time
+import sqlite3
+import hashlib
+import threading
+from functools import lru_cache
+from typing import Dict, Any, List, Optional
+
+from utils.po_repository import normalize_name, normalize_key
+from utils.logger import get_logger
+
+
+class BloomFilter:
+    """Bit-array Bloom filter with double hashing over a BLAKE2b digest."""
+
+    def __init__(self, capacity: int = 1_000_000, error_rate: float = 0.001):
+        capacity = max(1, int(capacity))
+        error_rate = min(0.5, max(1e-9, float(error_rate)))
+        self.num_bits = max(8, int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))))
+        self.num_hashes = max(1, int(round(self.num_bits / capacity * math.log(2))))
+        self.capacity = capacity
+        self.count = 0
+        self._bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, key: str) -> List[int]:
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, key: str):
+        for pos in self._positions(key):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+    def stats(self) -> Dict[str, Any]:
+        # expected false-positive rate at the current fill
+        fp = (1 - math.exp(-self.num_hashes * self.count / self.num_bits)) ** self.num_hashes
+        return {
+            "items": self.count,
+            "capacity": self.capacity,
+            "bits": self.num_bits,
+            "hashes": self.num_hashes,
+            "expected_fp_rate": round(fp, 6),
+        }
+
+
+def invoice_fingerprints(
+    customer_name: Any = None, invoice_number: Any = None, total: Any = None, doc_hash: Optional[str] = None
+) -> List[str]:
+    """Fingerprint keys of one invoice (business key only when vendor and number are known)."""
+    keys = []
+    if doc_hash:
+        keys.append(f"doc:{doc_hash}")
+    vendor, number = normalize_name(customer_name), normalize_key(invoice_number)
+    if vendor and number:
+        try:
+            amount = f"{float(total):.2f}"
+        except (TypeError, ValueError):
+            amount = ""
+        keys.append(f"inv:{vendor}|{number}|{amount}")
+    return keys
+
+
+class DuplicateInvoiceIndex:
+    """Persistent fingerprint store fronted by an in-memory Bloom filter."""
+
+    def __init__(
+        self,
+        db_path: str = os.path.join("output", "duplicates", "invoice_fingerprints.sqlite3"),
+        capacity: int = 1_000_000,
+        error_rate: float = 0.001,
+    ):
+        self.db_path = db_path
+        self.logger = get_logger("DuplicateInvoiceIndex")
+        self._lock = threading.Lock()
+        self._stats = {"checks": 0, "bloom_negatives": 0, "bloom_false_positives": 0, "duplicates": 0, "claims": 0,
+                       "shared_conflicts": 0}
+
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS invoice_fingerprints (
+                fingerprint TEXT PRIMARY KEY,
+                process_id  TEXT NOT NULL,
+                file_name   TEXT,
+                created_at  REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_fingerprints_process ON invoice_fingerprints(process_id)"
+        )
+
+        stored = self._conn.execute("SELECT COUNT(*) FROM invoice_fingerprints").fetchone()[0]
+        self._bloom = BloomFilter(max(int(capacity), 2 * stored), error_rate)
+        for (fingerprint,) in self._conn.execute("SELECT fingerprint FROM invoice_fingerprints"):
+            self._bloom.add(fingerprint)
+
+    # ------------------------------------------------------------------
+    # Check / Claim
+    # ------------------------------------------------------------------
+    def check_and_register(
+        self, fingerprints: List[str], process_id: str, file_name: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Earlier claim of any of ``fingerprints`` by another process, or
+        ``None`` after claiming them all for ``process_id``.
+        """
+        if not fingerprints:
+            return None
+        with self._lock:
+            self._stats["checks"] += 1
+            maybe = {f for f in fingerprints if f in self._bloom}
+            if not maybe:
+                self._stats["bloom_negatives"] += 1
+            # IMMEDIATE: other processes sharing the file cannot claim in between
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                for fingerprint in fingerprints:
+                    # a Bloom miss only means this process never saw the fingerprint:
+                    # claim it outright and let the primary key report another claimant
+                    if fingerprint in maybe:
+                        owner = self._owner(fingerprint)
+                        if owner is None:
+                            self._stats["bloom_false_positives"] += 1
+                    else:
+                        owner = None
+                    if owner is None:
+                        try:
+                            self._conn.execute(
+                                "INSERT INTO invoice_fingerprints (fingerprint, process_id, file_name, created_at) "
+                                "VALUES (?, ?, ?, ?)",
+                                (fingerprint, process_id, file_name, now),
+                            )
+                            continue
+                        except sqlite3.IntegrityError:
+                            self._stats["shared_conflicts"] += 1
+                            owner = self._owner(fingerprint)
+                    if owner is not None and owner[0] != process_id:
+                        self._conn.execute("ROLLBACK")
+                        self._stats["duplicates"] += 1
+                        return {
+                            "fingerprint": fingerprint,
+                            "match": fingerprint.split(":", 1)[0],
+                            "original_process_id": owner[0],
+                            "original_file": owner[1],
+                            "first_seen": owner[2],
+                        }
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            for fingerprint in fingerprints:
+                if fingerprint not in self._bloom:
+                    self._bloom.add(fingerprint)
+            self._stats["claims"] += 1
+            return None
+
+    def _owner(self, fingerprint: str) -> Optional[tuple]:
+        return self._conn.execute(
+            "SELECT process_id, file_name, created_at FROM invoice_fingerprints WHERE fingerprint = ?",
+            (fingerprint,),
+        ).fetchone()
+
+    def release(self, process_id: str) -> int:
+        """
+        Drop the fingerprints claimed by ``process_id`` (e.g. an invoice
+        rejected and legitimately resubmitted). Bloom bits stay set; the
+        exact lookup turns them into false positives.
+        """
+        with self._lock:
+            cur = self._conn.execute("DELETE FROM invoice_fingerprints WHERE process_id = ?", (process_id,))
+            return cur.rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        stats.update({
+            "db_path": self.db_path,
+            "bloom": self._bloom.stats(),
+            "bloom_negative_rate": round(stats["bloom_negatives"] / stats["checks"], 3) if stats["checks"] else 0.0,
+        })
+        return stats
+
+
+@lru_cache(maxsize=None)
+def get_duplicate_index(db_path: str, capacity: int = 1_000_000, error_rate: float = 0.001) -> DuplicateInvoiceIndex:
+    """Shared index per database file."""
+    return DuplicateInvoiceIndex(os.path.abspath(db_path), capacity, error_rate)
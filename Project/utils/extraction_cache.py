@@ -0,0 +1,202 @@
+"""
+Content-addressed cache for PDF text extraction.
+
+Entries are keyed by the SHA-256 of the raw PDF bytes plus the list of
+extraction methods that produced the text, so re-runs and duplicate uploads
+of the same document skip PyMuPDF/pdfplumber entirely.
+
+Two tiers are used:
+- an in-memory LRU for hot documents
+- an on-disk store (one file per entry) with size-based eviction
+"""
+
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
+
+from utils.logger import get_logger
+
+
+def content_hash(data: bytes) -> str:
+    """SHA-256 hex digest of the raw document bytes."""
+    return hashlib.sha256(data).hexdigest()
+
+
+class ExtractionCache:
+    """Two-tier (memory LRU + disk) cache for extracted PDF text."""
+
+    def __init__(
+        self,
+        cache_dir: str = os.path.join("output", "cache", "pdf_text"),
+        max_memory_items: int = 256,
+        max_disk_bytes: int = 128 * 1024 * 1024,
+        enabled: bool = True,
+    ):
+        self.cache_dir = cache_dir
+        self.max_memory_items = max(0, int(max_memory_items))
+        self.max_disk_bytes = max(0, int(max_disk_bytes))
+        self.enabled = enabled
+        self.logger = get_logger("ExtractionCache")
+
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_bytes = 0
+        self._stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "writes": 0,
+            "evictions": 0,
+        }
+
+        if self.enabled:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._disk_bytes = sum(size for _, size, _ in self._scan_disk())
+
+    # ------------------------------------------------------------------
+    # Keys
+    # ------------------------------------------------------------------
+    @staticmethod
+    def make_key(doc_hash: str, methods: List[str]) -> str:
+        """Cache key = document hash + ordered extraction method list."""
+        return f"{doc_hash}_{'-'.join(methods)}"
+
+    # ------------------------------------------------------------------
+    # Lookup / Store
+    # ------------------------------------------------------------------
+    def get(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            text = self._memory.get(key)
+            if text is not None:
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return text
+
+        path = self._path_for(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                text = f.read()
+            os.utime(path, None)  # refresh recency for disk eviction
+        except FileNotFoundError:
+            with self._lock:
+                self._stats["misses"] += 1
+            return None
+        except OSError as e:
+            self.logger.warning(f"Extraction cache read failed for {key}: {e}")
+            with self._lock:
+                self._stats["misses"] += 1
+            return None
+
+        with self._lock:
+            self._stats["disk_hits"] += 1
+            self._remember(key, text)
+        return text
+
+    def put(self, key: str, text: str):
+        if not self.enabled or not text:
+            return
+
+        with self._lock:
+            self._remember(key, text)
+
+        path = self._path_for(key)
+        tmp_path = f"{path}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            previous = os.path.getsize(path) if os.path.exists(path) else 0
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp_path, path)  # atomic publish
+            size = os.path.getsize(path)
+        except OSError as e:
+            self.logger.warning(f"Extraction cache write failed for {key}: {e}")
+            return
+
+        with self._lock:
+            self._disk_bytes += size - previous
+            self._stats["writes"] += 1
+            over_budget = self._disk_bytes > self.max_disk_bytes
+
+        if over_budget:
+            self._evict_disk()
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        for path, _, _ in self._scan_disk():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        with self._lock:
+            self._disk_bytes = 0
+
+    # ------------------------------------------------------------------
+    # Stats
+    # ------------------------------------------------------------------
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_items"] = len(self._memory)
+            stats["disk_bytes"] = self._disk_bytes
+        hits = stats["memory_hits"] + stats["disk_hits"]
+        lookups = hits + stats["misses"]
+        stats["hit_rate"] = round(hits / lookups, 3) if lookups else 0.0
+        stats["enabled"] = self.enabled
+        return stats
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+    def _path_for(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.txt")
+
+    def _remember(self, key: str, text: str):
+        """Insert into the memory tier (caller holds the lock)."""
+        if self.max_memory_items == 0:
+            return
+        self._memory[key] = text
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def _scan_disk(self):
+        """Yield (path, size, mtime) for every cached file."""
+        if not os.path.isdir(self.cache_dir):
+            return
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith(".txt"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                yield path, st.st_size, st.st_mtime
+
+    def _evict_disk(self):
+        """Drop least-recently-used files until the disk tier fits its budget."""
+        entries = sorted(self._scan_disk(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for path, size, _ in entries:
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            evicted += 1
+
+        with self._lock:
+            self._disk_bytes = total
+            self._stats["evictions"] += evicted
+        if evicted:
+            self.logger.info(f"Extraction cache evicted {evicted} file(s) from disk")
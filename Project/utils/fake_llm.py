@@ -0,0 +1,205 @@
+"""
+Deterministic local stand-in for Gemini.
+
+``FakeLLM`` answers the prompts our agents send without any network access:
+
+- invoice extraction prompts get schema-valid ``invoice_data`` JSON derived
+  from the invoice text (via the layout templates, with a regex fallback)
+- the risk prompt gets a ``risk_hint`` JSON derived from the fraud indicators
+- summary / justification prompts get a short fixed-format sentence
+
+Latency is drawn from a configurable distribution, and a configurable share of
+calls fail with a generic error or a 429. Draws are seeded per prompt and
+attempt, so runs are reproducible regardless of scheduling. ``FakeLLM`` is
+plugged into ``LLMGateway`` as its transport, so benchmarks exercise the same
+rate limiting, executor and 429 backoff as production.
+"""
+
+import os
+import re
+import json
+import math
+import time
+import random
+import hashlib
+import threading
+from functools import lru_cache
+from typing import Dict, Any, Optional
+
+from utils.invoice_templates import TemplateParser, MONEY_RE, parse_money
+from utils.llm_gateway import LLMGateway
+
+
+class FakeLLMError(Exception):
+    """Injected non-retryable backend failure."""
+
+
+class FakeRateLimitError(Exception):
+    """Injected quota error; ``code`` mirrors the HTTP status the gateway checks."""
+
+    code = 429
+
+
+class FakeLLM:
+    """Callable transport ``(api_key, model, prompt) -> text`` with injected latency and failures."""
+
+    DISTRIBUTIONS = ("fixed", "uniform", "normal", "lognormal")
+
+    def __init__(
+        self,
+        latency_ms: float = 800.0,
+        distribution: str = "lognormal",
+        spread: float = 0.5,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        seed: int = 0,
+    ):
+        """
+        ``latency_ms`` is the median latency. ``spread`` is the sigma of the
+        lognormal, the relative std-dev of the normal, or the relative
+        half-width of the uniform distribution.
+        """
+        if distribution not in self.DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution '{distribution}' ({self.DISTRIBUTIONS})")
+        self.latency_ms = max(0.0, float(latency_ms))
+        self.distribution = distribution
+        self.spread = max(0.0, float(spread))
+        self.error_rate = min(1.0, max(0.0, float(error_rate)))
+        self.rate_limit_rate = min(1.0, max(0.0, float(rate_limit_rate)))
+        self.seed = int(seed)
+
+        self.template_parser = TemplateParser()
+        self._lock = threading.Lock()
+        self._attempts: Dict[str, int] = {}
+        self._stats = {"calls": 0, "errors": 0, "rate_limited": 0, "latency_ms_total": 0.0}
+
+    def __call__(self, api_key: str, model: str, prompt: str) -> str:
+        rng = self._rng_for(prompt)
+        delay_ms = self._sample_latency(rng)
+        time.sleep(delay_ms / 1000.0)
+
+        roll = rng.random()
+        with self._lock:
+            self._stats["calls"] += 1
+            self._stats["latency_ms_total"] += delay_ms
+            if roll < self.rate_limit_rate:
+                self._stats["rate_limited"] += 1
+                raise FakeRateLimitError("429 RESOURCE_EXHAUSTED (injected)")
+            if roll < self.rate_limit_rate + self.error_rate:
+                self._stats["errors"] += 1
+                raise FakeLLMError("500 backend error (injected)")
+        return self.respond(prompt)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        calls = stats.pop("latency_ms_total")
+        stats["avg_latency_ms"] = round(calls / stats["calls"], 1) if stats["calls"] else 0.0
+        stats.update({
+            "distribution": self.distribution,
+            "latency_ms": self.latency_ms,
+            "error_rate": self.error_rate,
+            "rate_limit_rate": self.rate_limit_rate,
+        })
+        return stats
+
+    # ------------------------------------------------------------------
+    # Responses
+    # ------------------------------------------------------------------
+    def respond(self, prompt: str) -> str:
+        if "Invoice text:" in prompt:
+            return json.dumps(self._invoice_response(prompt.split("Invoice text:", 1)[1]))
+        if "risk_hint" in prompt:
+            return json.dumps(self._risk_response(prompt))
+        lowered = prompt.lower()
+        if "justification" in lowered:
+            return "Payment decision follows the automated risk and validation results."
+        if "escalation" in lowered:
+            return "- Escalated by automated policy\n- Review risk level and amount\n- Route to approver"
+        if "audit" in lowered:
+            return "Audit completed offline; compliance checks recorded in the audit record."
+        return "OK"
+
+    def _invoice_response(self, text: str) -> Dict[str, Any]:
+        result = self.template_parser.parse(text)
+        invoice = result.invoice_data if result else self._fallback_invoice(text)
+        return {"invoice_data": invoice, "overall_status": "in_progress", "current_agent": "document_agent"}
+
+    def _fallback_invoice(self, text: str) -> Dict[str, Any]:
+        number = re.search(r"#\s*(\S+)", text)
+        order = re.search(r"Order ID\s*:\s*(\S+)", text)
+        amounts = [parse_money(tok) for tok in text.split() if MONEY_RE.match(tok)]
+        total = max(amounts) if amounts else 0.0
+        return {
+            "invoice_number": number.group(1) if number else hashlib.sha1(text.encode("utf-8")).hexdigest()[:8],
+            "order_id": order.group(1) if order else "",
+            "customer_name": "",
+            "due_date": "",
+            "ship_to": "",
+            "ship_mode": "",
+            "subtotal": total,
+            "discount": 0.0,
+            "shipping_cost": 0.0,
+            "total": total,
+            "item_details": [],
+        }
+
+    def _risk_response(self, prompt: str) -> Dict[str, Any]:
+        match = re.search(r"Fraud indicators:\s*\[(.*?)\]", prompt, re.DOTALL)
+        indicators = [i for i in (match.group(1).split(",") if match else []) if i.strip()]
+        hint = "low" if not indicators else "medium" if len(indicators) == 1 else "high"
+        return {"risk_hint": hint, "notes": f"{len(indicators)} fraud indicator(s) reported"}
+
+    # ------------------------------------------------------------------
+    # Randomness
+    # ------------------------------------------------------------------
+    def _rng_for(self, prompt: str) -> random.Random:
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        with self._lock:
+            attempt = self._attempts.get(digest, 0)
+            self._attempts[digest] = attempt + 1
+        return random.Random(f"{self.seed}:{digest}:{attempt}")
+
+    def _sample_latency(self, rng: random.Random) -> float:
+        base = self.latency_ms
+        if self.distribution == "fixed" or base == 0:
+            return base
+        if self.distribution == "uniform":
+            return max(0.0, rng.uniform(base * (1 - self.spread), base * (1 + self.spread)))
+        if self.distribution == "normal":
+            return max(0.0, rng.gauss(base, base * self.spread))
+        return base * math.exp(rng.gauss(0.0, self.spread))
+
+
+def fake_llm_from_env() -> FakeLLM:
+    return FakeLLM(
+        latency_ms=float(os.getenv("FAKE_LLM_LATENCY_MS", "800")),
+        distribution=os.getenv("FAKE_LLM_LATENCY_DIST", "lognormal"),
+        spread=float(os.getenv("FAKE_LLM_LATENCY_SPREAD", "0.5")),
+        error_rate=float(os.getenv("FAKE_LLM_ERROR_RATE", "0")),
+        rate_limit_rate=float(os.getenv("FAKE_LLM_429_RATE", "0")),
+        seed=int(os.getenv("FAKE_LLM_SEED", "0")),
+    )
+
+
+def make_fake_gateway(fake: Optional[FakeLLM] = None, keys: int = 5, **gateway_kwargs) -> LLMGateway:
+    """An ``LLMGateway`` with ``keys`` fake API keys whose transport is ``fake``."""
+    gateway_kwargs.setdefault("requests_per_minute", 600.0)
+    gateway_kwargs.setdefault("base_backoff_s", 0.5)
+    gateway = LLMGateway(
+        api_keys=[f"fake-key-{i + 1}" for i in range(max(1, int(keys)))],
+        transport=fake or fake_llm_from_env(),
+        **gateway_kwargs,
+    )
+    gateway.name = "fake"
+    return gateway
+
+
+@lru_cache(maxsize=None)
+def get_fake_llm_backend() -> LLMGateway:
+    """Process-wide fake backend configured from ``FAKE_LLM_*`` environment variables."""
+    return make_fake_gateway(
+        keys=int(os.getenv("FAKE_LLM_KEYS", "5")),
+        requests_per_minute=float(os.getenv("FAKE_LLM_RPM_PER_KEY", "600")),
+        max_workers=int(os.getenv("FAKE_LLM_MAX_WORKERS", "16")),
+    )
@@ -0,0 +1,112 @@
+"""
+Batch fuzzy matching.
+
+``fuzz.token_set_ratio`` called row by row is the dominant cost of PO matching
+once the master grows. ``BatchFuzzyMatcher`` pre-processes a fixed set of
+choices (e.g. every distinct PO customer name) once, then scores a whole batch
+of queries against all of them in one call, producing a NumPy score matrix
+from which threshold matches and top-k candidates are selected.
+
+Scores are computed with rapidfuzz (already installed as the backend of
+python-Levenshtein) and rounded half-to-even, exactly like fuzzywuzzy's
+integer scores, so ``score >= fuzzy_threshold`` keeps its current meaning.
+Without rapidfuzz the matrix is filled with fuzzywuzzy, one pair at a time.
+"""
+
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    from rapidfuzz import fuzz as rf_fuzz, process as rf_process, utils as rf_utils
+except ImportError:  # pragma: no cover - optional accelerator
+    rf_fuzz = rf_process = rf_utils = None
+
+
+def preprocess(value) -> str:
+    """fuzzywuzzy's ``full_process(force_ascii=True)``: ASCII only, alnum tokens, lower-case."""
+    text = "".join(ch for ch in str(value or "") if ord(ch) < 128)
+    if rf_utils is not None:
+        return rf_utils.default_process(text)
+    from fuzzywuzzy import utils as fw_utils
+    return fw_utils.full_process(text)
+
+
+def token_set_scores(queries: Sequence[str], choices: Sequence[str], workers: int = -1) -> np.ndarray:
+    """
+    ``len(queries) x len(choices)`` matrix of integer token_set_ratio scores
+    (0-100) for already pre-processed strings.
+    """
+    if not len(queries) or not len(choices):
+        return np.zeros((len(queries), len(choices)), dtype=np.uint8)
+    if rf_process is not None:
+        scores = rf_process.cdist(
+            queries, choices, scorer=rf_fuzz.token_set_ratio, processor=None,
+            dtype=np.float32, workers=workers,
+        )
+        return np.rint(scores).astype(np.uint8)
+
+    from fuzzywuzzy import fuzz
+    scores = np.zeros((len(queries), len(choices)), dtype=np.uint8)
+    for i, query in enumerate(queries):
+        for j, choice in enumerate(choices):
+            scores[i, j] = fuzz.token_set_ratio(query, choice, force_ascii=False, full_process=False)
+    return scores
+
+
+def best_index(query: str, choices: Sequence[str]) -> Optional[int]:
+    """Index of the highest-scoring choice (first one on ties, like ``max``)."""
+    if not len(choices):
+        return None
+    row = token_set_scores([preprocess(query)], [preprocess(c) for c in choices])[0]
+    return int(np.argmax(row))
+
+
+def select_hits(row: np.ndarray, threshold: int, top_k: Optional[int] = None) -> List[Tuple[int, int]]:
+    """``(index, score)`` pairs of ``row`` with ``score >= threshold``, best first (ties keep order)."""
+    hits = np.flatnonzero(row >= threshold)
+    if top_k is not None and len(hits) > top_k:
+        # partial selection on the hits, then a stable sort of the k survivors
+        keep = np.argpartition(-row[hits].astype(np.int16), top_k - 1)[:top_k]
+        hits = np.sort(hits[keep])
+    order = hits[np.argsort(-row[hits].astype(np.int16), kind="stable")]
+    return [(int(i), int(row[i])) for i in order]
+
+
+class BatchFuzzyMatcher:
+    """Pre-processed choice list scored against batches of queries as a matrix."""
+
+    def __init__(self, choices: Sequence[str], threshold: int = 80, chunk_size: int = 256, workers: int = -1):
+        self.choices = list(choices)
+        self.threshold = int(threshold)
+        self.chunk_size = max(1, int(chunk_size))
+        self.workers = workers
+        self._processed = [preprocess(c) for c in self.choices]
+
+    def __len__(self) -> int:
+        return len(self.choices)
+
+    def score_matrix(self, queries: Sequence[str]) -> np.ndarray:
+        """Scores of every query against every choice (``uint8``, 0-100)."""
+        processed = [preprocess(q) for q in queries]
+        if len(processed) <= self.chunk_size:
+            return token_set_scores(processed, self._processed, self.workers)
+        # bound peak memory for very large batches
+        return np.vstack([
+            token_set_scores(processed[i:i + self.chunk_size], self._processed, self.workers)
+            for i in range(0, len(processed), self.chunk_size)
+        ])
+
+    def match(
+        self, queries: Sequence[str], top_k: Optional[int] = None, threshold: Optional[int] = None
+    ) -> List[List[Tuple[int, int]]]:
+        """
+        Per query, ``(choice_index, score)`` pairs with ``score >= threshold``,
+        best first (ties keep choice order). ``top_k`` caps the list length.
+        """
+        threshold = self.threshold if threshold is None else int(threshold)
+        results: List[List[Tuple[int, int]]] = []
+        for start in range(0, len(queries), self.chunk_size):
+            scores = self.score_matrix(queries[start:start + self.chunk_size])
+            results.extend(select_hits(row, threshold, top_k) for row in scores)
+        return results
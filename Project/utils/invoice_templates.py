@@ -0,0 +1,268 @@
+"""
+Deterministic template parsers for known invoice layouts.
+
+A template turns extracted PDF text into the same ``invoice_data`` dict the
+Gemini prompt produces, together with a confidence per field. DocumentAgent
+uses the result directly when every required field clears its
+``ai_confidence_threshold`` and only falls back to the LLM otherwise.
+Arithmetic cross-checks (qty x rate = amount, items = subtotal,
+subtotal - discount + shipping = total) drive the amount confidences, so a
+mis-read number never silently passes as a confident extraction.
+"""
+
+import re
+from typing import Dict, Any, List, Optional, Tuple
+
+
+MONEY_RE = re.compile(r"^-?\$\s?-?[\d,]+(?:\.\d+)?$")
+INT_RE = re.compile(r"^\d+$")
+DATE_RE = re.compile(r"^[A-Z][a-z]{2} \d{1,2},? \d{4}$")
+SKU_RE = re.compile(r"\b[A-Z]{3}-[A-Z]{2}-\d{3,}$")
+INVOICE_NO_RE = re.compile(r"^#\s*(\S+)$")
+ORDER_ID_RE = re.compile(r"Order ID\s*:\s*(\S+)")
+
+SHIP_MODES = {"Standard Class", "Second Class", "First Class", "Same Day"}
+
+# Fields that must be confidently extracted for the template result to be used
+REQUIRED_FIELDS = ("invoice_number", "order_id", "customer_name", "subtotal", "total", "item_details")
+
+
+def parse_money(value: str) -> float:
+    return float(value.replace("$", "").replace(",", "").strip())
+
+
+def amounts_match(a: float, b: float, tolerance: float = 0.011) -> bool:
+    return abs(a - b) <= tolerance
+
+
+class TemplateParseResult:
+    """Parsed invoice dict plus per-field confidence."""
+
+    def __init__(self, template: str, invoice_data: Dict[str, Any], field_confidence: Dict[str, float]):
+        self.template = template
+        self.invoice_data = invoice_data
+        self.field_confidence = field_confidence
+
+    @property
+    def confidence(self) -> float:
+        """Weakest required field; the template is only as good as its worst field."""
+        return min(self.field_confidence.get(f, 0.0) for f in REQUIRED_FIELDS)
+
+    def low_confidence_fields(self, threshold: float) -> List[str]:
+        return [f for f in REQUIRED_FIELDS if self.field_confidence.get(f, 0.0) < threshold]
+
+
+class SuperStoreTemplate:
+    """
+    Layout used by every invoice in ``data/invoices``:
+    header (# number, Bill To, Ship To, due date, ship mode, balance due),
+    an Item/Quantity/Rate/Amount table, a Subtotal/[Discount]/Shipping/Total
+    block and an ``Order ID :`` footer.
+    """
+
+    name = "superstore_v1"
+
+    def matches(self, text: str) -> bool:
+        return all(marker in text for marker in ("INVOICE", "Bill To:", "Order ID", "Subtotal:", "Total:"))
+
+    def parse(self, text: str) -> Optional[TemplateParseResult]:
+        lines = [ln.strip() for ln in (text or "").splitlines() if ln.strip()]
+        if not lines or not self.matches(text):
+            return None
+
+        data: Dict[str, Any] = {}
+        conf: Dict[str, float] = {}
+
+        # --- Identifiers -------------------------------------------------
+        data["invoice_number"], conf["invoice_number"] = self._first_match(lines, INVOICE_NO_RE)
+        order = ORDER_ID_RE.search(text)
+        data["order_id"] = order.group(1) if order else ""
+        conf["order_id"] = 1.0 if order else 0.0
+
+        # --- Parties / shipping -----------------------------------------
+        data["customer_name"] = self._line_after(lines, "Bill To:")
+        conf["customer_name"] = 1.0 if data["customer_name"] and not self._is_value_token(data["customer_name"]) else 0.0
+
+        ship_to = self._block_after(lines, "Ship To:")
+        data["ship_to"] = " ".join(ship_to)
+        conf["ship_to"] = 0.9 if ship_to else 0.0
+
+        dates = [ln for ln in lines if DATE_RE.match(ln)]
+        data["due_date"] = dates[0] if dates else ""
+        conf["due_date"] = 1.0 if len(dates) == 1 and "Due Date:" in lines else (0.5 if dates else 0.0)
+
+        modes = [ln for ln in lines if ln in SHIP_MODES]
+        data["ship_mode"] = modes[0] if modes else ""
+        conf["ship_mode"] = 1.0 if len(modes) == 1 else 0.0
+
+        # --- Item table and summary block -------------------------------
+        table = self._table_section(lines)
+        if table is None:
+            return None
+        item_lines, summary_labels, summary_values = table
+
+        items, items_ok = self._parse_items(item_lines)
+        data["item_details"] = items
+        conf["item_details"] = 1.0 if items and items_ok else (0.3 if items else 0.0)
+
+        summary = dict(zip(summary_labels, summary_values))
+        data["subtotal"] = summary.get("subtotal", 0.0)
+        data["discount"] = summary.get("discount", 0.0)
+        data["shipping_cost"] = summary.get("shipping", 0.0)
+        data["total"] = summary.get("total", 0.0)
+
+        items_sum = round(sum(it["amount"] for it in items), 2)
+        conf["subtotal"] = 1.0 if "subtotal" in summary and amounts_match(items_sum, data["subtotal"]) else 0.4
+
+        computed_total = data["subtotal"] - data["discount"] + data["shipping_cost"]
+        balance_due = self._balance_due(lines)
+        total_ok = "total" in summary and amounts_match(computed_total, data["total"], 0.02)
+        if balance_due is not None and not amounts_match(balance_due, data["total"]):
+            total_ok = False
+        conf["total"] = 1.0 if total_ok else 0.4
+        conf["discount"] = conf["total"] if "discount" in summary else 1.0
+        conf["shipping_cost"] = conf["total"] if "shipping" in summary else 0.5
+
+        return TemplateParseResult(self.name, data, conf)
+
+    # ------------------------------------------------------------------
+    # Helpers
+    # ------------------------------------------------------------------
+    def _first_match(self, lines: List[str], pattern: re.Pattern) -> Tuple[str, float]:
+        for ln in lines:
+            m = pattern.match(ln)
+            if m:
+                return m.group(1), 1.0
+        return "", 0.0
+
+    def _line_after(self, lines: List[str], label: str) -> str:
+        try:
+            idx = lines.index(label)
+        except ValueError:
+            return ""
+        return lines[idx + 1] if idx + 1 < len(lines) else ""
+
+    def _is_value_token(self, line: str) -> bool:
+        return bool(
+            MONEY_RE.match(line) or DATE_RE.match(line) or line in SHIP_MODES or line.endswith(":")
+        )
+
+    def _block_after(self, lines: List[str], label: str) -> List[str]:
+        try:
+            idx = lines.index(label)
+        except ValueError:
+            return []
+        block = []
+        for ln in lines[idx + 1:]:
+            if self._is_value_token(ln):
+                break
+            block.append(ln)
+        return block
+
+    def _balance_due(self, lines: List[str]) -> Optional[float]:
+        """Balance due is the only money value printed above the item table."""
+        try:
+            header_end = lines.index("Item")
+        except ValueError:
+            return None
+        money = [ln for ln in lines[:header_end] if MONEY_RE.match(ln)]
+        return parse_money(money[0]) if len(money) == 1 else None
+
+    def _table_section(self, lines: List[str]):
+        """Split the table into item lines and the (label, value) summary block."""
+        try:
+            start = lines.index("Amount") + 1
+            sub_idx = lines.index("Subtotal:")
+        except ValueError:
+            return None
+
+        labels = []
+        for ln in lines[sub_idx:]:
+            key = ln.rstrip(":").split(" (")[0].strip().lower()
+            if key in ("subtotal", "discount", "shipping", "total"):
+                labels.append(key)
+            elif labels:
+                break
+
+        body = lines[start:sub_idx]
+        if len(body) < len(labels) or not labels:
+            return None
+        values = body[len(body) - len(labels):]
+        if not all(MONEY_RE.match(v) for v in values):
+            return None
+        return body[:len(body) - len(labels)], labels, [parse_money(v) for v in values]
+
+    def _parse_items(self, lines: List[str]) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Rows are printed as: name line(s), quantity, $rate, $amount, then the
+        wrapped remainder of the description ending in the SKU.
+        """
+        items: List[Dict[str, Any]] = []
+        name_parts: List[str] = []
+        current: Optional[Dict[str, Any]] = None
+        ok = True
+        i = 0
+
+        def _finish():
+            nonlocal current, name_parts
+            if current is not None:
+                current["item_name"] = " ".join(name_parts).strip()
+                current["category"] = self._category(current["item_name"])
+                items.append(current)
+            current, name_parts = None, []
+
+        while i < len(lines):
+            ln = lines[i]
+            is_row = (
+                INT_RE.match(ln)
+                and i + 2 < len(lines)
+                and MONEY_RE.match(lines[i + 1])
+                and MONEY_RE.match(lines[i + 2])
+            )
+            if is_row and current is None:
+                qty = int(ln)
+                rate = parse_money(lines[i + 1])
+                amount = parse_money(lines[i + 2])
+                # rates are printed rounded, so allow half a cent per unit
+                if not amounts_match(qty * rate, amount, qty * 0.005 + 0.011):
+                    ok = False
+                current = {"quantity": qty, "rate": rate, "amount": amount}
+                i += 3
+                continue
+            if is_row:
+                # a new row started without an SKU line closing the previous one
+                _finish()
+                continue
+            name_parts.append(ln)
+            if current is not None and SKU_RE.search(ln):
+                _finish()
+            i += 1
+
+        if current is not None:
+            _finish()
+        elif name_parts:
+            ok = False  # trailing text that never became a row
+        return items, ok
+
+    def _category(self, item_name: str) -> str:
+        parts = [p.strip() for p in item_name.split(",")]
+        if len(parts) >= 3 and SKU_RE.search(parts[-1]):
+            return parts[-2]
+        return ""
+
+
+class TemplateParser:
+    """Tries each registered layout template in order."""
+
+    def __init__(self, templates: Optional[List[Any]] = None):
+        self.templates = templates or [SuperStoreTemplate()]
+
+    def parse(self, text: str) -> Optional[TemplateParseResult]:
+        for template in self.templates:
+            try:
+                result = template.parse(text)
+            except Exception:
+                result = None
+            if result is not None:
+                return result
+        return None
@@ -0,0 +1,520 @@
+"""
+Layout templates induced from past LLM extractions.
+
+After Gemini extracts an invoice, ``LayoutTemplateStore.learn`` records where
+each extracted value sits on the page: the PyMuPDF word box of the value,
+stored relative to the nearest printed label (``"Total:"``, ``"Bill To:"``)
+so it survives rows shifting up or down, plus the column bands of the item
+table. Templates are indexed by a layout fingerprint built from the label
+text and horizontal positions, so a later document from the same vendor is
+extracted by coordinate lookup without calling the LLM.
+
+Every lookup result is arithmetically reconciled (qty x rate = amount,
+items = subtotal, subtotal - discount + shipping = total); a template that
+keeps producing mismatches is dropped so the next document re-learns it.
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+
+from utils.invoice_templates import MONEY_RE, INT_RE, parse_money, amounts_match
+from utils.logger import get_logger
+
+
+TEXT_FIELDS = ("invoice_number", "order_id", "customer_name", "ship_to", "due_date", "ship_mode")
+AMOUNT_FIELDS = ("subtotal", "discount", "shipping_cost", "total")
+
+# A learned template must locate these to be worth storing
+LEARN_REQUIRED = ("invoice_number", "total", "item_details")
+
+ROW_TOLERANCE = 3.0   # points; words whose centers are this close share a row
+BOX_TOLERANCE = 4.0   # points of slack around a learned value box
+BAND_PADDING = 6.0    # points of slack around a learned table column
+
+
+def reconcile_invoice(data: Dict[str, Any]) -> List[str]:
+    """Arithmetic cross-checks on an ``invoice_data`` dict; returns the failed checks."""
+    issues = []
+    items = data.get("item_details") or []
+    for idx, item in enumerate(items):
+        try:
+            qty = float(item.get("quantity") or 0)
+            rate = float(item.get("rate") or 0)
+            amount = float(item.get("amount") or 0)
+        except (TypeError, ValueError):
+            issues.append(f"item {idx}: non-numeric amounts")
+            continue
+        # rates are printed rounded, so allow half a cent per unit
+        if not amounts_match(qty * rate, amount, qty * 0.005 + 0.011):
+            issues.append(f"item {idx}: quantity x rate != amount")
+
+    subtotal = float(data.get("subtotal") or 0)
+    total = float(data.get("total") or 0)
+    if items and subtotal and not amounts_match(sum(float(i.get("amount") or 0) for i in items), subtotal, 0.02):
+        issues.append("items do not sum to subtotal")
+    if subtotal and total:
+        computed = subtotal - abs(float(data.get("discount") or 0)) + float(data.get("shipping_cost") or 0)
+        if not amounts_match(computed, total, 0.02):
+            issues.append("subtotal - discount + shipping != total")
+    if not total:
+        issues.append("missing total")
+    return issues
+
+
+# ----------------------------------------------------------------------
+# Page model built from PyMuPDF words
+# ----------------------------------------------------------------------
+def _norm(text: str) -> str:
+    return " ".join(str(text or "").lower().split())
+
+
+def _label_key(text: str) -> str:
+    """Label identity without digits, so 'Discount (10%):' matches 'Discount (5%):'."""
+    return re.sub(r"\d+", "", _norm(text))
+
+
+def _money(text: str) -> Optional[float]:
+    if not MONEY_RE.match(text):
+        return None
+    try:
+        return parse_money(text)
+    except ValueError:
+        return None
+
+
+def _bbox(words: List[list]) -> List[float]:
+    return [min(w[1] for w in words), min(w[2] for w in words),
+            max(w[3] for w in words), max(w[4] for w in words)]
+
+
+class _Page:
+    """Words grouped into lines, blocks and visual rows for one document."""
+
+    def __init__(self, words: List[list]):
+        self.words = [list(w) for w in words]
+        self.lines: Dict[Tuple[int, int, int], List[list]] = {}
+        self.blocks: Dict[Tuple[int, int], List[list]] = {}
+        for w in self.words:
+            self.lines.setdefault((w[0], w[6], w[7]), []).append(w)
+            self.blocks.setdefault((w[0], w[6]), []).append(w)
+        for group in list(self.lines.values()) + list(self.blocks.values()):
+            group.sort(key=lambda w: (w[7], w[8]))
+
+        # label lines ("Total:", "Bill To:") are the anchors for every field
+        self.labels = []
+        for key, line in sorted(self.lines.items(), key=lambda kv: (kv[0][0], _bbox(kv[1])[1], _bbox(kv[1])[0])):
+            text = " ".join(w[5] for w in line)
+            if text.endswith(":"):
+                self.labels.append({"key": _label_key(text), "page": key[0], "bbox": _bbox(line)})
+
+        self.rows = self._rows()
+
+    def _rows(self) -> List[List[list]]:
+        rows: List[List[list]] = []
+        for w in sorted(self.words, key=lambda w: (w[0], (w[2] + w[4]) / 2, w[1])):
+            yc = (w[2] + w[4]) / 2
+            if rows and rows[-1][0][0] == w[0] and abs((rows[-1][0][2] + rows[-1][0][4]) / 2 - yc) <= ROW_TOLERANCE:
+                rows[-1].append(w)
+            else:
+                rows.append([w])
+        for row in rows:
+            row.sort(key=lambda w: w[1])
+        return rows
+
+    def line_of(self, word: list) -> List[list]:
+        return self.lines[(word[0], word[6], word[7])]
+
+    def block_of(self, word: list) -> List[list]:
+        return self.blocks[(word[0], word[6])]
+
+    def find_label(self, key: str, page: int) -> Optional[Dict[str, Any]]:
+        for label in self.labels:
+            if label["key"] == key and label["page"] == page:
+                return label
+        return None
+
+    def fingerprint(self) -> str:
+        parts = sorted({f"{l['page']}|{l['key']}|{int(l['bbox'][0] // 10)}" for l in self.labels})
+        return hashlib.sha1("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+class LayoutTemplateStore:
+    """Fingerprint-indexed store of learned layouts, persisted as JSON."""
+
+    def __init__(
+        self,
+        path: str = os.path.join("output", "cache", "layout_templates.json"),
+        max_mismatches: int = 2,
+        max_templates: int = 500,
+        enabled: bool = True,
+    ):
+        self.path = path
+        self.max_mismatches = max(1, int(max_mismatches))
+        self.max_templates = max(1, int(max_templates))
+        self.enabled = enabled
+        self.logger = get_logger("LayoutTemplateStore")
+
+        self._lock = threading.Lock()
+        self._templates: Dict[str, Dict[str, Any]] = {}
+        self._stats = {"lookups": 0, "hits": 0, "misses": 0, "mismatches": 0,
+                       "learned": 0, "invalidated": 0}
+        if self.enabled:
+            self._load()
+
+    # ------------------------------------------------------------------
+    # Lookup
+    # ------------------------------------------------------------------
+    @staticmethod
+    def fingerprint(words: List[list]) -> str:
+        return _Page(words).fingerprint()
+
+    def extract(self, words: List[list]) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """
+        Extract ``invoice_data`` by coordinate lookup. Returns
+        ``(fingerprint, invoice_data)`` only when a template exists and the
+        result reconciles; mismatches count towards invalidation.
+        """
+        if not self.enabled or not words:
+            return None
+
+        page = _Page(words)
+        fp = page.fingerprint()
+        with self._lock:
+            self._stats["lookups"] += 1
+            template = self._templates.get(fp)
+            if template is None:
+                self._stats["misses"] += 1
+                return None
+
+        data, issues = self._apply(page, template)
+        if issues:
+            self.record_mismatch(fp, issues)
+            return None
+
+        with self._lock:
+            self._stats["hits"] += 1
+            template["hits"] = template.get("hits", 0) + 1
+            template["consecutive_mismatches"] = 0
+            template["last_used"] = time.time()
+        return fp, data
+
+    def record_mismatch(self, fp: str, issues: List[str]):
+        """Count a bad extraction; drop the template once it keeps failing."""
+        with self._lock:
+            self._stats["mismatches"] += 1
+            template = self._templates.get(fp)
+            if template is None:
+                return
+            template["mismatches"] = template.get("mismatches", 0) + 1
+            template["consecutive_mismatches"] = template.get("consecutive_mismatches", 0) + 1
+            invalidate = template["consecutive_mismatches"] >= self.max_mismatches
+            if invalidate:
+                del self._templates[fp]
+                self._stats["invalidated"] += 1
+        self.logger.warning(f"Layout template {fp[:12]} mismatch: {issues}")
+        if invalidate:
+            self.logger.warning(f"Layout template {fp[:12]} invalidated after repeated mismatches")
+            self._save()
+
+    # ------------------------------------------------------------------
+    # Learning
+    # ------------------------------------------------------------------
+    def learn(self, words: List[list], invoice_data: Dict[str, Any]) -> Optional[str]:
+        """Record field positions from a trusted extraction; returns the fingerprint if stored."""
+        if not self.enabled or not words or reconcile_invoice(invoice_data):
+            return None
+
+        page = _Page(words)
+        fp = page.fingerprint()
+        fields: Dict[str, Any] = {}
+        for name in TEXT_FIELDS + AMOUNT_FIELDS:
+            value = invoice_data.get(name)
+            if value in (None, "", 0, 0.0):
+                continue
+            spec = self._locate(page, value, numeric=name in AMOUNT_FIELDS)
+            if spec:
+                fields[name] = spec
+
+        table = self._learn_table(page, invoice_data.get("item_details") or [])
+        if table:
+            fields["item_details"] = table
+        if any(f not in fields for f in LEARN_REQUIRED):
+            return None
+
+        # the learned template must reproduce the trusted extraction
+        template = {"fields": fields, "hits": 0, "mismatches": 0, "consecutive_mismatches": 0,
+                    "created_at": time.time(), "last_used": time.time()}
+        if self._apply(page, template)[1]:
+            return None
+
+        with self._lock:
+            self._templates[fp] = template
+            self._stats["learned"] += 1
+            if len(self._templates) > self.max_templates:
+                oldest = min(self._templates, key=lambda k: self._templates[k].get("last_used", 0))
+                del self._templates[oldest]
+        self.logger.info(f"Learned layout template {fp[:12]} ({len(fields)} fields)")
+        self._save()
+        return fp
+
+    # ------------------------------------------------------------------
+    # Stats / maintenance
+    # ------------------------------------------------------------------
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["templates"] = len(self._templates)
+        stats["hit_rate"] = round(stats["hits"] / stats["lookups"], 3) if stats["lookups"] else 0.0
+        stats["enabled"] = self.enabled
+        return stats
+
+    def clear(self):
+        with self._lock:
+            self._templates.clear()
+        self._save()
+
+    # ------------------------------------------------------------------
+    # Internals: locating values when learning
+    # ------------------------------------------------------------------
+    def _locate(self, page: _Page, value: Any, numeric: bool) -> Optional[Dict[str, Any]]:
+        """Find the smallest span holding ``value`` and describe it relative to a label."""
+        candidates = []
+        if numeric:
+            target = abs(float(value))
+            for w in page.words:
+                m = _money(w[5])
+                if m is not None and amounts_match(abs(m), target):
+                    candidates.append(("word", 0, [w]))
+        else:
+            target = _norm(value)
+            for line in page.lines.values():
+                texts = [_norm(w[5]) for w in line]
+                if " ".join(texts) == target:
+                    candidates.append(("line", 0, line))
+                    continue
+                for i in range(1, len(line)):
+                    if " ".join(texts[i:]) == target:
+                        candidates.append(("line_tail", i, line[i:]))
+                        break
+            if not candidates:
+                for block in page.blocks.values():
+                    if " ".join(_norm(w[5]) for w in block) == target:
+                        candidates.append(("block", 0, block))
+
+        best = None
+        for span, offset, span_words in candidates:
+            box = _bbox(span_words)
+            anchor, same_row = self._anchor_for(page, span_words[0][0], box)
+            score = (0 if same_row else 1, abs(box[1] - anchor["bbox"][1]) + abs(box[0] - anchor["bbox"][2]))
+            if best is None or score < best[0]:
+                best = (score, span, offset, box, anchor, span_words[0][0])
+        if best is None:
+            return None
+
+        _, span, offset, box, anchor, page_no = best
+        ax, ay = anchor["bbox"][0], anchor["bbox"][1]
+        return {
+            "page": page_no,
+            "anchor": anchor["key"],
+            "span": span,
+            "offset": offset,
+            "box": [box[0] - ax, box[1] - ay, box[2] - ax, box[3] - ay],
+        }
+
+    def _anchor_for(self, page: _Page, page_no: int, box: List[float]) -> Tuple[Dict[str, Any], bool]:
+        """Label on the same row to the left, else the nearest label above, else the page origin."""
+        same_row, above = [], []
+        for label in page.labels:
+            if label["page"] != page_no:
+                continue
+            lb = label["bbox"]
+            overlap = min(lb[3], box[3]) - max(lb[1], box[1])
+            if overlap > 0.5 * (box[3] - box[1]) and lb[2] <= box[0] + 1:
+                same_row.append((box[0] - lb[2], label))
+            elif lb[3] <= box[1] + 1:
+                above.append((box[1] - lb[3] + abs(box[0] - lb[0]) * 0.1, label))
+        if same_row:
+            return min(same_row, key=lambda x: x[0])[1], True
+        if above:
+            return min(above, key=lambda x: x[0])[1], False
+        return {"key": "", "page": page_no, "bbox": [0.0, 0.0, 0.0, 0.0]}, False
+
+    def _learn_table(self, page: _Page, items: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Column bands of the item table, learned from the first item's row."""
+        if not items:
+            return None
+        first = items[0]
+        try:
+            qty, rate, amount = int(first.get("quantity")), float(first.get("rate")), float(first.get("amount"))
+        except (TypeError, ValueError):
+            return None
+
+        for idx, row in enumerate(page.rows):
+            q = next((w for w in row if INT_RE.match(w[5]) and int(w[5]) == qty), None)
+            r = next((w for w in row if _money(w[5]) is not None and amounts_match(_money(w[5]), rate)), None)
+            a = next((w for w in row if _money(w[5]) is not None and amounts_match(_money(w[5]), amount)
+                      and w is not r), None)
+            if not (q and r and a and q[1] < r[1] < a[1]) or idx == 0:
+                continue
+
+            header = page.rows[idx - 1]
+            bands = {}
+            for name, word in (("quantity", q), ("rate", r), ("amount", a)):
+                head = min(header, key=lambda h: abs((h[1] + h[3]) / 2 - (word[1] + word[3]) / 2))
+                bands[name] = [min(word[1], head[1]) - BAND_PADDING, max(word[3], head[3]) + BAND_PADDING]
+
+            table = {"header": _norm(" ".join(w[5] for w in header)), "bands": bands,
+                     "lines_after": 0}
+            # how many wrapped description rows follow the numeric row
+            for follow in page.rows[idx + 1:]:
+                if self._row_is_table_end(page, follow) or self._numeric_row(follow, bands):
+                    break
+                table["lines_after"] += 1
+            return table
+        return None
+
+    # ------------------------------------------------------------------
+    # Internals: applying a template
+    # ------------------------------------------------------------------
+    def _apply(self, page: _Page, template: Dict[str, Any]) -> Tuple[Dict[str, Any], List[str]]:
+        """Read every learned field; returns the data and any missing-field or arithmetic issues."""
+        data: Dict[str, Any] = {}
+        for name, spec in template["fields"].items():
+            if name == "item_details":
+                data[name] = self._read_table(page, spec)
+                continue
+            text = self._read_field(page, spec)
+            if text is None:
+                continue
+            if name in AMOUNT_FIELDS:
+                value = _money(text)
+                if value is not None:
+                    data[name] = abs(value)
+            else:
+                data[name] = text
+
+        missing = [f"{f} not found" for f in template["fields"] if not data.get(f)]
+        return data, missing + reconcile_invoice(data)
+
+    def _read_field(self, page: _Page, spec: Dict[str, Any]) -> Optional[str]:
+        if spec["anchor"]:
+            anchor = page.find_label(spec["anchor"], spec["page"])
+            if anchor is None:
+                return None
+            ax, ay = anchor["bbox"][0], anchor["bbox"][1]
+        else:
+            ax = ay = 0.0
+
+        x0, y0, x1, y1 = spec["box"]
+        x0, x1 = ax + x0 - BOX_TOLERANCE, ax + x1 + BOX_TOLERANCE
+        y0, y1 = ay + y0 - BOX_TOLERANCE, ay + y1 + BOX_TOLERANCE
+        seeds = [
+            w for w in page.words
+            if w[0] == spec["page"] and w[3] >= x0 and w[1] <= x1 and y0 <= (w[2] + w[4]) / 2 <= y1
+        ]
+        if not seeds:
+            return None
+        seed = min(seeds, key=lambda w: (w[2], w[1]))
+
+        if spec["span"] == "word":
+            return seed[5]
+        if spec["span"] == "block":
+            # wrapped values share the block and left edge of their first line;
+            # PyMuPDF sometimes folds neighbouring values into the same block
+            left = _bbox(page.line_of(seed))[0]
+            words = [w for w in page.block_of(seed)
+                     if w[7] >= seed[7] and abs(_bbox(page.line_of(w))[0] - left) <= ROW_TOLERANCE]
+        else:
+            words = page.line_of(seed)
+            if spec["span"] == "line_tail":
+                words = words[spec["offset"]:]
+        return " ".join(w[5] for w in words) or None
+
+    def _numeric_row(self, row: List[list], bands: Dict[str, List[float]]) -> Optional[Dict[str, list]]:
+        cols = {}
+        for name, (lo, hi) in bands.items():
+            word = next((w for w in row if w[3] >= lo and w[1] <= hi), None)
+            if word is None:
+                return None
+            cols[name] = word
+        if INT_RE.match(cols["quantity"][5]) and _money(cols["rate"][5]) is not None \
+                and _money(cols["amount"][5]) is not None:
+            return cols
+        return None
+
+    def _row_is_table_end(self, page: _Page, row: List[list]) -> bool:
+        top, bottom = min(w[2] for w in row), max(w[4] for w in row)
+        return any(
+            l["page"] == row[0][0] and min(l["bbox"][3], bottom) - max(l["bbox"][1], top) > 0
+            for l in page.labels
+        )
+
+    def _read_table(self, page: _Page, spec: Dict[str, Any]) -> List[Dict[str, Any]]:
+        bands = spec["bands"]
+        start = next((i for i, row in enumerate(page.rows)
+                      if _norm(" ".join(w[5] for w in row)) == spec["header"]), None)
+        if start is None:
+            return []
+
+        name_limit = bands["quantity"][0]
+        items: List[Dict[str, Any]] = []
+        prefix: List[str] = []
+        trailing = 0
+        for row in page.rows[start + 1:]:
+            if self._row_is_table_end(page, row):
+                break
+            name = " ".join(w[5] for w in row if w[3] <= name_limit)
+            cols = self._numeric_row(row, bands)
+            if cols:
+                items.append({
+                    "item_name": " ".join(prefix + ([name] if name else [])),
+                    "quantity": int(cols["quantity"][5]),
+                    "rate": _money(cols["rate"][5]),
+                    "amount": _money(cols["amount"][5]),
+                })
+                prefix, trailing = [], 0
+            elif name:
+                # wrapped description: the learned number of rows continues the
+                # current item, anything beyond that starts the next one
+                if items and trailing < spec.get("lines_after", 0):
+                    items[-1]["item_name"] = f"{items[-1]['item_name']} {name}".strip()
+                    trailing += 1
+                else:
+                    prefix.append(name)
+        if prefix and items:
+            items[-1]["item_name"] = f"{items[-1]['item_name']} {' '.join(prefix)}".strip()
+        return items
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._templates = json.load(f).get("templates", {})
+        except FileNotFoundError:
+            self._templates = {}
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Could not load layout templates from {self.path}: {e}")
+            self._templates = {}
+
+    def _save(self):
+        if not self.enabled:
+            return
+        with self._lock:
+            payload = json.dumps({"templates": self._templates})
+        tmp_path = f"{self.path}.tmp"
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(payload)
+            os.replace(tmp_path, self.path)  # atomic publish
+        except OSError as e:
+            self.logger.warning(f"Layout template write failed: {e}")
@@ -0,0 +1,65 @@
+"""
+Pluggable LLM backends.
+
+Agents talk to an ``LLMBackend`` rather than to Gemini directly, so the model
+provider can be swapped without touching agent code. Two backends are
+registered:
+
+- ``gemini``: the shared ``LLMGateway`` (real API, key pool, rate limits)
+- ``fake``:   the same gateway driven by ``FakeLLM``, a deterministic local
+  stand-in with configurable latency, error rate and 429 injection for offline
+  load and latency testing
+
+The backend is chosen per agent via the ``llm_backend`` config key, falling
+back to the ``LLM_BACKEND`` environment variable (default ``gemini``).
+"""
+
+import os
+from abc import ABC, abstractmethod
+from typing import Dict, Any, Callable, Optional
+
+
+class LLMBackend(ABC):
+    """Minimal text-in/text-out interface every agent uses for LLM calls."""
+
+    name = "base"
+
+    @property
+    @abstractmethod
+    def available(self) -> bool:
+        """Whether calls can be made at all (e.g. an API key is configured)."""
+
+    @abstractmethod
+    async def generate(self, prompt: str, model: str) -> str:
+        """Return the completion text for ``prompt``."""
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name}
+
+
+_BACKENDS: Dict[str, Callable[[], LLMBackend]] = {}
+
+
+def register_backend(name: str, factory: Callable[[], LLMBackend]):
+    """Register a zero-argument factory; factories should return shared instances."""
+    _BACKENDS[name] = factory
+
+
+def get_llm_backend(name: Optional[str] = None) -> LLMBackend:
+    name = (name or os.getenv("LLM_BACKEND", "gemini")).strip().lower()
+    if not _BACKENDS:
+        _register_defaults()
+    try:
+        factory = _BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown LLM backend '{name}' (available: {sorted(_BACKENDS)})")
+    return factory()
+
+
+def _register_defaults():
+    # imported lazily: both modules import this one for the base class
+    from utils.llm_gateway import get_llm_gateway
+    from utils.fake_llm import get_fake_llm_backend
+
+    register_backend("gemini", get_llm_gateway)
+    register_backend("fake", get_fake_llm_backend)
@@ -0,0 +1,166 @@
+"""
+Persistent response cache for LLM calls.
+
+Responses are keyed on a hash of the whitespace-normalized prompt, the model
+name and a prompt-schema version, so identical extraction requests (re-runs,
+backfills) are answered without a round-trip to the model. Entries live in a
+stdlib sqlite3 database so they survive restarts, and are evicted by TTL and
+by capacity (least recently used first).
+"""
+
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Dict, Any, Optional
+
+from utils.logger import get_logger
+
+
+class LLMResponseCache:
+    """SQLite-backed LLM response cache with TTL and LRU capacity eviction."""
+
+    def __init__(
+        self,
+        db_path: str = os.path.join("output", "cache", "llm_responses.sqlite3"),
+        ttl_seconds: float = 7 * 24 * 3600,
+        max_entries: int = 10000,
+        enabled: bool = True,
+    ):
+        self.db_path = db_path
+        self.ttl_seconds = float(ttl_seconds)
+        self.max_entries = max(1, int(max_entries))
+        self.enabled = enabled
+        self.logger = get_logger("LLMResponseCache")
+
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._stats = {"hits": 0, "misses": 0, "expired": 0, "writes": 0, "evictions": 0}
+
+        if self.enabled:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS llm_responses (
+                    cache_key   TEXT PRIMARY KEY,
+                    model       TEXT NOT NULL,
+                    response    TEXT NOT NULL,
+                    created_at  REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_llm_last_access ON llm_responses(last_access)"
+            )
+            self._conn.commit()
+
+    # ------------------------------------------------------------------
+    # Keys
+    # ------------------------------------------------------------------
+    @staticmethod
+    def normalize_prompt(prompt: str) -> str:
+        """Collapse whitespace so formatting-only differences share an entry."""
+        return " ".join((prompt or "").split())
+
+    @classmethod
+    def make_key(cls, prompt: str, model: str, schema_version: str) -> str:
+        digest = hashlib.sha256(cls.normalize_prompt(prompt).encode("utf-8")).hexdigest()
+        return hashlib.sha256(f"{model}|{schema_version}|{digest}".encode("utf-8")).hexdigest()
+
+    # ------------------------------------------------------------------
+    # Lookup / Store
+    # ------------------------------------------------------------------
+    def get(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM llm_responses WHERE cache_key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self._stats["misses"] += 1
+                return None
+
+            response, created_at = row
+            if now - created_at > self.ttl_seconds:
+                self._conn.execute("DELETE FROM llm_responses WHERE cache_key = ?", (key,))
+                self._conn.commit()
+                self._stats["expired"] += 1
+                self._stats["misses"] += 1
+                return None
+
+            self._conn.execute(
+                "UPDATE llm_responses SET last_access = ? WHERE cache_key = ?", (now, key)
+            )
+            self._conn.commit()
+            self._stats["hits"] += 1
+            return response
+
+    def put(self, key: str, response: str, model: str):
+        if not self.enabled or not response:
+            return
+
+        now = time.time()
+        with self._lock:
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO llm_responses "
+                    "(cache_key, model, response, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                    (key, model, response, now, now),
+                )
+                self._stats["writes"] += 1
+                self._evict(now)
+                self._conn.commit()
+            except sqlite3.Error as e:
+                self.logger.warning(f"LLM cache write failed: {e}")
+
+    def clear(self):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_responses")
+            self._conn.commit()
+
+    # ------------------------------------------------------------------
+    # Stats
+    # ------------------------------------------------------------------
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = (
+                self._conn.execute("SELECT COUNT(*) FROM llm_responses").fetchone()[0]
+                if self.enabled else 0
+            )
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        stats["enabled"] = self.enabled
+        return stats
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+    def _evict(self, now: float):
+        """Drop expired rows, then the least recently used beyond capacity (caller holds the lock)."""
+        cur = self._conn.execute(
+            "DELETE FROM llm_responses WHERE created_at < ?", (now - self.ttl_seconds,)
+        )
+        evicted = cur.rowcount or 0
+
+        count = self._conn.execute("SELECT COUNT(*) FROM llm_responses").fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            cur = self._conn.execute(
+                "DELETE FROM llm_responses WHERE cache_key IN ("
+                "SELECT cache_key FROM llm_responses ORDER BY last_access ASC LIMIT ?)",
+                (overflow,),
+            )
+            evicted += cur.rowcount or 0
+
+        self._stats["evictions"] += evicted
@@ -0,0 +1,313 @@
+"""
+Shared gateway for Gemini calls.
+
+``genai.configure`` is process-global, so agents configuring their own key
+(``GEMINI_API_KEY_1`` … ``_5``) silently overwrite each other, and every call
+built a fresh ``GenerativeModel`` on the default thread pool with no rate
+control. ``LLMGateway`` instead holds one ``GenerativeServiceClient`` per API
+key and caches a model per (key, model name). Each key has a token bucket, and
+each (key, model) pair has its own bucket for the per-model quota. Calls go to
+the least-loaded key that is not cooling down after a 429, and run on a
+dedicated, sized executor. Throughput therefore scales with the number of keys.
+
+The per-key call itself is a pluggable ``transport`` (Gemini by default), which
+lets ``utils.fake_llm`` stand in for the API while still exercising the
+gateway's rate limiting and 429 handling.
+"""
+
+import os
+import time
+import random
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Tuple, Callable
+
+from utils.llm_backend import LLMBackend
+from utils.logger import get_logger
+
+
+def load_api_keys() -> List[str]:
+    """``GEMINI_API_KEYS`` (comma separated), ``GEMINI_API_KEY`` and ``GEMINI_API_KEY_1``… in order, de-duplicated."""
+    keys = [k.strip() for k in os.getenv("GEMINI_API_KEYS", "").split(",")]
+    keys.append(os.getenv("GEMINI_API_KEY", ""))
+    i = 1
+    while os.getenv(f"GEMINI_API_KEY_{i}") is not None or i <= 5:
+        keys.append(os.getenv(f"GEMINI_API_KEY_{i}", ""))
+        i += 1
+    seen, ordered = set(), []
+    for key in keys:
+        if key and key not in seen:
+            seen.add(key)
+            ordered.append(key)
+    return ordered
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """True for quota / 429 responses, whichever client layer raised them."""
+    code = getattr(error, "code", None)
+    if code == 429 or getattr(code, "value", None) == 429:
+        return True
+    name = type(error).__name__
+    text = str(error)
+    return name in ("ResourceExhausted", "TooManyRequests", "RateLimitError") or "429" in text \
+        or "RESOURCE_EXHAUSTED" in text
+
+
+class TokenBucket:
+    """Classic token bucket; ``reserve`` returns how long the caller must wait."""
+
+    def __init__(self, rate_per_minute: float, burst: Optional[float] = None):
+        self.rate = max(float(rate_per_minute), 0.001) / 60.0
+        self.capacity = float(burst) if burst else max(1.0, self.rate * 60.0 / 4)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def available(self, now: float) -> float:
+        self._refill(now)
+        return self.tokens
+
+    def reserve(self, now: float) -> float:
+        """Take a token (possibly going negative) and return the wait in seconds."""
+        self._refill(now)
+        self.tokens -= 1.0
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class _KeySlot:
+    def __init__(self, index: int, api_key: str, rpm: float):
+        self.index = index
+        self.api_key = api_key
+        self.bucket = TokenBucket(rpm)
+        self.model_buckets: Dict[str, TokenBucket] = {}
+        self.models: Dict[str, Any] = {}
+        self.client = None
+        self.in_flight = 0
+        self.cooldown_until = 0.0
+        self.consecutive_429 = 0
+        self.stats = {"requests": 0, "rate_limited": 0, "errors": 0, "cancelled": 0}
+
+
+class LLMGateway(LLMBackend):
+    """Per-key Gemini clients with rate limiting, least-loaded routing and 429 backoff."""
+
+    name = "gemini"
+
+    def __init__(
+        self,
+        api_keys: Optional[List[str]] = None,
+        requests_per_minute: float = 15.0,
+        model_rpm: Optional[Dict[str, float]] = None,
+        max_workers: int = 8,
+        max_retries: int = 4,
+        base_backoff_s: float = 2.0,
+        max_backoff_s: float = 60.0,
+        timeout_s: float = 60.0,
+        transport: Optional[Callable[[str, str, str], str]] = None,
+    ):
+        self.api_keys = list(api_keys if api_keys is not None else load_api_keys())
+        self.requests_per_minute = float(requests_per_minute)
+        self.model_rpm = dict(model_rpm or {})
+        self.max_workers = max(1, int(max_workers))
+        self.max_retries = max(0, int(max_retries))
+        self.base_backoff_s = float(base_backoff_s)
+        self.max_backoff_s = float(max_backoff_s)
+        self.timeout_s = float(timeout_s)
+        self.transport = transport
+        self.logger = get_logger("LLMGateway")
+
+        self._slots = [_KeySlot(i, key, self.requests_per_minute) for i, key in enumerate(self.api_keys)]
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._stats = {"requests": 0, "successes": 0, "failures": 0, "retries": 0,
+                       "rate_limited": 0, "throttled_s": 0.0}
+
+    @property
+    def available(self) -> bool:
+        return bool(self._slots)
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+    async def generate(self, prompt: str, model: str) -> str:
+        """Return the text of a Gemini completion for ``prompt``."""
+        if not self._slots:
+            raise RuntimeError("No Gemini API key configured")
+
+        self._stats["requests"] += 1
+        last_error: Optional[Exception] = None
+        for attempt in range(self.max_retries + 1):
+            slot, wait = self._acquire(model)
+            released = False
+            # every acquire is released exactly once, cancellation included
+            try:
+                if wait > 0:
+                    self._stats["throttled_s"] += wait
+                    await asyncio.sleep(wait)
+                future = asyncio.get_running_loop().run_in_executor(
+                    self._get_executor(), self._call, slot, model, prompt
+                )
+                text = await asyncio.wait_for(future, timeout=self.timeout_s)
+                released = True
+                self._release(slot, ok=True)
+                self._stats["successes"] += 1
+                return text
+            except Exception as e:
+                last_error = e
+                released = True
+                if is_rate_limit_error(e):
+                    backoff = self._release(slot, ok=False, rate_limited=True)
+                    self._stats["rate_limited"] += 1
+                    self.logger.warning(
+                        f"Gemini 429 on key #{slot.index + 1}; cooling down {backoff:.1f}s "
+                        f"(attempt {attempt + 1}/{self.max_retries + 1})"
+                    )
+                    if attempt < self.max_retries:
+                        self._stats["retries"] += 1
+                        continue
+                else:
+                    self._release(slot, ok=False)
+                break
+            finally:
+                if not released:
+                    # cancelled (caller timeout / shutdown): free the slot, no error on the key
+                    self._release(slot, ok=False, cancelled=True)
+
+        self._stats["failures"] += 1
+        raise last_error
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            stats = dict(self._stats)
+            stats["throttled_s"] = round(stats["throttled_s"], 3)
+            stats["keys"] = [
+                {
+                    "key": f"#{s.index + 1}",
+                    "in_flight": s.in_flight,
+                    "cooling_down_s": round(max(0.0, s.cooldown_until - now), 1),
+                    "tokens": round(s.bucket.available(now), 2),
+                    **s.stats,
+                }
+                for s in self._slots
+            ]
+        stats.update({
+            "backend": self.name,
+            "requests_per_minute": self.requests_per_minute,
+            "max_workers": self.max_workers,
+        })
+        return stats
+
+    def shutdown(self, wait: bool = True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait=wait)
+
+    # ------------------------------------------------------------------
+    # Key selection / accounting
+    # ------------------------------------------------------------------
+    def _model_bucket(self, slot: _KeySlot, model: str) -> TokenBucket:
+        bucket = slot.model_buckets.get(model)
+        if bucket is None:
+            bucket = TokenBucket(self.model_rpm.get(model, self.requests_per_minute))
+            slot.model_buckets[model] = bucket
+        return bucket
+
+    def _acquire(self, model: str) -> Tuple[_KeySlot, float]:
+        """Pick the least-loaded usable key and reserve a token on its buckets."""
+        now = time.monotonic()
+        with self._lock:
+            def load(slot: _KeySlot):
+                cooling = max(0.0, slot.cooldown_until - now)
+                tokens = min(slot.bucket.available(now), self._model_bucket(slot, model).available(now))
+                return (cooling, slot.in_flight, -tokens)
+
+            slot = min(self._slots, key=load)
+            wait = max(
+                slot.cooldown_until - now,
+                slot.bucket.reserve(now),
+                self._model_bucket(slot, model).reserve(now),
+                0.0,
+            )
+            slot.in_flight += 1
+            slot.stats["requests"] += 1
+        return slot, wait
+
+    def _release(self, slot: _KeySlot, ok: bool, rate_limited: bool = False, cancelled: bool = False) -> float:
+        backoff = 0.0
+        with self._lock:
+            slot.in_flight -= 1
+            if cancelled:
+                slot.stats["cancelled"] += 1
+            elif ok:
+                slot.consecutive_429 = 0
+            elif rate_limited:
+                slot.consecutive_429 += 1
+                slot.stats["rate_limited"] += 1
+                backoff = min(self.max_backoff_s, self.base_backoff_s * 2 ** (slot.consecutive_429 - 1))
+                backoff *= random.uniform(0.8, 1.2)  # jitter so keys do not retry in lockstep
+                slot.cooldown_until = time.monotonic() + backoff
+            else:
+                slot.stats["errors"] += 1
+        return backoff
+
+    # ------------------------------------------------------------------
+    # Clients (run on the gateway executor)
+    # ------------------------------------------------------------------
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="llm")
+            return self._executor
+
+    def _model_for(self, slot: _KeySlot, model: str):
+        with self._lock:
+            cached = slot.models.get(model)
+            if cached is not None:
+                return cached
+
+            import google.generativeai as genai
+            from google.ai import generativelanguage as glm
+
+            if slot.client is None:
+                # one client per key instead of the process-global genai.configure
+                slot.client = glm.GenerativeServiceClient(client_options={"api_key": slot.api_key})
+            instance = genai.GenerativeModel(model)
+            instance._client = slot.client
+            slot.models[model] = instance
+            return instance
+
+    def _call(self, slot: _KeySlot, model: str, prompt: str) -> str:
+        if self.transport is not None:
+            return self.transport(slot.api_key, model, prompt)
+
+        response = self._model_for(slot, model).generate_content(prompt)
+        text = ""
+        if getattr(response, "text", None):
+            text = response.text.strip()
+        elif getattr(response, "parts", None):
+            text = " ".join(str(p.text) for p in response.parts if hasattr(p, "text"))
+        return text
+
+
+@lru_cache(maxsize=None)
+def get_llm_gateway() -> LLMGateway:
+    """Process-wide gateway configured from the environment, shared by every agent."""
+    model_rpm = {}
+    for item in os.getenv("GEMINI_MODEL_RPM", "").split(","):
+        if "=" in item:
+            name, rpm = item.split("=", 1)
+            model_rpm[name.strip()] = float(rpm)
+    return LLMGateway(
+        requests_per_minute=float(os.getenv("GEMINI_RPM_PER_KEY", "15")),
+        model_rpm=model_rpm,
+        max_workers=int(os.getenv("GEMINI_MAX_WORKERS", "8")),
+        max_retries=int(os.getenv("GEMINI_MAX_RETRIES", "4")),
+        timeout_s=float(os.getenv("GEMINI_TIMEOUT_S", "60")),
+    )
@@ -0,0 +1,344 @@
+"""
+Near-duplicate invoice index (MinHash + LSH).
+
+``duplicate_index`` only catches byte-identical PDFs and exact business keys.
+Re-typed or lightly edited invoices (new invoice number, shifted date,
+one amount changed) keep almost all of their text, so they are found by
+Jaccard similarity over word shingles of ``InvoiceData.raw_text``:
+
+- the text is lower-cased, tokenized and cut into ``shingle_size``-word
+  shingles, each hashed to 32 bits (CRC32, stable across processes)
+- a ``num_perm``-value MinHash signature is computed in one NumPy pass with
+  universal hashes ``(a * x + b) mod p``
+- the signature is split into ``bands`` bands of ``rows`` values; invoices
+  sharing any band bucket are candidates, and candidates are kept when the
+  fraction of equal signature values (the Jaccard estimate) reaches
+  ``threshold``
+
+Bands and rows are chosen from ``threshold`` so the LSH S-curve rises just
+below it. A query is one signature plus ``bands`` binary searches, which stays
+well under a millisecond at millions of invoices.
+
+Signatures are persisted in SQLite (one row per invoice, inserted as it is
+seen). In memory each band keeps a sorted array of bucket hashes with the
+row ids beside it, plus a small dict of recent inserts that is merged into
+the arrays once it reaches ``merge_every`` entries. Rows added by other
+processes sharing the file are picked up before every query. Candidate
+signatures are read back by primary key for verification.
+
+With the sample SuperStore layout, unrelated invoices share at most ~0.4 of
+their 3-word shingles, while a copy with a new number and date keeps ~0.9.
+"""
+
+import os
+import re
+import time
+import zlib
+import sqlite3
+import threading
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+from utils.logger import get_logger
+
+# smallest prime above 2**32; a < 2**31 keeps a * x + b inside uint64
+HASH_PRIME = np.uint64(4294967311)
+MAX_HASH = np.uint64(0xFFFFFFFF)
+BAND_MULT = np.uint64(0x100000001B3)
+TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def shingles(text: str, size: int = 3) -> List[str]:
+    """Distinct ``size``-token shingles of ``text`` (lower-cased, punctuation kept as tokens)."""
+    tokens = TOKEN_RE.findall((text or "").lower())
+    if not tokens:
+        return []
+    if len(tokens) <= size:
+        return [" ".join(tokens)]
+    return list({" ".join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)})
+
+
+def lsh_params(num_perm: int, threshold: float) -> Tuple[int, int]:
+    """``(bands, rows)`` with ``bands * rows <= num_perm`` with the highest S-curve midpoint ``(1/b)^(1/r)`` not above ``threshold``."""
+    best, best_midpoint = (num_perm, 1), -1.0
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        midpoint = (1.0 / bands) ** (1.0 / rows)
+        # stay below the threshold: a missed near-duplicate costs more than a verified candidate
+        if best_midpoint < midpoint <= threshold:
+            best, best_midpoint = (bands, rows), midpoint
+    return best
+
+
+class MinHasher:
+    """MinHash signatures over CRC32 shingle hashes with ``num_perm`` universal hash functions."""
+
+    def __init__(self, num_perm: int = 128, seed: int = 1, shingle_size: int = 3):
+        self.num_perm = int(num_perm)
+        self.seed = int(seed)
+        self.shingle_size = int(shingle_size)
+        rng = np.random.RandomState(self.seed)
+        self._a = rng.randint(1, 2 ** 31, size=self.num_perm, dtype=np.int64).astype(np.uint64)[:, None]
+        self._b = rng.randint(0, 2 ** 32, size=self.num_perm, dtype=np.int64).astype(np.uint64)[:, None]
+
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        """``uint32[num_perm]`` signature, or ``None`` for text without tokens."""
+        grams = shingles(text, self.shingle_size)
+        if not grams:
+            return None
+        x = np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64, count=len(grams))
+        hashed = (self._a * x[None, :] + self._b) % HASH_PRIME & MAX_HASH
+        return hashed.min(axis=1).astype(np.uint32)
+
+
+def band_hashes(signatures: np.ndarray, bands: int, rows: int) -> np.ndarray:
+    """
+    64-bit bucket hash per band (FNV-style fold, band index mixed in so bands
+    never collide): ``[bands]`` for one signature, ``[n, bands]`` for a stack.
+    """
+    parts = signatures[..., : bands * rows].astype(np.uint64)
+    parts = parts.reshape(parts.shape[:-1] + (bands, rows))
+    h = np.broadcast_to(np.arange(1, bands + 1, dtype=np.uint64), parts.shape[:-1])
+    for col in range(rows):
+        h = h * BAND_MULT ^ parts[..., col]
+    return h
+
+
+class _Band:
+    """Sorted bucket-hash array with row ids, plus a dict of inserts not merged yet."""
+
+    def __init__(self):
+        self.keys = np.zeros(0, dtype=np.uint64)
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.pending: Dict[int, List[int]] = {}
+
+    def lookup(self, key: int) -> List[int]:
+        k = np.uint64(key)
+        lo = int(np.searchsorted(self.keys, k, side="left"))
+        hi = int(np.searchsorted(self.keys, k, side="right"))
+        found = self.ids[lo:hi].tolist() if hi > lo else []
+        return found + self.pending.get(key, [])
+
+    def merge(self, keys: Optional[np.ndarray] = None, ids: Optional[np.ndarray] = None):
+        """Fold pending inserts, and optionally a bulk ``keys`` / ``ids`` batch, into the sorted arrays."""
+        parts_k, parts_i = [self.keys], [self.ids]
+        if self.pending:
+            parts_k.append(np.array([k for k, v in self.pending.items() for _ in v], dtype=np.uint64))
+            parts_i.append(np.array([i for v in self.pending.values() for i in v], dtype=np.int64))
+        if keys is not None:
+            parts_k.append(keys)
+            parts_i.append(ids)
+        if len(parts_k) == 1:
+            return
+        all_keys, all_ids = np.concatenate(parts_k), np.concatenate(parts_i)
+        order = np.argsort(all_keys, kind="stable")
+        self.keys, self.ids, self.pending = all_keys[order], all_ids[order], {}
+
+
+class NearDuplicateIndex:
+    """Persistent MinHash/LSH index over invoice raw text."""
+
+    def __init__(
+        self,
+        db_path: str = os.path.join("output", "duplicates", "near_duplicates.sqlite3"),
+        threshold: float = 0.8,
+        num_perm: int = 128,
+        shingle_size: int = 3,
+        seed: int = 1,
+        merge_every: int = 10000,
+        max_candidates: int = 50,
+    ):
+        self.db_path = db_path
+        self.threshold = float(threshold)
+        self.merge_every = max(1, int(merge_every))
+        self.max_candidates = max(1, int(max_candidates))
+        self.logger = get_logger("NearDuplicateIndex")
+        self._lock = threading.Lock()
+        self._stats = {"queries": 0, "inserts": 0, "candidates": 0, "matches": 0, "merges": 0}
+
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS minhash_meta (name TEXT PRIMARY KEY, value TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS minhash_signatures (
+                id             INTEGER PRIMARY KEY,
+                process_id     TEXT UNIQUE NOT NULL,
+                invoice_number TEXT,
+                file_name      TEXT,
+                signature      BLOB NOT NULL,
+                created_at     REAL NOT NULL
+            );
+            """
+        )
+        # the hash family is fixed by the first writer; signatures are only comparable under it
+        params = {"num_perm": str(int(num_perm)), "shingle_size": str(int(shingle_size)), "seed": str(int(seed))}
+        self._conn.executemany("INSERT OR IGNORE INTO minhash_meta (name, value) VALUES (?, ?)", params.items())
+        self._conn.commit()
+        stored = dict(self._conn.execute("SELECT name, value FROM minhash_meta"))
+        if stored != params:
+            self.logger.warning(f"{self.db_path} was built with {stored}; using its parameters instead of {params}")
+
+        self.hasher = MinHasher(int(stored["num_perm"]), int(stored["seed"]), int(stored["shingle_size"]))
+        self.bands, self.rows = lsh_params(self.hasher.num_perm, self.threshold)
+        self._tables = [_Band() for _ in range(self.bands)]
+        self._pending = 0
+        self._size = 0
+        self._max_id = 0
+        with self._lock:
+            self._catch_up()
+            self._merge()
+
+    # ------------------------------------------------------------------
+    # In-memory bands
+    # ------------------------------------------------------------------
+    def _index(self, row_id: int, signature: np.ndarray):
+        for table, key in zip(self._tables, band_hashes(signature, self.bands, self.rows).tolist()):
+            table.pending.setdefault(key, []).append(row_id)
+        self._pending += 1
+        self._size += 1
+        self._max_id = max(self._max_id, row_id)
+        if self._pending >= self.merge_every:
+            self._merge()
+
+    def _merge(self):
+        for table in self._tables:
+            table.merge()
+        if self._pending:
+            self._stats["merges"] += 1
+        self._pending = 0
+
+    def _catch_up(self):
+        """Index rows written since the last call (by this or another process)."""
+        rows = self._conn.execute(
+            "SELECT id, signature FROM minhash_signatures WHERE id > ? ORDER BY id", (self._max_id,)
+        ).fetchall()
+        if len(rows) < self.merge_every:
+            for row_id, blob in rows:
+                self._index(row_id, np.frombuffer(blob, dtype=np.uint32))
+            return
+        # start-up / large backlog: hash all bands at once and merge each band in one sort
+        ids = np.array([r[0] for r in rows], dtype=np.int64)
+        keys = band_hashes(
+            np.frombuffer(b"".join(r[1] for r in rows), dtype=np.uint32).reshape(len(rows), -1),
+            self.bands,
+            self.rows,
+        )
+        for band, table in enumerate(self._tables):
+            table.merge(np.ascontiguousarray(keys[:, band]), ids)
+        self._pending = 0
+        self._size += len(rows)
+        self._max_id = int(ids[-1])
+        self._stats["merges"] += 1
+
+    # ------------------------------------------------------------------
+    # Query / Insert
+    # ------------------------------------------------------------------
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        return self.hasher.signature(text)
+
+    def query(
+        self, text: str = None, signature: Optional[np.ndarray] = None, exclude_process_id: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Stored invoices whose estimated Jaccard similarity reaches the threshold, most similar first."""
+        if signature is None:
+            signature = self.signature(text)
+        if signature is None:
+            return []
+        with self._lock:
+            self._stats["queries"] += 1
+            self._catch_up()
+            hits: Dict[int, int] = {}
+            for table, key in zip(self._tables, band_hashes(signature, self.bands, self.rows).tolist()):
+                for row_id in table.lookup(key):
+                    hits[row_id] = hits.get(row_id, 0) + 1
+            if not hits:
+                return []
+            # most shared bands first: those are the likeliest matches
+            ids = sorted(hits, key=hits.get, reverse=True)[: self.max_candidates]
+            self._stats["candidates"] += len(ids)
+            rows = self._conn.execute(
+                "SELECT id, process_id, invoice_number, file_name, signature, created_at FROM minhash_signatures "
+                f"WHERE id IN ({', '.join('?' * len(ids))})",
+                ids,
+            ).fetchall()
+
+        matches = []
+        for _, process_id, invoice_number, file_name, blob, created_at in rows:
+            if exclude_process_id is not None and process_id == exclude_process_id:
+                continue
+            similarity = float(np.mean(np.frombuffer(blob, dtype=np.uint32) == signature))
+            if similarity >= self.threshold:
+                matches.append({
+                    "process_id": process_id,
+                    "invoice_number": invoice_number,
+                    "file_name": file_name,
+                    "similarity": round(similarity, 3),
+                    "first_seen": created_at,
+                })
+        matches.sort(key=lambda m: m["similarity"], reverse=True)
+        self._stats["matches"] += bool(matches)
+        return matches
+
+    def add(
+        self,
+        process_id: str,
+        text: str = None,
+        signature: Optional[np.ndarray] = None,
+        invoice_number: Optional[str] = None,
+        file_name: Optional[str] = None,
+    ) -> bool:
+        """Store one invoice; ``False`` when it has no text or ``process_id`` is already stored."""
+        if signature is None:
+            signature = self.signature(text)
+        if signature is None:
+            return False
+        with self._lock:
+            with self._conn:
+                cur = self._conn.execute(
+                    "INSERT OR IGNORE INTO minhash_signatures "
+                    "(process_id, invoice_number, file_name, signature, created_at) VALUES (?, ?, ?, ?, ?)",
+                    (process_id, invoice_number, file_name, signature.astype(np.uint32).tobytes(), time.time()),
+                )
+            if not cur.rowcount:
+                return False
+            self._catch_up()
+            self._stats["inserts"] += 1
+            return True
+
+    def check_and_add(
+        self, text: str, process_id: str, invoice_number: Optional[str] = None, file_name: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Near-duplicates of ``text`` among earlier invoices, then store it (one signature computation)."""
+        signature = self.signature(text)
+        if signature is None:
+            return []
+        matches = self.query(signature=signature, exclude_process_id=process_id)
+        self.add(process_id, signature=signature, invoice_number=invoice_number, file_name=file_name)
+        return matches
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        stats.update({
+            "db_path": self.db_path,
+            "invoices": self._size,
+            "num_perm": self.hasher.num_perm,
+            "bands": self.bands,
+            "rows": self.rows,
+            "threshold": self.threshold,
+            "match_rate": round(stats["matches"] / stats["queries"], 3) if stats["queries"] else 0.0,
+        })
+        return stats
+
+
+@lru_cache(maxsize=None)
+def get_near_duplicate_index(
+    db_path: str, threshold: float = 0.8, num_perm: int = 128, shingle_size: int = 3
+) -> NearDuplicateIndex:
+    """Shared index per database file."""
+    return NearDuplicateIndex(os.path.abspath(db_path), threshold, num_perm, shingle_size)
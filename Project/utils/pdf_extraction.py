@@ -0,0 +1,269 @@
+"""
+Off-loop PDF text extraction.
+
+PyMuPDF and pdfplumber are CPU bound and synchronous; calling them directly
+from an ``async`` agent blocks the event loop and serializes every invoice in
+``process_batch``. ``PdfExtractionService`` runs extraction in a
+``ProcessPoolExecutor`` so parsing scales across cores, with its own
+concurrency limit, per-call timeouts and worker recycling after a fixed number
+of documents (PDF libraries are prone to slow memory growth).
+
+A call that times out retires its pool: new documents go to a fresh pool,
+the other documents already submitted to the old one still finish there, and
+once only timed-out work is left its worker processes are terminated, so a
+hung parser does not hold a process forever.
+"""
+
+import io
+import asyncio
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, Executor
+from functools import lru_cache
+from typing import Dict, Any, List, Optional
+
+from utils.logger import get_logger
+
+
+# ----------------------------------------------------------------------
+# Worker functions (module level so they can be pickled into workers)
+# ----------------------------------------------------------------------
+def extract_text(data: bytes, methods: List[str], min_chars: int = 100) -> str:
+    """Try the extraction methods in order and return the first usable text."""
+    import fitz  # PyMuPDF
+    import pdfplumber
+
+    text = ""
+    errors = []
+    for method in methods:
+        try:
+            if method == "pymupdf":
+                with fitz.open(stream=data, filetype="pdf") as doc:
+                    for page in doc:
+                        text += page.get_text("text")
+            elif method == "pdfplumber":
+                with pdfplumber.open(io.BytesIO(data)) as pdf:
+                    for page in pdf.pages:
+                        text += page.extract_text() or ""
+            else:
+                continue
+
+            if len(text.strip()) > min_chars:
+                return text
+        except Exception as e:
+            errors.append(f"{method}: {e}")
+
+    if not text and errors:
+        raise RuntimeError(f"All extraction methods failed: {errors}")
+    return text
+
+
+def extract_words(data: bytes) -> List[list]:
+    """
+    PyMuPDF word boxes for every page as
+    ``[page, x0, y0, x1, y1, text, block_no, line_no, word_no]``.
+    """
+    import fitz  # PyMuPDF
+
+    words: List[list] = []
+    with fitz.open(stream=data, filetype="pdf") as doc:
+        for page_no, page in enumerate(doc):
+            for x0, y0, x1, y1, text, block_no, line_no, word_no in page.get_text("words"):
+                words.append([page_no, x0, y0, x1, y1, text, block_no, line_no, word_no])
+    return words
+
+
+class PdfExtractionService:
+    """Executor-backed PDF extraction with bounded concurrency and worker recycling."""
+
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        max_concurrent: Optional[int] = None,
+        recycle_after: int = 200,
+        timeout_s: float = 30.0,
+        executor: str = "process",
+        mp_context: Optional[str] = None,
+    ):
+        self.max_workers = max_workers or max(1, (multiprocessing.cpu_count() or 2) - 1)
+        self.max_concurrent = max_concurrent or self.max_workers
+        self.recycle_after = max(0, int(recycle_after))
+        self.timeout_s = float(timeout_s)
+        self.executor_kind = executor
+        self.mp_context = mp_context
+        self.logger = get_logger("PdfExtractionService")
+
+        self._executor: Optional[Executor] = None
+        # submitted, unfinished futures per pool; timed-out ones per retired pool
+        self._pending: Dict[Executor, set] = {}
+        self._retired: Dict[Executor, set] = {}
+        self._docs_on_executor = 0
+        self._lock = threading.Lock()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._semaphore_loop = None
+        self._stats = {
+            "documents": 0,
+            "failures": 0,
+            "timeouts": 0,
+            "recycles": 0,
+            "in_flight": 0,
+        }
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+    async def extract_text(self, data: bytes, methods: List[str]) -> str:
+        """Extract text from PDF bytes without blocking the event loop."""
+        return await self._run(extract_text, data, list(methods))
+
+    async def extract_words(self, data: bytes) -> List[list]:
+        """Extract positioned words (see ``extract_words``) without blocking the event loop."""
+        return await self._run(extract_words, data)
+
+    async def _run(self, fn, *args):
+        async with self._get_semaphore():
+            executor = self._acquire_executor()
+            self._stats["in_flight"] += 1
+            try:
+                future = self._submit(executor, fn, *args)
+                result = await asyncio.wait_for(asyncio.wrap_future(future), timeout=self.timeout_s)
+                self._stats["documents"] += 1
+                return result
+            except asyncio.TimeoutError:
+                self._stats["timeouts"] += 1
+                # The stuck worker cannot be cancelled; retire the pool so it
+                # does not keep occupying a slot for later documents.
+                self._retire_executor(executor, future)
+                raise TimeoutError(f"PDF extraction exceeded {self.timeout_s:.0f}s")
+            except Exception:
+                self._stats["failures"] += 1
+                raise
+            finally:
+                self._stats["in_flight"] -= 1
+
+    def shutdown(self, wait: bool = True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+            self._docs_on_executor = 0
+        if executor:
+            executor.shutdown(wait=wait)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        stats.update(
+            {
+                "executor": self.executor_kind,
+                "max_workers": self.max_workers,
+                "max_concurrent": self.max_concurrent,
+                "recycle_after": self.recycle_after,
+                "timeout_s": self.timeout_s,
+            }
+        )
+        return stats
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # Streamlit runs each batch in a fresh event loop; a semaphore must
+        # belong to the loop that awaits it.
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+            self._semaphore_loop = loop
+        return self._semaphore
+
+    def _acquire_executor(self) -> Executor:
+        with self._lock:
+            if self._executor is not None and self.recycle_after and \
+                    self._docs_on_executor >= self.recycle_after:
+                old = self._executor
+                self._executor = None
+                self._stats["recycles"] += 1
+                # let in-flight documents finish on the old workers
+                old.shutdown(wait=False)
+
+            if self._executor is None:
+                self._executor = self._create_executor()
+                self._docs_on_executor = 0
+
+            self._docs_on_executor += 1
+            return self._executor
+
+    def _submit(self, executor: Executor, fn, *args):
+        future = executor.submit(fn, *args)
+        with self._lock:
+            self._pending.setdefault(executor, set()).add(future)
+        future.add_done_callback(lambda f: self._settle(executor, f))
+        return future
+
+    def _settle(self, executor: Executor, future):
+        with self._lock:
+            pending = self._pending.get(executor)
+            if pending is not None:
+                pending.discard(future)
+                if not pending and executor not in self._retired:
+                    del self._pending[executor]
+            stuck = self._retired.get(executor)
+            if stuck is not None:
+                stuck.discard(future)
+            done = stuck is not None and not (pending or set()) - stuck
+        if done:
+            self._terminate(executor)
+
+    def _retire_executor(self, executor: Executor, future):
+        """Send new work elsewhere; end ``executor`` once only timed-out work is left on it."""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+                self._docs_on_executor = 0
+                self._stats["recycles"] += 1
+            stuck = self._retired.setdefault(executor, set())
+            if not future.done():
+                stuck.add(future)
+            done = not self._pending.get(executor, set()) - stuck
+        if done:
+            self._terminate(executor)
+
+    def _terminate(self, executor: Executor):
+        with self._lock:
+            stuck = self._retired.pop(executor, None)
+            self._pending.pop(executor, None)
+        if stuck is None:
+            return
+        # other callers' documents are finished; only hung workers remain
+        processes = list((getattr(executor, "_processes", None) or {}).values())
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        if stuck and not processes:
+            self.logger.warning(f"{len(stuck)} timed-out extraction thread(s) cannot be stopped; abandoning them")
+        executor.shutdown(wait=False)
+
+    def _create_executor(self) -> Executor:
+        if self.executor_kind == "process":
+            try:
+                ctx = multiprocessing.get_context(self.mp_context) if self.mp_context else None
+                return ProcessPoolExecutor(max_workers=self.max_workers, mp_context=ctx)
+            except (OSError, ValueError, NotImplementedError) as e:
+                self.logger.warning(f"Process pool unavailable ({e}); falling back to threads")
+                self.executor_kind = "thread"
+        return ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="pdf-extract")
+
+
+@lru_cache(maxsize=None)
+def get_extraction_service(
+    max_workers: Optional[int] = None,
+    max_concurrent: Optional[int] = None,
+    recycle_after: int = 200,
+    timeout_s: float = 30.0,
+    executor: str = "process",
+) -> PdfExtractionService:
+    """Shared service per configuration, so agents do not each spawn a pool."""
+    return PdfExtractionService(
+        max_workers=max_workers,
+        max_concurrent=max_concurrent,
+        recycle_after=recycle_after,
+        timeout_s=timeout_s,
+        executor=executor,
+    )
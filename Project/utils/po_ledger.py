@@ -0,0 +1,283 @@
+"""
+Running PO balance ledger.
+
+Each invoice is validated against its own order total, so several invoices
+that each bill part of one PO all pass on their own. ``POBalanceLedger``
+tracks what is billed against every order across invoices:
+
+- ``reserve(order_id, process_id, amount, po_total, tolerance)`` books an
+  invoice's total against the order and reports whether, together with
+  other invoices, the order's reserved amount now exceeds
+  ``po_total * (1 + tolerance)``. Re-reserving the same process id (retries,
+  resumes) replaces its earlier amount instead of adding to it.
+- ``release(process_id)`` drops an invoice's reservation when it is rejected,
+  its run fails or it is cancelled (``InvoiceProcessingGraph.cancel``, exposed
+  as ``POST /api/invoices/{process_id}/cancel``).
+
+Balances are in memory (one dict entry per order with a running billed sum),
+so a check is O(1).
+Reservations and releases of one order are serialized by a per-order
+``asyncio.Lock`` while their record is written, so concurrent
+``process_batch`` runs see each other's reservations in order. The in-memory
+change is applied under a thread lock before the write, so event loops in
+other threads never decide on stale balances.
+
+Persistence is an append-only JSON-lines log (one record per reserve /
+release) replayed on start-up; ``compact()`` rewrites it as the current
+reservations only (tmp file + ``os.replace``). ``fsync=True`` makes each record
+durable before the call returns (the write then runs off the event loop).
+
+Balances live in the memory of the process that serves invoices, so
+cancellations go through that process (the API above), not a separate
+command.
+
+Usage:
+    python -m utils.po_ledger stats --log output/po_ledger/po_ledger.jsonl
+    python -m utils.po_ledger compact --log output/po_ledger/po_ledger.jsonl   # with the server stopped
+"""
+
+import os
+import sys
+import json
+import time
+import weakref
+import asyncio
+import argparse
+import threading
+from functools import lru_cache
+from typing import Dict, Any, List, Optional
+
+from utils.po_repository import normalize_key
+from utils.logger import get_logger
+
+
+class POBalanceLedger:
+    """Per-order reservations of invoice amounts, persisted to an append-only log."""
+
+    def __init__(
+        self,
+        log_path: str = os.path.join("output", "po_ledger", "po_ledger.jsonl"),
+        fsync: bool = False,
+    ):
+        self.log_path = log_path
+        self.fsync = bool(fsync)
+        self.logger = get_logger("POBalanceLedger")
+        # order key -> {"po_total": float, "billed": float, "reservations": {process_id: amount}}
+        self._orders: Dict[str, Dict[str, Any]] = {}
+        self._by_process: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        # per event loop, per order; entries vanish once no coroutine holds them
+        self._order_locks: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+        self._stats = {"reservations": 0, "releases": 0, "over_billed": 0, "records": 0}
+
+        directory = os.path.dirname(self.log_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._replay()
+        self._file = open(self.log_path, "a", encoding="utf-8")
+
+    # ------------------------------------------------------------------
+    # Log
+    # ------------------------------------------------------------------
+    def _replay(self):
+        if not os.path.exists(self.log_path):
+            return
+        with open(self.log_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # torn last line of a crashed writer
+                if record.get("op") == "reserve":
+                    self._apply_reserve(record["order"], record["process_id"], record["amount"], record.get("po_total"))
+                elif record.get("op") == "release":
+                    self._apply_release(record["process_id"])
+                self._stats["records"] += 1
+        self.logger.info(f"Replayed {self._stats['records']} ledger records for {len(self._orders)} orders")
+
+    def _append(self, record: Dict[str, Any]):
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self._stats["records"] += 1
+
+    async def _write(self, record: Dict[str, Any]):
+        if self.fsync:
+            await asyncio.to_thread(self._append, record)
+        else:
+            self._append(record)
+
+    def _order_lock(self, order: str) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        locks = self._order_locks.get(loop)
+        if locks is None:
+            locks = self._order_locks[loop] = weakref.WeakValueDictionary()
+        lock = locks.get(order)
+        if lock is None:
+            lock = asyncio.Lock()
+            locks[order] = lock
+        return lock
+
+    # ------------------------------------------------------------------
+    # In-memory balances
+    # ------------------------------------------------------------------
+    def _apply_reserve(self, order: str, process_id: str, amount: float, po_total: Optional[float]):
+        previous = self._by_process.get(process_id)
+        if previous is not None and previous != order:
+            self._apply_release(process_id)
+        entry = self._orders.setdefault(order, {"po_total": None, "billed": 0.0, "reservations": {}})
+        if po_total is not None:
+            entry["po_total"] = float(po_total)
+        entry["billed"] += float(amount) - entry["reservations"].get(process_id, 0.0)
+        entry["reservations"][process_id] = float(amount)
+        self._by_process[process_id] = order
+
+    def _apply_release(self, process_id: str) -> Optional[Dict[str, Any]]:
+        order = self._by_process.pop(process_id, None)
+        if order is None:
+            return None
+        entry = self._orders.get(order, {"billed": 0.0, "reservations": {}})
+        amount = entry["reservations"].pop(process_id, 0.0)
+        entry["billed"] -= amount
+        if not entry["reservations"]:
+            self._orders.pop(order, None)
+        return {"order": order, "amount": amount}
+
+    # ------------------------------------------------------------------
+    # Reserve / Release
+    # ------------------------------------------------------------------
+    async def reserve(
+        self, order_id: Any, process_id: str, amount: float, po_total: Optional[float], tolerance: float = 0.05
+    ) -> Dict[str, Any]:
+        """
+        Book ``amount`` for ``process_id`` against the order and return its
+        balance: ``po_total``, ``billed_before`` (other invoices),
+        ``billed``, ``remaining`` and ``over_billed``.
+        """
+        order = normalize_key(order_id)
+        if not order:
+            raise ValueError("order_id is required for a PO reservation")
+        amount = float(amount or 0.0)
+        async with self._order_lock(order):
+            with self._lock:
+                self._apply_reserve(order, process_id, amount, po_total)
+                entry = self._orders[order]
+                total = entry["po_total"]
+                billed = entry["billed"]
+                self._stats["reservations"] += 1
+            await self._write({
+                "op": "reserve", "order": order, "process_id": process_id,
+                "amount": amount, "po_total": total, "ts": time.time(),
+            })
+
+        # an invoice exceeding the PO on its own is the totals check's finding
+        over = bool(total) and billed > amount and billed > total * (1 + max(0.0, float(tolerance))) + 0.005
+        if over:
+            self._stats["over_billed"] += 1
+        return {
+            "order_id": order,
+            "process_id": process_id,
+            "amount": round(amount, 2),
+            "po_total": total,
+            "billed_before": round(billed - amount, 2),
+            "billed": round(billed, 2),
+            "remaining": round(total - billed, 2) if total is not None else None,
+            "over_billed": over,
+            "log_path": self.log_path,
+        }
+
+    async def release(self, process_id: str) -> Optional[Dict[str, Any]]:
+        """Drop the reservation of ``process_id`` (rejected / cancelled invoice); ``None`` if it had none."""
+        order = self._by_process.get(process_id)
+        if order is None:
+            return None
+        async with self._order_lock(order):
+            with self._lock:
+                released = self._apply_release(process_id)
+            if released is None:
+                return None
+            self._stats["releases"] += 1
+            await self._write({"op": "release", "order": order, "process_id": process_id, "ts": time.time()})
+        return released
+
+    def balance(self, order_id: Any) -> Dict[str, Any]:
+        """Current ``po_total`` / ``billed`` / ``reservations`` of one order."""
+        entry = self._orders.get(normalize_key(order_id)) or {"po_total": None, "reservations": {}}
+        return {
+            "po_total": entry["po_total"],
+            "billed": round(entry.get("billed", 0.0), 2),
+            "reservations": dict(entry["reservations"]),
+        }
+
+    def compact(self) -> int:
+        """Rewrite the log as one reserve record per live reservation; returns the record count."""
+        with self._lock:
+            tmp = f"{self.log_path}.tmp"
+            count = 0
+            with open(tmp, "w", encoding="utf-8") as f:
+                for order, entry in self._orders.items():
+                    for process_id, amount in entry["reservations"].items():
+                        f.write(json.dumps({
+                            "op": "reserve", "order": order, "process_id": process_id,
+                            "amount": amount, "po_total": entry["po_total"], "ts": time.time(),
+                        }, separators=(",", ":")) + "\n")
+                        count += 1
+                f.flush()
+                os.fsync(f.fileno())
+            self._file.close()
+            os.replace(tmp, self.log_path)
+            self._file = open(self.log_path, "a", encoding="utf-8")
+            self._stats["records"] = count
+        self.logger.info(f"Compacted {self.log_path} to {count} reservations")
+        return count
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        stats.update({
+            "log_path": self.log_path,
+            "orders": len(self._orders),
+            "open_reservations": len(self._by_process),
+            "over_billed_rate": round(stats["over_billed"] / stats["reservations"], 3) if stats["reservations"] else 0.0,
+        })
+        return stats
+
+
+@lru_cache(maxsize=None)
+def _shared_ledger(log_path: str) -> POBalanceLedger:
+    return POBalanceLedger(log_path)
+
+
+def get_po_ledger(log_path: str, fsync: Optional[bool] = None) -> POBalanceLedger:
+    """Shared ledger per log file (one in-memory balance per file, whatever the caller)."""
+    ledger = _shared_ledger(os.path.abspath(log_path))
+    if fsync is not None:
+        ledger.fsync = bool(fsync)
+    return ledger
+
+
+async def release_reservation(reservation: Optional[Dict[str, Any]], process_id: str) -> Optional[Dict[str, Any]]:
+    """Release what ``reserve`` booked for ``process_id`` (``reservation`` is its result, e.g. ``state.po_reservation``)."""
+    if not reservation or not reservation.get("log_path"):
+        return None
+    return await get_po_ledger(reservation["log_path"]).release(process_id)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="PO balance ledger")
+    parser.add_argument("command", choices=["stats", "compact"])
+    parser.add_argument("--log", default=os.path.join("output", "po_ledger", "po_ledger.jsonl"))
+    args = parser.parse_args(argv)
+
+    ledger = POBalanceLedger(args.log)
+    if args.command == "compact":
+        print(f"Kept {ledger.compact()} reservations")
+    else:
+        print(json.dumps(ledger.stats(), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,600 @@
+"""
+Resident, indexed, hot-reloadable purchase-order master.
+
+ValidationAgent used to parse ``purchase_orders.csv`` with pandas twice per
+invoice and fuzzy-score every row. ``PurchaseOrderRepository`` loads the
+master once per process and keeps it in memory with:
+
+- hash indexes on ``order_id`` and ``invoice_number``
+- an index on the normalized customer name
+- item indexes on the exact SKU and the normalized product name
+- a sorted ``expected_amount`` array for range lookups (bisect)
+
+so a lookup is O(1) / O(log N) instead of O(N).
+
+Item columns: SuperStore masters pack product, sub-category, category and SKU
+into one ``item_name`` (``Canon Wireless Fax, Laser Copiers, Technology,
+TEC-CO-3710``). Rows are split into ``product_name``, ``sub_category``,
+``category`` and ``sku`` as they are loaded (columns already present in the
+master win), so item checks can be exact SKU lookups.
+
+Versions: indexes live in an immutable ``POSnapshot`` tagged with a
+monotonically increasing ``version`` (``po_version``). A new version is built
+off to the side and swapped in with one assignment, so a validation holding a
+snapshot keeps seeing exactly that version until it finishes. A background
+watcher (or, without one, the next lookup after ``check_interval_s``) checks
+the master's mtime/size and, when those changed, its SHA-256; only a content
+change triggers a full reload.
+
+Deltas: an append-only CSV (default ``<master>.delta.csv``) carries PO changes
+between full exports - the master's columns plus a leading ``op``:
+
+- ``upsert`` / ``add`` / ``update``: replace the row with the same order_id
+  and item_name, or add it
+- ``close`` / ``delete``: drop that row, or every row of the order_id when
+  item_name is empty
+
+Only lines appended since the last check are read; they are applied
+copy-on-write to the current snapshot, touching just the affected index
+entries. After a full reload the whole log is re-applied (its operations are
+idempotent), so truncate it when a master that includes the changes ships.
+"""
+
+import os
+import re
+import csv
+import time
+import bisect
+import hashlib
+import threading
+from functools import lru_cache
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+import pandas as pd
+
+from utils.fuzzy_matcher import BatchFuzzyMatcher
+from utils.blocking_index import BlockingIndex
+from utils.logger import get_logger
+
+UPSERT_OPS = {"upsert", "add", "update", "new", "changed"}
+CLOSE_OPS = {"close", "closed", "delete"}
+INDEXES = {
+    "order_id": "by_order_id", "invoice_number": "by_invoice_number", "customer": "by_customer",
+    "sku": "by_sku", "product": "by_product",
+}
+ITEM_COLUMNS = ["product_name", "sub_category", "category", "sku"]
+
+
+def normalize_name(value: Any) -> str:
+    """Lower-case, punctuation-free, single-spaced form used as the customer key."""
+    return " ".join(re.sub(r"[^\w\s]", " ", str(value or "")).lower().split())
+
+
+def normalize_key(value: Any) -> str:
+    """Identifier key: trimmed, upper-cased; integral floats lose their ``.0``."""
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip().upper()
+
+
+_SKU_PATTERN = re.compile(r"^[A-Z]{2,4}-[A-Z]{2,4}-\d{3,}$")
+
+
+def item_key(item_name: Any, sku: Any = None) -> str:
+    """
+    Product key of a line: the explicit ``sku`` if given, else the SKU that
+    SuperStore item names end with (``..., Technology, TEC-CO-3710``), else
+    the normalized item name.
+    """
+    if sku is not None and str(sku).strip():
+        return normalize_key(sku)
+    name = str(item_name or "")
+    last = name.rsplit(",", 1)[-1].strip().upper()
+    if _SKU_PATTERN.match(last):
+        return last
+    return normalize_name(name)
+
+
+def parse_item_name(item_name: Any) -> Dict[str, str]:
+    """
+    Split a SuperStore item string ``<product> <Sub-Category>, <Category>, <SKU>``
+    into ``ITEM_COLUMNS``. The sub-category is the last word before the
+    category (the PDF wraps it onto the product line). Names without a
+    trailing SKU are all product name.
+    """
+    name = " ".join(str(item_name or "").split())
+    parts = [p.strip() for p in name.split(",")]
+    if len(parts) < 2 or not _SKU_PATTERN.match(parts[-1].upper()):
+        return {"product_name": name, "sub_category": "", "category": "", "sku": ""}
+    sku, rest = parts[-1].upper(), parts[:-1]
+    if len(rest) < 2:
+        return {"product_name": rest[0], "sub_category": "", "category": "", "sku": sku}
+    head = ", ".join(rest[:-1])
+    product, _, sub_category = head.rpartition(" ")
+    if not product:
+        product, sub_category = head, ""
+    return {"product_name": product.rstrip(", "), "sub_category": sub_category, "category": rest[-1], "sku": sku}
+
+
+def structure_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Fill ``ITEM_COLUMNS`` of a PO row from its ``item_name`` (in place; non-blank values are kept)."""
+    for column, value in parse_item_name(row.get("item_name")).items():
+        current = row.get(column)
+        # pandas reads blank cells as NaN
+        if current is None or current != current or not str(current).strip():
+            row[column] = value
+    return row
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def coerce_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Delta CSV strings to the types pandas gives the master's rows."""
+    out: Dict[str, Any] = {}
+    for key, value in row.items():
+        value = (value or "").strip()
+        if key in ("invoice_number", "quantity") and re.fullmatch(r"-?\d+", value):
+            out[key] = int(value)
+        elif key in ("quantity", "rate", "expected_amount"):
+            try:
+                out[key] = float(value)
+            except ValueError:
+                out[key] = value
+        else:
+            out[key] = value
+    return out
+
+
+class POSnapshot:
+    """Immutable PO version: rows plus the lookup indexes built over them."""
+
+    def __init__(
+        self,
+        rows: List[Dict[str, Any]],
+        signature: Tuple[float, int] = (0.0, 0),
+        version: int = 0,
+        content_hash: str = "",
+    ):
+        # ``rows`` is append-only and shared with the versions derived from
+        # this one; a version only reaches the positions its indexes hold.
+        self.rows = rows
+        self.signature = signature
+        self.version = version
+        self.content_hash = content_hash
+        self.size = len(rows)
+        self.by_order_id: Dict[str, List[int]] = {}
+        self.by_invoice_number: Dict[str, List[int]] = {}
+        self.by_customer: Dict[str, List[int]] = {}
+        self.by_sku: Dict[str, List[int]] = {}
+        self.by_product: Dict[str, List[int]] = {}
+
+        for i, row in enumerate(rows):
+            for index, key in self._row_keys(row):
+                index.setdefault(key, []).append(i)
+        for index in (self.by_order_id, self.by_invoice_number, self.by_customer, self.by_sku, self.by_product):
+            index.pop("", None)
+
+        amounts = []
+        for i, row in enumerate(rows):
+            amount = self._amount(row)
+            if amount is not None:
+                amounts.append((amount, i))
+        amounts.sort()
+        self.amount_keys = [a for a, _ in amounts]
+        self.amount_rows = [i for _, i in amounts]
+        self._customer_matcher: Optional[BatchFuzzyMatcher] = None
+        self._blocking: Dict[Tuple, BlockingIndex] = {}
+        self._blocking_lock = threading.Lock()
+
+    @staticmethod
+    def _amount(row: Dict[str, Any]) -> Optional[float]:
+        try:
+            return float(row.get("expected_amount"))
+        except (TypeError, ValueError):
+            return None
+
+    def customer_matcher(self) -> BatchFuzzyMatcher:
+        """Batch fuzzy matcher over the distinct normalized customer names (built on first use)."""
+        if self._customer_matcher is None:
+            self._customer_matcher = BatchFuzzyMatcher(list(self.by_customer))
+        return self._customer_matcher
+
+    def blocking_index(
+        self, field: str, ngram: int = 3, min_overlap: float = 0.3, max_candidates: Optional[int] = 500
+    ) -> BlockingIndex:
+        """
+        N-gram / phonetic blocking index over the distinct keys of ``field``
+        (``customer`` -> normalized names, ``order_id`` -> order keys), built
+        on first use per parameter set.
+
+        The index is shared with the versions derived from this one and only
+        ever grows, so it may return keys this version does not hold;
+        resolve candidates with ``.get``.
+        """
+        keys = {"customer": self.by_customer, "order_id": self.by_order_id}[field]
+        params = (field, ngram, min_overlap, max_candidates)
+        with self._blocking_lock:
+            index = self._blocking.get(params)
+            if index is None:
+                index = BlockingIndex(ngram, min_overlap, max_candidates, phonetic=field == "customer")
+                index.add_many(keys)
+                self._blocking[params] = index
+            return index
+
+    def __len__(self) -> int:
+        return self.size
+
+    # ------------------------------------------------------------------
+    # Deltas (copy-on-write)
+    # ------------------------------------------------------------------
+    def apply(self, changes: List[Tuple[str, Dict[str, Any]]], version: int) -> "POSnapshot":
+        """New version with the ``(op, row)`` changes applied; ``self`` is left as it was."""
+        snap = POSnapshot.__new__(POSnapshot)
+        snap.rows = self.rows
+        snap.signature = self.signature
+        snap.version = version
+        snap.content_hash = self.content_hash
+        snap.size = self.size
+        snap.by_order_id = dict(self.by_order_id)
+        snap.by_invoice_number = dict(self.by_invoice_number)
+        snap.by_customer = dict(self.by_customer)
+        snap.by_sku = dict(self.by_sku)
+        snap.by_product = dict(self.by_product)
+        snap.amount_keys = list(self.amount_keys)
+        snap.amount_rows = list(self.amount_rows)
+        snap._customer_matcher = None
+        snap._blocking = self._blocking
+        snap._blocking_lock = self._blocking_lock
+
+        added = {"customer": set(), "order_id": set()}
+        for op, row in changes:
+            order_key = normalize_key(row.get("order_id"))
+            item_key = normalize_name(row.get("item_name"))
+            if not order_key:
+                continue
+            for pos in list(snap.by_order_id.get(order_key, [])):
+                if not item_key or normalize_name(snap.rows[pos].get("item_name")) == item_key:
+                    snap._unindex(pos)
+            if op in UPSERT_OPS:
+                snap.rows.append(row)
+                snap._index(len(snap.rows) - 1)
+                added["order_id"].add(order_key)
+                added["customer"].add(normalize_name(row.get("customer_name")))
+
+        # closed keys stay in the shared blocking indexes: older versions
+        # still in use may hold them, and lookups go through ``.get``
+        with snap._blocking_lock:
+            for (field, *_), index in snap._blocking.items():
+                for key in added[field]:
+                    if key and key not in index:
+                        index.add(key)
+        return snap
+
+    def _row_keys(self, row: Dict[str, Any]):
+        return (
+            (self.by_order_id, normalize_key(row.get("order_id"))),
+            (self.by_invoice_number, normalize_key(row.get("invoice_number"))),
+            (self.by_customer, normalize_name(row.get("customer_name"))),
+            (self.by_sku, normalize_key(row.get("sku"))),
+            (self.by_product, normalize_name(row.get("product_name"))),
+        )
+
+    def _index(self, pos: int):
+        row = self.rows[pos]
+        for index, key in self._row_keys(row):
+            if key:
+                # a new list: older versions keep sharing the old one
+                index[key] = index.get(key, []) + [pos]
+        amount = self._amount(row)
+        if amount is not None:
+            at = bisect.bisect_right(self.amount_keys, amount)
+            self.amount_keys.insert(at, amount)
+            self.amount_rows.insert(at, pos)
+        self.size += 1
+
+    def _unindex(self, pos: int):
+        row = self.rows[pos]
+        for index, key in self._row_keys(row):
+            remaining = [p for p in index.get(key, []) if p != pos]
+            if remaining:
+                index[key] = remaining
+            else:
+                index.pop(key, None)
+        amount = self._amount(row)
+        if amount is not None:
+            lo = bisect.bisect_left(self.amount_keys, amount)
+            hi = bisect.bisect_right(self.amount_keys, amount)
+            for at in range(lo, hi):
+                if self.amount_rows[at] == pos:
+                    del self.amount_keys[at]
+                    del self.amount_rows[at]
+                    break
+        self.size -= 1
+
+
+class PurchaseOrderRepository:
+    """Loads the PO master once, serves indexed lookups and swaps in new versions."""
+
+    def __init__(
+        self,
+        path: str,
+        check_interval_s: float = 5.0,
+        delta_path: Optional[str] = None,
+        watch: bool = False,
+    ):
+        self.path = path
+        self.delta_path = delta_path or f"{os.path.splitext(path)[0]}.delta.csv"
+        self.check_interval_s = max(0.0, float(check_interval_s))
+        self.logger = get_logger("PurchaseOrderRepository")
+
+        self._snapshot: Optional[POSnapshot] = None
+        self._version = 0
+        self._last_check = 0.0
+        self._delta_offset = 0
+        self._delta_signature: Tuple[float, int] = (0.0, 0)
+        self._lock = threading.Lock()
+        self._watcher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._stats = {
+            "loads": 0, "unchanged_touches": 0, "deltas_applied": 0, "delta_rows": 0,
+            "refresh_errors": 0, "lookups": 0, "index_hits": 0,
+        }
+        if watch:
+            self.start_watching()
+
+    @property
+    def po_version(self) -> int:
+        snap = self._snapshot
+        return snap.version if snap else 0
+
+    # ------------------------------------------------------------------
+    # Loading
+    # ------------------------------------------------------------------
+    def snapshot(self) -> POSnapshot:
+        """
+        Current version. Take it once per validation and use it throughout;
+        later calls may return a newer one.
+        """
+        snap = self._snapshot
+        if snap is not None and (
+            self._watcher is not None or time.monotonic() - self._last_check < self.check_interval_s
+        ):
+            return snap
+        try:
+            self.refresh()
+        except Exception as e:
+            if snap is None:
+                raise
+            # e.g. a master caught mid-write: keep serving the current version
+            self._stats["refresh_errors"] += 1
+            self.logger.error(f"PO master refresh failed, serving po_version {snap.version}: {e}")
+        return self._snapshot
+
+    def refresh(self) -> bool:
+        """Reload the master if its content changed, then apply new delta lines. True if a version was swapped in."""
+        with self._lock:
+            self._last_check = time.monotonic()
+            snap = self._snapshot
+            signature = self._file_signature(self.path)
+            if snap is None or signature != snap.signature:
+                content_hash = file_hash(self.path)
+                if snap is not None and content_hash == snap.content_hash:
+                    # touched but identical (e.g. re-copied): keep the version
+                    snap.signature = signature
+                    self._stats["unchanged_touches"] += 1
+                else:
+                    self._full_load(signature, content_hash)
+                    return True
+            return self._apply_deltas()
+
+    def reload(self) -> POSnapshot:
+        """Force a full reload of the master plus the delta log."""
+        with self._lock:
+            path = self.path
+            self._full_load(self._file_signature(path), file_hash(path))
+            self._last_check = time.monotonic()
+            return self._snapshot
+
+    def _full_load(self, signature: Tuple[float, int], content_hash: str):
+        snap = self._load(signature, content_hash)
+        self._delta_offset, self._delta_signature = 0, (0.0, 0)
+        self._snapshot = snap  # one assignment: readers see the old or the new version
+        self._apply_deltas()
+
+    def _next_version(self) -> int:
+        self._version += 1
+        return self._version
+
+    @staticmethod
+    def _file_signature(path: str) -> Tuple[float, int]:
+        st = os.stat(path)
+        return (st.st_mtime, st.st_size)
+
+    def _load(self, signature: Tuple[float, int], content_hash: str) -> POSnapshot:
+        start = time.perf_counter()
+        po_df = pd.read_csv(self.path)
+        po_df.columns = [col.strip().lower() for col in po_df.columns]
+        rows = [structure_row(row) for row in po_df.to_dict("records")]
+        snap = POSnapshot(rows, signature, self._next_version(), content_hash)
+        self._stats["loads"] += 1
+        self.logger.info(
+            f"Loaded {len(snap)} PO rows from {self.path} as po_version {snap.version} "
+            f"in {(time.perf_counter() - start) * 1000:.0f}ms"
+        )
+        return snap
+
+    def _apply_deltas(self) -> bool:
+        """Apply delta lines appended since the last call (caller holds the lock)."""
+        if not os.path.exists(self.delta_path):
+            return False
+        signature = self._file_signature(self.delta_path)
+        if signature == self._delta_signature:
+            return False
+        if signature[1] < self._delta_offset:
+            self.logger.warning(f"PO delta log {self.delta_path} shrank; re-reading it from the start")
+            self._delta_offset = 0
+
+        with open(self.delta_path, "rb") as f:
+            header = [c.strip().lower() for c in next(csv.reader([f.readline().decode("utf-8")]), [])]
+            start = max(self._delta_offset, f.tell())
+            f.seek(start)
+            data = f.read()
+        # complete lines only: a writer may be mid-append
+        complete = data[:data.rfind(b"\n") + 1]
+        self._delta_offset = start + len(complete)
+        self._delta_signature = signature if len(complete) == len(data) else (0.0, 0)
+
+        changes = []
+        if "op" in header:
+            for values in csv.reader(complete.decode("utf-8").splitlines()):
+                if not values:
+                    continue
+                record = dict(zip(header, values))
+                op = (record.pop("op", "") or "").strip().lower()
+                if op in UPSERT_OPS or op in CLOSE_OPS:
+                    changes.append((op, structure_row(coerce_row(record))))
+        if not changes:
+            return False
+
+        snap = self._snapshot.apply(changes, self._next_version())
+        self._snapshot = snap
+        self._stats["deltas_applied"] += 1
+        self._stats["delta_rows"] += len(changes)
+        self.logger.info(f"Applied {len(changes)} PO delta row(s) as po_version {snap.version}")
+        return True
+
+    # ------------------------------------------------------------------
+    # Background watcher
+    # ------------------------------------------------------------------
+    def start_watching(self):
+        if self._watcher is not None:
+            return
+        self._stop.clear()
+        self._watcher = threading.Thread(target=self._watch, name="po-master-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self):
+        watcher, self._watcher = self._watcher, None
+        if watcher is not None:
+            self._stop.set()
+            watcher.join(timeout=self.check_interval_s + 1)
+
+    def _watch(self):
+        while not self._stop.wait(self.check_interval_s or 1.0):
+            try:
+                self.refresh()
+            except Exception as e:
+                # keep serving the current version; retry on the next tick
+                self._stats["refresh_errors"] += 1
+                self.logger.error(f"PO master refresh failed: {e}")
+
+    # ------------------------------------------------------------------
+    # Lookups (return row dicts; callers must not mutate them)
+    # ------------------------------------------------------------------
+    def by_order_id(self, order_id: Any, snap: Optional[POSnapshot] = None) -> List[Dict[str, Any]]:
+        return self._lookup("by_order_id", normalize_key(order_id), snap)
+
+    def by_invoice_number(self, invoice_number: Any, snap: Optional[POSnapshot] = None) -> List[Dict[str, Any]]:
+        return self._lookup("by_invoice_number", normalize_key(invoice_number), snap)
+
+    def by_customer(self, customer_name: Any, snap: Optional[POSnapshot] = None) -> List[Dict[str, Any]]:
+        return self._lookup("by_customer", normalize_name(customer_name), snap)
+
+    def by_sku(self, sku: Any, snap: Optional[POSnapshot] = None) -> List[Dict[str, Any]]:
+        return self._lookup("by_sku", normalize_key(sku), snap)
+
+    def by_product(self, product_name: Any, snap: Optional[POSnapshot] = None) -> List[Dict[str, Any]]:
+        return self._lookup("by_product", normalize_name(product_name), snap)
+
+    def by_amount_range(self, low: float, high: float, snap: Optional[POSnapshot] = None) -> List[Dict[str, Any]]:
+        """Rows with ``low <= expected_amount <= high`` via bisection of the sorted amounts."""
+        snap = snap or self.snapshot()
+        lo = bisect.bisect_left(snap.amount_keys, low)
+        hi = bisect.bisect_right(snap.amount_keys, high)
+        self._stats["lookups"] += 1
+        return [snap.rows[i] for i in snap.amount_rows[lo:hi]]
+
+    def by_order_ids(self, order_ids: Iterable[Any], snap: Optional[POSnapshot] = None) -> Dict[str, List[Dict[str, Any]]]:
+        """Batched ``by_order_id``: normalized order key -> rows (keys without rows are left out)."""
+        return self._lookup_many("by_order_id", {normalize_key(v) for v in order_ids}, snap)
+
+    def by_invoice_numbers(
+        self, invoice_numbers: Iterable[Any], snap: Optional[POSnapshot] = None
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        return self._lookup_many("by_invoice_number", {normalize_key(v) for v in invoice_numbers}, snap)
+
+    def by_customers(self, customer_names: Iterable[Any], snap: Optional[POSnapshot] = None) -> Dict[str, List[Dict[str, Any]]]:
+        return self._lookup_many("by_customer", {normalize_name(v) for v in customer_names}, snap)
+
+    def by_skus(self, skus: Iterable[Any], snap: Optional[POSnapshot] = None) -> Dict[str, List[Dict[str, Any]]]:
+        return self._lookup_many("by_sku", {normalize_key(v) for v in skus}, snap)
+
+    def rows_for_keys(self, field: str, keys: Iterable[str], snap: Optional[POSnapshot] = None) -> List[Dict[str, Any]]:
+        """Rows of every (already normalized) key of ``field``, in master order."""
+        snap = snap or self.snapshot()
+        index = getattr(snap, INDEXES[field])
+        return [snap.rows[p] for p in sorted(p for key in set(keys) for p in index.get(key, []))]
+
+    def customer_names(self) -> Dict[str, List[int]]:
+        """Normalized customer name -> row positions (for fuzzy fallbacks)."""
+        return self.snapshot().by_customer
+
+    def rows(self, positions: List[int]) -> List[Dict[str, Any]]:
+        snap = self.snapshot()
+        return [snap.rows[i] for i in positions]
+
+    def _lookup(self, index: str, key: str, snap: Optional[POSnapshot] = None) -> List[Dict[str, Any]]:
+        snap = snap or self.snapshot()
+        self._stats["lookups"] += 1
+        if not key:
+            return []
+        positions = getattr(snap, index).get(key, [])
+        if positions:
+            self._stats["index_hits"] += 1
+        return [snap.rows[i] for i in positions]
+
+    def _lookup_many(self, index: str, keys: set, snap: Optional[POSnapshot] = None) -> Dict[str, List[Dict[str, Any]]]:
+        snap = snap or self.snapshot()
+        keys.discard("")
+        self._stats["lookups"] += len(keys)
+        positions = getattr(snap, index)
+        found = {key: [snap.rows[i] for i in positions[key]] for key in keys if key in positions}
+        self._stats["index_hits"] += len(found)
+        return found
+
+    def stats(self) -> Dict[str, Any]:
+        snap = self._snapshot
+        stats = dict(self._stats)
+        stats.update({
+            "backend": "memory",
+            "path": self.path,
+            "delta_path": self.delta_path,
+            "po_version": snap.version if snap else 0,
+            "rows": len(snap) if snap else 0,
+            "customers": len(snap.by_customer) if snap else 0,
+            "skus": len(snap.by_sku) if snap else 0,
+            "watching": self._watcher is not None,
+            "hit_rate": round(stats["index_hits"] / stats["lookups"], 3) if stats["lookups"] else 0.0,
+        })
+        return stats
+
+
+@lru_cache(maxsize=None)
+def get_po_repository(
+    path: str, delta_path: Optional[str] = None, check_interval_s: float = 5.0, watch: bool = True
+) -> PurchaseOrderRepository:
+    """Shared repository per PO file, so every agent instance reuses one resident copy."""
+    return PurchaseOrderRepository(
+        os.path.abspath(path),
+        check_interval_s=check_interval_s,
+        delta_path=os.path.abspath(delta_path) if delta_path else None,
+        watch=watch,
+    )
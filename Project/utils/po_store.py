@@ -0,0 +1,435 @@
+"""
+SQLite-backed purchase-order store.
+
+For PO masters too large to keep resident in every instance,
+``SQLitePOStore`` keeps the rows in a stdlib ``sqlite3`` database with
+indexes on ``order_id``, ``invoice_number``, the normalized customer name,
+the SKU, the normalized product name and ``expected_amount``. It serves the same lookups as
+``po_repository.PurchaseOrderRepository`` (single and batched), so
+ValidationAgent can switch backends by config (``po_backend: sqlite``).
+
+Only the distinct customer names / order ids are held in memory, and only
+when fuzzy blocking needs them; rows are read on demand.
+
+Bulk import from the master CSV schema
+(``invoice_number,order_id,customer_name,item_name,quantity,rate,expected_amount``)
+streams the file in batches inside a single transaction, so readers see the
+old or the new master, never a mix. Each import bumps ``po_version``.
+``snapshot()`` pins a version: the view holds a read transaction on its own
+connection (WAL keeps it consistent while imports commit), and every lookup
+given that view reads through it, so one validation never mixes two
+masters. Close the view when done; an open view only holds back WAL
+checkpoints.
+
+The store does not import anything by itself: load the master with the
+``import`` command below before starting the workflow.
+Item names are split into ``po_repository.ITEM_COLUMNS`` on import; databases
+created before those columns existed are migrated and back-filled on open.
+
+Usage:
+    python -m utils.po_store import --csv data/purchase_orders.csv --db output/po_store/purchase_orders.sqlite
+    python -m utils.po_store stats --db output/po_store/purchase_orders.sqlite
+"""
+
+import os
+import csv
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import threading
+from functools import lru_cache
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+from utils.fuzzy_matcher import BatchFuzzyMatcher
+from utils.blocking_index import BlockingIndex
+from utils.po_repository import ITEM_COLUMNS, normalize_key, normalize_name, coerce_row, structure_row
+from utils.logger import get_logger
+
+PO_COLUMNS = ["invoice_number", "order_id", "customer_name", "item_name", "quantity", "rate", "expected_amount"]
+ROW_COLUMNS = PO_COLUMNS + ITEM_COLUMNS
+KEY_COLUMNS = {
+    "order_id": "order_key", "invoice_number": "invoice_key", "customer": "customer_key",
+    "sku": "sku_key", "product": "product_key",
+}
+# stays below SQLITE_MAX_VARIABLE_NUMBER on old builds (999)
+MAX_PARAMS = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS purchase_orders (
+    id INTEGER PRIMARY KEY,
+    invoice_number, order_id, customer_name, item_name, quantity, rate, expected_amount,
+    product_name, sub_category, category, sku,
+    order_key TEXT, invoice_key TEXT, customer_key TEXT, sku_key TEXT, product_key TEXT
+);
+CREATE TABLE IF NOT EXISTS po_meta (key TEXT PRIMARY KEY, value);
+"""
+# created after the item-column migration, which older databases need first
+_INDEXES = """
+CREATE INDEX IF NOT EXISTS ix_po_order_key ON purchase_orders(order_key);
+CREATE INDEX IF NOT EXISTS ix_po_invoice_key ON purchase_orders(invoice_key);
+CREATE INDEX IF NOT EXISTS ix_po_customer_key ON purchase_orders(customer_key);
+CREATE INDEX IF NOT EXISTS ix_po_sku_key ON purchase_orders(sku_key);
+CREATE INDEX IF NOT EXISTS ix_po_product_key ON purchase_orders(product_key);
+CREATE INDEX IF NOT EXISTS ix_po_expected_amount ON purchase_orders(expected_amount);
+"""
+
+
+class SQLitePOView:
+    """
+    One ``po_version`` of the store, as handed to ValidationAgent. Rows are
+    read at lookup time inside a read transaction opened with the view, so
+    every lookup sees the import ``version`` was read from, whatever is
+    imported meanwhile. ``close()`` ends the transaction.
+    """
+
+    def __init__(self, store: "SQLitePOStore"):
+        self.store = store
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = store._connect(isolation_level=None, check_same_thread=False)
+        self._conn.execute("BEGIN")
+        # the first read fixes the transaction's snapshot
+        row = self._conn.execute("SELECT value FROM po_meta WHERE key = 'po_version'").fetchone()
+        self.version = int(row[0]) if row else 0
+
+    def query(self, sql: str, params: Iterable[Any] = ()) -> List[sqlite3.Row]:
+        with self._lock:
+            if self._conn is None:
+                raise RuntimeError(f"PO view of version {self.version} is closed")
+            return self._conn.execute(sql, tuple(params)).fetchall()
+
+    def close(self):
+        with self._lock:
+            conn, self._conn = self._conn, None
+        if conn is not None:
+            conn.rollback()
+            conn.close()
+
+    def __enter__(self) -> "SQLitePOView":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+    def __len__(self) -> int:
+        return self.query("SELECT COUNT(*) FROM purchase_orders")[0][0]
+
+    def blocking_index(
+        self, field: str, ngram: int = 3, min_overlap: float = 0.3, max_candidates: Optional[int] = 500
+    ) -> BlockingIndex:
+        return self.store._key_index(self, ("blocking", field, ngram, min_overlap, max_candidates))
+
+    def customer_matcher(self) -> BatchFuzzyMatcher:
+        return self.store._key_index(self, ("matcher", "customer"))
+
+
+class SQLitePOStore:
+    """PO rows in SQLite with indexed single and batched lookups."""
+
+    def __init__(self, db_path: str):
+        self.path = db_path
+        self.logger = get_logger("SQLitePOStore")
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._key_indexes: Dict[Tuple, Any] = {}
+        self._key_indexes_version = -1
+        self._stats = {"imports": 0, "lookups": 0, "index_hits": 0, "queries": 0}
+
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        conn = self._conn()
+        conn.executescript(_SCHEMA)
+        self._migrate(conn)
+        conn.executescript(_INDEXES)
+        conn.commit()
+
+    @staticmethod
+    def _migrate(conn: sqlite3.Connection):
+        """Add and back-fill the item columns on databases created before them."""
+        existing = {r[1] for r in conn.execute("PRAGMA table_info(purchase_orders)")}
+        missing = [c for c in ITEM_COLUMNS + ["sku_key", "product_key"] if c not in existing]
+        if not missing:
+            return
+        with conn:
+            for column in missing:
+                conn.execute(f"ALTER TABLE purchase_orders ADD COLUMN {column}")
+            rows = conn.execute("SELECT id, item_name FROM purchase_orders").fetchall()
+            conn.executemany(
+                f"UPDATE purchase_orders SET {', '.join(c + ' = ?' for c in ITEM_COLUMNS)}, sku_key = ?, product_key = ? "
+                "WHERE id = ?",
+                [SQLitePOStore._item_values(structure_row({"item_name": item_name})) + (row_id,) for row_id, item_name in rows],
+            )
+
+    def _connect(self, **kwargs) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, **kwargs)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _conn(self) -> sqlite3.Connection:
+        # one connection per thread; sqlite3 connections are not shared safely
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def _query(self, sql: str, params: Iterable[Any] = (), snap: Optional[SQLitePOView] = None) -> List[sqlite3.Row]:
+        """Run a read in ``snap``'s transaction, or on this thread's connection (latest master)."""
+        if snap is not None:
+            return snap.query(sql, params)
+        return self._conn().execute(sql, tuple(params)).fetchall()
+
+    def __len__(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM purchase_orders").fetchone()[0]
+
+    def has_rows(self) -> bool:
+        return self._conn().execute("SELECT 1 FROM purchase_orders LIMIT 1").fetchone() is not None
+
+    @property
+    def po_version(self) -> int:
+        row = self._conn().execute("SELECT value FROM po_meta WHERE key = 'po_version'").fetchone()
+        return int(row[0]) if row else 0
+
+    def snapshot(self) -> SQLitePOView:
+        """Pin the current ``po_version`` (close the view when done)."""
+        return SQLitePOView(self)
+
+    # ------------------------------------------------------------------
+    # Bulk import
+    # ------------------------------------------------------------------
+    def import_csv(self, csv_path: str, replace: bool = True, batch_size: int = 10000) -> int:
+        """
+        Load a PO master CSV (streamed, ``batch_size`` rows per insert batch).
+        ``replace`` swaps the whole master; otherwise rows are appended.
+        Returns the number of rows imported.
+        """
+        start = time.perf_counter()
+        conn = self._conn()
+        count = 0
+        with open(csv_path, "r", encoding="utf-8", newline="") as f:
+            reader = csv.reader(f)
+            header = [c.strip().lower() for c in next(reader, [])]
+            missing = [c for c in PO_COLUMNS if c not in header]
+            if missing:
+                raise ValueError(f"PO CSV {csv_path} is missing columns: {', '.join(missing)}")
+            with conn:  # one transaction: readers see the old or the new master
+                if replace:
+                    conn.execute("DELETE FROM purchase_orders")
+                batch = []
+                for values in reader:
+                    if not values:
+                        continue
+                    batch.append(self._record(coerce_row(dict(zip(header, values)))))
+                    if len(batch) >= batch_size:
+                        count += self._insert(conn, batch)
+                        batch = []
+                count += self._insert(conn, batch)
+                conn.execute(
+                    "INSERT INTO po_meta(key, value) VALUES ('po_version', 1) "
+                    "ON CONFLICT(key) DO UPDATE SET value = value + 1"
+                )
+                conn.execute(
+                    "INSERT INTO po_meta(key, value) VALUES ('source', ?) "
+                    "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                    (os.path.abspath(csv_path),),
+                )
+        conn.execute("ANALYZE")
+        self._stats["imports"] += 1
+        self.logger.info(
+            f"Imported {count} PO rows from {csv_path} into {self.path} as po_version {self.po_version} "
+            f"in {(time.perf_counter() - start) * 1000:.0f}ms"
+        )
+        return count
+
+    @staticmethod
+    def _item_values(row: Dict[str, Any]) -> Tuple:
+        return tuple(row.get(c) for c in ITEM_COLUMNS) + (
+            normalize_key(row.get("sku")) or None,
+            normalize_name(row.get("product_name")) or None,
+        )
+
+    @staticmethod
+    def _record(row: Dict[str, Any]) -> Tuple:
+        row = structure_row(row)
+        return tuple(row.get(c) for c in PO_COLUMNS) + SQLitePOStore._item_values(row) + (
+            normalize_key(row.get("order_id")) or None,
+            normalize_key(row.get("invoice_number")) or None,
+            normalize_name(row.get("customer_name")) or None,
+        )
+
+    @staticmethod
+    def _insert(conn: sqlite3.Connection, batch: List[Tuple]) -> int:
+        if batch:
+            conn.executemany(
+                f"INSERT INTO purchase_orders({', '.join(ROW_COLUMNS)}, sku_key, product_key, "
+                f"order_key, invoice_key, customer_key) VALUES ({', '.join('?' * (len(ROW_COLUMNS) + 5))})",
+                batch,
+            )
+        return len(batch)
+
+    # ------------------------------------------------------------------
+    # Fuzzy key indexes (distinct keys only, rebuilt per po_version)
+    # ------------------------------------------------------------------
+    def distinct_keys(self, field: str, snap: Optional[SQLitePOView] = None) -> List[str]:
+        column = KEY_COLUMNS[field]
+        # first-seen order, like the in-memory indexes
+        rows = self._query(
+            f"SELECT {column} FROM purchase_orders WHERE {column} IS NOT NULL GROUP BY {column} ORDER BY MIN(id)",
+            snap=snap,
+        )
+        return [r[0] for r in rows]
+
+    def _key_index(self, snap: SQLitePOView, params: Tuple):
+        with self._lock:
+            if snap.version != self._key_indexes_version:
+                self._key_indexes = {}
+                self._key_indexes_version = snap.version
+            index = self._key_indexes.get(params)
+            if index is None:
+                if params[0] == "matcher":
+                    index = BatchFuzzyMatcher(self.distinct_keys(params[1], snap))
+                else:
+                    _, field, ngram, min_overlap, max_candidates = params
+                    index = BlockingIndex(ngram, min_overlap, max_candidates, phonetic=field == "customer")
+                    index.add_many(self.distinct_keys(field, snap))
+                self._key_indexes[params] = index
+            return index
+
+    # ------------------------------------------------------------------
+    # Lookups
+    # ------------------------------------------------------------------
+    def by_order_id(self, order_id: Any, snap: Optional[SQLitePOView] = None) -> List[Dict[str, Any]]:
+        return self._lookup("order_id", normalize_key(order_id), snap)
+
+    def by_invoice_number(self, invoice_number: Any, snap: Optional[SQLitePOView] = None) -> List[Dict[str, Any]]:
+        return self._lookup("invoice_number", normalize_key(invoice_number), snap)
+
+    def by_customer(self, customer_name: Any, snap: Optional[SQLitePOView] = None) -> List[Dict[str, Any]]:
+        return self._lookup("customer", normalize_name(customer_name), snap)
+
+    def by_sku(self, sku: Any, snap: Optional[SQLitePOView] = None) -> List[Dict[str, Any]]:
+        return self._lookup("sku", normalize_key(sku), snap)
+
+    def by_product(self, product_name: Any, snap: Optional[SQLitePOView] = None) -> List[Dict[str, Any]]:
+        return self._lookup("product", normalize_name(product_name), snap)
+
+    def by_amount_range(self, low: float, high: float, snap: Optional[SQLitePOView] = None) -> List[Dict[str, Any]]:
+        """Rows with ``low <= expected_amount <= high`` (range scan on the amount index)."""
+        self._stats["lookups"] += 1
+        self._stats["queries"] += 1
+        rows = self._query(
+            f"SELECT {', '.join(ROW_COLUMNS)} FROM purchase_orders "
+            "WHERE expected_amount BETWEEN ? AND ? ORDER BY expected_amount, id",
+            (low, high),
+            snap,
+        )
+        return [dict(r) for r in rows]
+
+    def by_order_ids(self, order_ids: Iterable[Any], snap: Optional[SQLitePOView] = None) -> Dict[str, List[Dict[str, Any]]]:
+        """Batched ``by_order_id``: normalized order key -> rows (keys without rows are left out)."""
+        return self._lookup_many("order_id", {normalize_key(v) for v in order_ids}, snap)
+
+    def by_invoice_numbers(
+        self, invoice_numbers: Iterable[Any], snap: Optional[SQLitePOView] = None
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        return self._lookup_many("invoice_number", {normalize_key(v) for v in invoice_numbers}, snap)
+
+    def by_customers(self, customer_names: Iterable[Any], snap: Optional[SQLitePOView] = None) -> Dict[str, List[Dict[str, Any]]]:
+        return self._lookup_many("customer", {normalize_name(v) for v in customer_names}, snap)
+
+    def by_skus(self, skus: Iterable[Any], snap: Optional[SQLitePOView] = None) -> Dict[str, List[Dict[str, Any]]]:
+        return self._lookup_many("sku", {normalize_key(v) for v in skus}, snap)
+
+    def rows_for_keys(self, field: str, keys: Iterable[str], snap: Optional[SQLitePOView] = None) -> List[Dict[str, Any]]:
+        """Rows of every (already normalized) key of ``field``, in master order."""
+        return [row for _, row in self._select(field, {k for k in keys if k}, snap)]
+
+    def _lookup(self, field: str, key: str, snap: Optional[SQLitePOView] = None) -> List[Dict[str, Any]]:
+        self._stats["lookups"] += 1
+        if not key:
+            return []
+        rows = [row for _, row in self._select(field, {key}, snap)]
+        if rows:
+            self._stats["index_hits"] += 1
+        return rows
+
+    def _lookup_many(self, field: str, keys: set, snap: Optional[SQLitePOView] = None) -> Dict[str, List[Dict[str, Any]]]:
+        keys.discard("")
+        self._stats["lookups"] += len(keys)
+        found: Dict[str, List[Dict[str, Any]]] = {}
+        for key, row in self._select(field, keys, snap):
+            found.setdefault(key, []).append(row)
+        self._stats["index_hits"] += len(found)
+        return found
+
+    def _select(self, field: str, keys: set, snap: Optional[SQLitePOView] = None) -> List[Tuple[str, Dict[str, Any]]]:
+        column = KEY_COLUMNS[field]
+        keys = list(keys)
+        results: List[Tuple[int, str, Dict[str, Any]]] = []
+        for start in range(0, len(keys), MAX_PARAMS):
+            chunk = keys[start:start + MAX_PARAMS]
+            self._stats["queries"] += 1
+            rows = self._query(
+                f"SELECT id, {column} AS k, {', '.join(ROW_COLUMNS)} FROM purchase_orders "
+                f"WHERE {column} IN ({', '.join('?' * len(chunk))})",
+                chunk,
+                snap,
+            )
+            for r in rows:
+                results.append((r["id"], r["k"], {c: r[c] for c in ROW_COLUMNS}))
+        results.sort(key=lambda item: item[0])
+        return [(key, row) for _, key, row in results]
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        conn = self._conn()
+        stats.update({
+            "backend": "sqlite",
+            "path": self.path,
+            "po_version": self.po_version,
+            "rows": len(self),
+            "customers": conn.execute(
+                "SELECT COUNT(DISTINCT customer_key) FROM purchase_orders"
+            ).fetchone()[0],
+            "skus": conn.execute("SELECT COUNT(DISTINCT sku_key) FROM purchase_orders").fetchone()[0],
+            "hit_rate": round(stats["index_hits"] / stats["lookups"], 3) if stats["lookups"] else 0.0,
+        })
+        return stats
+
+
+@lru_cache(maxsize=None)
+def get_po_store(db_path: str) -> SQLitePOStore:
+    """Shared store per database file."""
+    return SQLitePOStore(os.path.abspath(db_path))
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="SQLite purchase-order store")
+    sub = parser.add_subparsers(dest="command", required=True)
+    imp = sub.add_parser("import", help="bulk-import a PO master CSV")
+    imp.add_argument("--csv", required=True)
+    imp.add_argument("--db", required=True)
+    imp.add_argument("--append", action="store_true", help="add rows instead of replacing the master")
+    imp.add_argument("--batch-size", type=int, default=10000)
+    st = sub.add_parser("stats", help="print store statistics")
+    st.add_argument("--db", required=True)
+    args = parser.parse_args(argv)
+
+    store = SQLitePOStore(args.db)
+    if args.command == "import":
+        count = store.import_csv(args.csv, replace=not args.append, batch_size=args.batch_size)
+        print(f"Imported {count} rows into {args.db} (po_version {store.po_version})")
+    else:
+        print(json.dumps(store.stats(), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
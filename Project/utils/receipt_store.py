@@ -0,0 +1,321 @@
+"""
+Goods-receipt store for three-way matching.
+
+Invoice, PO and goods receipt are compared per (order, product). Receipts come
+from a CSV (kept resident, like the PO master) or a SQLite database, both
+indexed by normalized ``order_id`` and SKU (``po_repository.item_key``:
+explicit ``sku`` column, else the SKU at the end of the item name, else the
+normalized name).
+
+Receipt CSV schema (one row per receipt line; repeated receipts add up):
+
+    receipt_id,order_id,sku,item_name,quantity_received,received_date
+
+``received_quantities(order_ids)`` resolves any number of orders in one pass
+(one ``IN`` query per 500 orders for SQLite). ``ReceiptBatchLoader``
+coalesces the per-invoice lookups that concurrent workflow runs issue on one
+event loop within ``window_ms`` into one such bulk call, so batch runs do not
+issue one query per invoice, let alone per item.
+
+No receipts ship with the sample data, so ValidationAgent runs the
+three-way match only when configured with ``enable_three_way_match: true``
+and a ``receipts_path`` (a CSV as above, or a database built by ``import``).
+
+Usage:
+    python -m utils.receipt_store import --csv data/goods_receipts.csv --db output/receipts/goods_receipts.sqlite
+"""
+
+import os
+import csv
+import sys
+import time
+import sqlite3
+import asyncio
+import argparse
+import threading
+from functools import lru_cache
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+from utils.po_repository import normalize_key, item_key
+from utils.logger import get_logger
+
+RECEIPT_COLUMNS = ["receipt_id", "order_id", "sku", "item_name", "quantity_received", "received_date"]
+# stays below SQLITE_MAX_VARIABLE_NUMBER on old builds (999)
+MAX_PARAMS = 500
+
+
+def _quantity(value: Any) -> float:
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def read_receipt_rows(path: str) -> Iterable[Dict[str, Any]]:
+    """Receipt CSV rows with lower-cased headers; ``order_id`` and ``quantity_received`` are required."""
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        reader = csv.DictReader(f)
+        reader.fieldnames = [c.strip().lower() for c in reader.fieldnames or []]
+        missing = [c for c in ("order_id", "quantity_received") if c not in reader.fieldnames]
+        if missing:
+            raise ValueError(f"Receipt CSV {path} is missing columns: {', '.join(missing)}")
+        for row in reader:
+            yield row
+
+
+class CSVReceiptStore:
+    """Receipts CSV held in memory as order -> SKU -> received quantity; reloaded when the file changes."""
+
+    def __init__(self, path: str, check_interval_s: float = 5.0):
+        self.path = path
+        self.check_interval_s = max(0.0, float(check_interval_s))
+        self.logger = get_logger("CSVReceiptStore")
+        self._received: Dict[str, Dict[str, float]] = {}
+        self._by_sku: Dict[str, List[str]] = {}
+        self._signature: Optional[Tuple[float, int]] = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+        self._stats = {"loads": 0, "lookups": 0, "index_hits": 0, "bulk_calls": 0}
+
+    def _refresh(self):
+        if self._signature is not None and time.monotonic() - self._last_check < self.check_interval_s:
+            return
+        with self._lock:
+            self._last_check = time.monotonic()
+            st = os.stat(self.path)
+            signature = (st.st_mtime, st.st_size)
+            if signature == self._signature:
+                return
+            received: Dict[str, Dict[str, float]] = {}
+            by_sku: Dict[str, List[str]] = {}
+            for row in read_receipt_rows(self.path):
+                order = normalize_key(row.get("order_id"))
+                sku = item_key(row.get("item_name"), row.get("sku"))
+                if not order or not sku:
+                    continue
+                skus = received.setdefault(order, {})
+                if sku not in skus:
+                    by_sku.setdefault(sku, []).append(order)
+                skus[sku] = skus.get(sku, 0.0) + _quantity(row.get("quantity_received"))
+            # swap in whole: readers see the old or the new receipts
+            self._received, self._by_sku, self._signature = received, by_sku, signature
+            self._stats["loads"] += 1
+            self.logger.info(f"Loaded receipts for {len(received)} orders from {self.path}")
+
+    def received_quantities(self, order_ids: Iterable[Any]) -> Dict[str, Dict[str, float]]:
+        """Normalized order key -> {SKU: total received} for every order that has receipts."""
+        self._refresh()
+        keys = {normalize_key(o) for o in order_ids} - {""}
+        received = self._received
+        found = {k: dict(received[k]) for k in keys if k in received}
+        self._stats["bulk_calls"] += 1
+        self._stats["lookups"] += len(keys)
+        self._stats["index_hits"] += len(found)
+        return found
+
+    def orders_for_sku(self, sku: Any) -> List[str]:
+        """Order keys with receipts for ``sku``."""
+        self._refresh()
+        return list(self._by_sku.get(normalize_key(sku), []))
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        stats.update({
+            "backend": "csv",
+            "path": self.path,
+            "orders": len(self._received),
+            "hit_rate": round(stats["index_hits"] / stats["lookups"], 3) if stats["lookups"] else 0.0,
+        })
+        return stats
+
+
+class SQLiteReceiptStore:
+    """Receipts in SQLite with a composite (order, SKU) index; aggregated in SQL."""
+
+    _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS goods_receipts (
+        id INTEGER PRIMARY KEY,
+        receipt_id TEXT, order_id TEXT, sku TEXT, item_name TEXT,
+        quantity_received REAL, received_date TEXT,
+        order_key TEXT NOT NULL, sku_key TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS ix_receipts_order_sku ON goods_receipts(order_key, sku_key);
+    CREATE INDEX IF NOT EXISTS ix_receipts_sku ON goods_receipts(sku_key);
+    """
+
+    def __init__(self, db_path: str):
+        self.path = db_path
+        self.logger = get_logger("SQLiteReceiptStore")
+        self._local = threading.local()
+        self._stats = {"imports": 0, "lookups": 0, "index_hits": 0, "bulk_calls": 0, "queries": 0}
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        conn = self._conn()
+        conn.executescript(self._SCHEMA)
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        # one connection per thread; sqlite3 connections are not shared safely
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def import_csv(self, csv_path: str, replace: bool = True, batch_size: int = 10000) -> int:
+        """Load a receipts CSV in batches inside one transaction; returns the row count."""
+        conn = self._conn()
+        count = 0
+        with conn:
+            if replace:
+                conn.execute("DELETE FROM goods_receipts")
+            batch = []
+            for row in read_receipt_rows(csv_path):
+                order, sku = normalize_key(row.get("order_id")), item_key(row.get("item_name"), row.get("sku"))
+                if not order or not sku:
+                    continue
+                batch.append((
+                    row.get("receipt_id"), row.get("order_id"), row.get("sku"), row.get("item_name"),
+                    _quantity(row.get("quantity_received")), row.get("received_date"), order, sku,
+                ))
+                if len(batch) >= batch_size:
+                    count += self._insert(conn, batch)
+                    batch = []
+            count += self._insert(conn, batch)
+        self._stats["imports"] += 1
+        self.logger.info(f"Imported {count} receipt rows from {csv_path} into {self.path}")
+        return count
+
+    @staticmethod
+    def _insert(conn: sqlite3.Connection, batch: List[Tuple]) -> int:
+        if batch:
+            conn.executemany(
+                f"INSERT INTO goods_receipts({', '.join(RECEIPT_COLUMNS)}, order_key, sku_key) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                batch,
+            )
+        return len(batch)
+
+    def received_quantities(self, order_ids: Iterable[Any]) -> Dict[str, Dict[str, float]]:
+        """Normalized order key -> {SKU: total received} for every order that has receipts."""
+        keys = list({normalize_key(o) for o in order_ids} - {""})
+        found: Dict[str, Dict[str, float]] = {}
+        conn = self._conn()
+        for start in range(0, len(keys), MAX_PARAMS):
+            chunk = keys[start:start + MAX_PARAMS]
+            self._stats["queries"] += 1
+            cur = conn.execute(
+                "SELECT order_key, sku_key, SUM(quantity_received) FROM goods_receipts "
+                f"WHERE order_key IN ({', '.join('?' * len(chunk))}) GROUP BY order_key, sku_key",
+                chunk,
+            )
+            for order, sku, quantity in cur:
+                found.setdefault(order, {})[sku] = float(quantity or 0)
+        self._stats["bulk_calls"] += 1
+        self._stats["lookups"] += len(keys)
+        self._stats["index_hits"] += len(found)
+        return found
+
+    def orders_for_sku(self, sku: Any) -> List[str]:
+        cur = self._conn().execute(
+            "SELECT DISTINCT order_key FROM goods_receipts WHERE sku_key = ?", (normalize_key(sku),)
+        )
+        return [r[0] for r in cur]
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        stats.update({
+            "backend": "sqlite",
+            "path": self.path,
+            "orders": self._conn().execute("SELECT COUNT(DISTINCT order_key) FROM goods_receipts").fetchone()[0],
+            "hit_rate": round(stats["index_hits"] / stats["lookups"], 3) if stats["lookups"] else 0.0,
+        })
+        return stats
+
+
+class ReceiptBatchLoader:
+    """
+    Coalesces ``load(order_id)`` calls made on one event loop within
+    ``window_ms`` into a single ``received_quantities`` call.
+    """
+
+    def __init__(self, store, window_ms: float = 2.0, max_batch: int = 500):
+        self.store = store
+        self.window_s = max(0.0, float(window_ms)) / 1000.0
+        self.max_batch = max(1, int(max_batch))
+        # per event loop: futures are bound to the loop that created them
+        self._pending: Dict[asyncio.AbstractEventLoop, Dict[str, asyncio.Future]] = {}
+        # the window timer of each loop's pending batch
+        self._timers: Dict[asyncio.AbstractEventLoop, asyncio.TimerHandle] = {}
+        self._stats = {"loads": 0, "flushes": 0}
+
+    async def load(self, order_id: Any) -> Dict[str, float]:
+        """{SKU: received quantity} for one order (empty when it has no receipts)."""
+        key = normalize_key(order_id)
+        if not key:
+            return {}
+        loop = asyncio.get_running_loop()
+        pending = self._pending.get(loop)
+        if pending is None:
+            pending = self._pending[loop] = {}
+            self._timers[loop] = loop.call_later(self.window_s, self._flush, loop)
+        future = pending.get(key)
+        if future is None:
+            future = pending[key] = loop.create_future()
+        self._stats["loads"] += 1
+        if len(pending) >= self.max_batch:
+            self._flush(loop)
+        # the future is shared by every caller of this order: cancelling one must not cancel the rest
+        return await asyncio.shield(future)
+
+    def _flush(self, loop: asyncio.AbstractEventLoop):
+        # a full batch flushes early; its timer must not cut the next batch's window short
+        timer = self._timers.pop(loop, None)
+        if timer is not None:
+            timer.cancel()
+        pending = self._pending.pop(loop, None)
+        if not pending:
+            return
+        self._stats["flushes"] += 1
+        try:
+            found = self.store.received_quantities(pending)
+        except Exception as e:
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for key, future in pending.items():
+            if not future.done():
+                future.set_result(found.get(key, {}))
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        stats["avg_batch"] = round(stats["loads"] / stats["flushes"], 1) if stats["flushes"] else 0.0
+        return stats
+
+
+@lru_cache(maxsize=None)
+def get_receipt_store(path: str):
+    """Shared store per receipts source: ``.sqlite`` / ``.db`` files are SQLite, anything else CSV."""
+    path = os.path.abspath(path)
+    if os.path.splitext(path)[1].lower() in (".sqlite", ".sqlite3", ".db"):
+        return SQLiteReceiptStore(path)
+    return CSVReceiptStore(path)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Goods-receipt store")
+    sub = parser.add_subparsers(dest="command", required=True)
+    imp = sub.add_parser("import", help="bulk-import a receipts CSV into SQLite")
+    imp.add_argument("--csv", required=True)
+    imp.add_argument("--db", required=True)
+    imp.add_argument("--append", action="store_true")
+    args = parser.parse_args(argv)
+
+    count = SQLiteReceiptStore(args.db).import_csv(args.csv, replace=not args.append)
+    print(f"Imported {count} receipt rows into {args.db}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
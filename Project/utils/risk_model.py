@@ -0,0 +1,341 @@
+"""
+Local risk model trained on past assessments.
+
+The RiskAgent's LLM call only produces a ``low|medium|high|critical`` hint.
+Most invoices look like ones already assessed, so a small model trained on
+those outcomes can give the same hint without the call:
+
+- ``RiskHistory`` appends one record per assessment (feature values, vendor,
+  final risk level) and per human review decision to a JSON-lines log, and
+  keeps per-vendor counts in memory for the vendor-history features.
+- ``python -m utils.risk_model train`` reads the log into a feature matrix
+  and fits a multinomial logistic regression (NumPy, full-batch gradient
+  descent with L2). The label is the assessed level, raised to at least
+  ``high`` when a reviewer rejected the invoice and capped at ``medium``
+  when one approved it. Assessments whose hint came from the model itself
+  are left out, so a retrained model never learns its own predictions.
+- ``RiskModel`` is saved as a compact ``.npz`` (standardization, weights,
+  level names); ``predict_proba`` scores a whole batch with one matrix
+  product.
+
+Usage:
+    python -m utils.risk_model train --history output/risk_history/risk_history.jsonl --out output/models/risk_model.npz
+    python -m utils.risk_model stats --history output/risk_history/risk_history.jsonl
+"""
+
+import io
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import threading
+from datetime import date, datetime
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+from utils.po_repository import normalize_name
+from utils.logger import get_logger
+
+LEVELS = ["low", "medium", "high", "critical"]
+FEATURES = [
+    "log_amount",
+    "discrepancies",
+    "po_missing",
+    "amount_mismatch",
+    "quantity_mismatch",
+    "rate_mismatch",
+    "items",
+    "due_days",
+    "due_missing",
+    "extraction_confidence",
+    "vendor_invoices",
+    "vendor_high_rate",
+]
+# due-date deltas beyond this many days carry no extra signal
+MAX_DUE_DAYS = 90.0
+
+
+def invoice_features(
+    invoice_data: Any,
+    validation_result: Any,
+    due_date: Optional[date] = None,
+    vendor: Optional[Dict[str, Any]] = None,
+    today: Optional[date] = None,
+) -> Dict[str, float]:
+    """Named feature values of one invoice; ``vendor`` is ``RiskHistory.vendor_history`` before this invoice."""
+    total = float(getattr(invoice_data, "total", None) or 0.0)
+    vendor = vendor or {}
+    features = {
+        "log_amount": math.log1p(max(total, 0.0)),
+        "discrepancies": float(len(getattr(validation_result, "discrepancies", None) or [])),
+        "po_missing": 0.0 if getattr(validation_result, "po_found", False) else 1.0,
+        "amount_mismatch": 1.0 if getattr(validation_result, "amount_match", None) is False else 0.0,
+        "quantity_mismatch": 1.0 if getattr(validation_result, "quantity_match", None) is False else 0.0,
+        "rate_mismatch": 1.0 if getattr(validation_result, "rate_match", None) is False else 0.0,
+        "items": float(len(getattr(invoice_data, "item_details", None) or [])),
+        "due_days": 0.0,
+        "due_missing": 1.0,
+        "extraction_confidence": float(getattr(invoice_data, "extraction_confidence", None) or 0.0),
+        "vendor_invoices": math.log1p(float(vendor.get("invoices", 0))),
+        "vendor_high_rate": float(vendor.get("high_rate", 0.0)),
+    }
+    if due_date is not None:
+        days = (due_date - (today or datetime.utcnow().date())).days
+        features["due_days"] = float(min(max(days, -MAX_DUE_DAYS), MAX_DUE_DAYS))
+        features["due_missing"] = 0.0
+    return features
+
+
+def feature_matrix(rows: List[Dict[str, float]]) -> np.ndarray:
+    """Rows of named features -> float matrix in ``FEATURES`` order (missing names are 0)."""
+    return np.array([[float(r.get(name, 0.0)) for name in FEATURES] for r in rows], dtype=np.float64).reshape(
+        len(rows), len(FEATURES)
+    )
+
+
+class RiskHistory:
+    """Append-only log of risk assessments and review outcomes with per-vendor counts."""
+
+    def __init__(self, log_path: str = os.path.join("output", "risk_history", "risk_history.jsonl")):
+        self.log_path = log_path
+        self.logger = get_logger("RiskHistory")
+        self._lock = threading.Lock()
+        # process id -> (vendor, high or critical); vendor -> [invoices, high]
+        self._processes: Dict[str, Tuple[str, bool]] = {}
+        self._vendors: Dict[str, List[int]] = {}
+        self._stats = {"assessments": 0, "outcomes": 0, "records": 0}
+
+        directory = os.path.dirname(self.log_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        for record in read_records(self.log_path):
+            if record.get("op") == "assessment":
+                self._count(record["process_id"], record.get("vendor") or "", record.get("risk_level"))
+            self._stats["records"] += 1
+        self._file = open(self.log_path, "a", encoding="utf-8")
+
+    def _count(self, process_id: str, vendor: str, level: Optional[str]):
+        high = level in ("high", "critical")
+        previous = self._processes.get(process_id)
+        if previous is not None:
+            # re-assessment (retry / resume) replaces the earlier one
+            counts = self._vendors.get(previous[0])
+            if counts:
+                counts[0] -= 1
+                counts[1] -= int(previous[1])
+        counts = self._vendors.setdefault(vendor, [0, 0])
+        counts[0] += 1
+        counts[1] += int(high)
+        self._processes[process_id] = (vendor, high)
+
+    def _append(self, record: Dict[str, Any]):
+        self._file.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self._file.flush()
+        self._stats["records"] += 1
+
+    def vendor_history(self, customer_name: Any) -> Dict[str, Any]:
+        """Earlier assessed invoices of the vendor and the share rated high or critical."""
+        counts = self._vendors.get(normalize_name(customer_name))
+        if not counts or counts[0] <= 0:
+            return {"invoices": 0, "high_rate": 0.0}
+        return {"invoices": counts[0], "high_rate": counts[1] / counts[0]}
+
+    def record_assessment(
+        self, process_id: str, customer_name: Any, features: Dict[str, float], risk_level: str,
+        hint_source: Optional[str] = None,
+    ):
+        vendor = normalize_name(customer_name)
+        with self._lock:
+            self._count(process_id, vendor, risk_level)
+            self._stats["assessments"] += 1
+            self._append({
+                "op": "assessment", "process_id": process_id, "vendor": vendor,
+                "features": features, "risk_level": risk_level, "hint_source": hint_source, "ts": time.time(),
+            })
+
+    def record_outcome(self, process_id: str, decision: str):
+        """Human review decision (``approved`` / ``rejected``) for an assessed invoice."""
+        with self._lock:
+            self._stats["outcomes"] += 1
+            self._append({"op": "outcome", "process_id": process_id, "decision": decision, "ts": time.time()})
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        stats.update({"log_path": self.log_path, "invoices": len(self._processes), "vendors": len(self._vendors)})
+        return stats
+
+
+def read_records(log_path: str):
+    if not os.path.exists(log_path):
+        return
+    with open(log_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue  # torn last line of a crashed writer
+
+
+def training_examples(log_path: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Feature matrix and level indexes from a history log: the latest
+    assessment per invoice not hinted by the model, outcome-adjusted.
+    """
+    assessments: Dict[str, Dict[str, Any]] = {}
+    decisions: Dict[str, str] = {}
+    for record in read_records(log_path):
+        if record.get("op") == "assessment" and record.get("risk_level") in LEVELS:
+            if record.get("hint_source") == "model":
+                continue  # the model's own output is not ground truth
+            assessments[record["process_id"]] = record
+        elif record.get("op") == "outcome":
+            decisions[record["process_id"]] = (record.get("decision") or "").lower()
+
+    rows, labels = [], []
+    for process_id, record in assessments.items():
+        label = LEVELS.index(record["risk_level"])
+        decision = decisions.get(process_id)
+        if decision == "rejected":
+            label = max(label, LEVELS.index("high"))
+        elif decision == "approved":
+            label = min(label, LEVELS.index("medium"))
+        rows.append(record.get("features") or {})
+        labels.append(label)
+    return feature_matrix(rows), np.array(labels, dtype=np.int64)
+
+
+class RiskModel:
+    """Multinomial logistic regression over standardized ``FEATURES``."""
+
+    def __init__(self, mean: np.ndarray, scale: np.ndarray, weights: np.ndarray, bias: np.ndarray,
+                 meta: Optional[Dict[str, Any]] = None):
+        self.mean = mean
+        self.scale = scale
+        self.weights = weights  # (features, levels)
+        self.bias = bias
+        self.meta = meta or {}
+
+    @classmethod
+    def fit(cls, X: np.ndarray, y: np.ndarray, l2: float = 1e-3, epochs: int = 500, lr: float = 0.5,
+            balanced: bool = True) -> "RiskModel":
+        if not len(y):
+            raise ValueError("No training examples")
+        mean = X.mean(axis=0)
+        scale = X.std(axis=0)
+        scale[scale == 0] = 1.0
+        Z = (X - mean) / scale
+
+        k = len(LEVELS)
+        onehot = np.eye(k)[y]
+        counts = np.bincount(y, minlength=k).astype(np.float64)
+        if balanced:
+            # rare levels (critical) weigh as much in total as common ones
+            class_weight = np.where(counts > 0, len(y) / (k * np.maximum(counts, 1)), 0.0)
+            sample_weight = class_weight[y]
+        else:
+            sample_weight = np.ones(len(y))
+        sample_weight /= sample_weight.sum()
+
+        W = np.zeros((Z.shape[1], k))
+        b = np.log(np.maximum(counts, 1) / counts.sum())
+        for _ in range(max(1, int(epochs))):
+            P = _softmax(Z @ W + b)
+            G = (P - onehot) * sample_weight[:, None]
+            W -= lr * (Z.T @ G + l2 * W)
+            b -= lr * G.sum(axis=0)
+
+        model = cls(mean, scale, W, b)
+        predicted = model.predict_proba(X).argmax(axis=1)
+        model.meta = {
+            "trained_at": datetime.utcnow().isoformat(),
+            "samples": int(len(y)),
+            "class_counts": {level: int(c) for level, c in zip(LEVELS, counts)},
+            "train_accuracy": round(float((predicted == y).mean()), 4),
+            "l2": l2,
+            "epochs": int(epochs),
+        }
+        return model
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """Level probabilities, one row per invoice, columns in ``LEVELS`` order."""
+        X = np.atleast_2d(np.asarray(X, dtype=np.float64))
+        return _softmax(((X - self.mean) / self.scale) @ self.weights + self.bias)
+
+    def predict(self, features: Dict[str, float]) -> Tuple[str, float]:
+        """Most likely level of one invoice and its probability."""
+        proba = self.predict_proba(feature_matrix([features]))[0]
+        best = int(proba.argmax())
+        return LEVELS[best], float(proba[best])
+
+    def save(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        buffer = io.BytesIO()
+        np.savez_compressed(
+            buffer, mean=self.mean, scale=self.scale, weights=self.weights, bias=self.bias,
+            features=np.array(FEATURES), levels=np.array(LEVELS), meta=np.array(json.dumps(self.meta)),
+        )
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(buffer.getvalue())
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "RiskModel":
+        with np.load(path, allow_pickle=False) as data:
+            if list(data["features"]) != FEATURES or list(data["levels"]) != LEVELS:
+                raise ValueError(f"Risk model {path} was trained on a different feature set; retrain it")
+            return cls(data["mean"], data["scale"], data["weights"], data["bias"], json.loads(str(data["meta"])))
+
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    logits = logits - logits.max(axis=1, keepdims=True)
+    e = np.exp(logits)
+    return e / e.sum(axis=1, keepdims=True)
+
+
+@lru_cache(maxsize=None)
+def get_risk_history(log_path: str) -> RiskHistory:
+    """Shared history per log file."""
+    return RiskHistory(os.path.abspath(log_path))
+
+
+def load_risk_model(path: str) -> Optional[RiskModel]:
+    """Trained model at ``path``, or ``None`` when none has been trained yet."""
+    if not path or not os.path.exists(path):
+        return None
+    return RiskModel.load(path)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Local risk model")
+    parser.add_argument("command", choices=["train", "stats"])
+    parser.add_argument("--history", default=os.path.join("output", "risk_history", "risk_history.jsonl"))
+    parser.add_argument("--out", default=os.path.join("output", "models", "risk_model.npz"))
+    parser.add_argument("--l2", type=float, default=1e-3)
+    parser.add_argument("--epochs", type=int, default=500)
+    parser.add_argument("--min-samples", type=int, default=50)
+    args = parser.parse_args(argv)
+
+    if args.command == "stats":
+        print(json.dumps(RiskHistory(args.history).stats(), indent=2))
+        return 0
+
+    X, y = training_examples(args.history)
+    if len(y) < args.min_samples:
+        print(f"Only {len(y)} assessed invoices in {args.history}; need {args.min_samples}")
+        return 1
+    start = time.perf_counter()
+    model = RiskModel.fit(X, y, l2=args.l2, epochs=args.epochs)
+    model.save(args.out)
+    print(json.dumps({**model.meta, "fit_s": round(time.perf_counter() - start, 3), "out": args.out}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+"""
+Sliding-window velocity counters.
+
+Fraud often shows as velocity rather than as one bad invoice: a vendor
+submitting dozens of invoices within an hour, or one order billed again and
+again. ``SlidingWindowCounter`` counts events per key over the last
+``window_s`` seconds:
+
+- each key holds a ring of ``buckets`` counts (``window_s / buckets``
+  seconds each) and their running total; advancing time clears only the
+  buckets that fell out of the window, so ``hit`` / ``count`` are O(1)
+  amortized whatever the event rate
+- memory is bounded by ``max_keys``: keys live in an LRU order and the
+  coldest is evicted first (a key idle for a whole window has a zero count
+  anyway)
+- ``hit(key, event_id)`` ignores an ``event_id`` it has already counted for
+  that key, so retried or resumed workflow runs do not inflate the count
+
+Counts are in memory only; they cover minutes to hours, not history.
+"""
+
+import time
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, Any, Hashable, List, Optional
+
+
+class _Window:
+    __slots__ = ("counts", "total", "last", "events")
+
+    def __init__(self, buckets: int, now_bucket: int):
+        self.counts: List[int] = [0] * buckets
+        self.total = 0
+        self.last = now_bucket
+        self.events: "OrderedDict[Hashable, None]" = OrderedDict()
+
+
+class SlidingWindowCounter:
+    """Per-key event counts over a sliding time window, bucketed in ring buffers."""
+
+    def __init__(self, window_s: float = 3600.0, buckets: int = 60, max_keys: int = 100_000, max_events: int = 64):
+        self.window_s = max(1e-3, float(window_s))
+        self.buckets = max(1, int(buckets))
+        self.bucket_s = self.window_s / self.buckets
+        self.max_keys = max(1, int(max_keys))
+        # event ids remembered per key for de-duplication
+        self.max_events = max(0, int(max_events))
+        self._keys: "OrderedDict[Hashable, _Window]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "repeats": 0, "evictions": 0}
+
+    def _advance(self, window: _Window, now_bucket: int):
+        gap = now_bucket - window.last
+        if gap <= 0:
+            return
+        if gap >= self.buckets:
+            window.counts = [0] * self.buckets
+            window.total = 0
+        else:
+            for b in range(window.last + 1, now_bucket + 1):
+                slot = b % self.buckets
+                window.total -= window.counts[slot]
+                window.counts[slot] = 0
+        window.last = now_bucket
+
+    def hit(self, key: Hashable, event_id: Optional[Hashable] = None, now: Optional[float] = None) -> int:
+        """Count one event for ``key``; returns the key's count in the window, this event included."""
+        now_bucket = int((time.time() if now is None else now) // self.bucket_s)
+        with self._lock:
+            window = self._keys.get(key)
+            if window is None:
+                window = self._keys[key] = _Window(self.buckets, now_bucket)
+                if len(self._keys) > self.max_keys:
+                    self._keys.popitem(last=False)
+                    self._stats["evictions"] += 1
+            else:
+                self._keys.move_to_end(key)
+                self._advance(window, now_bucket)
+
+            if event_id is not None and self.max_events:
+                if event_id in window.events:
+                    self._stats["repeats"] += 1
+                    return window.total
+                window.events[event_id] = None
+                if len(window.events) > self.max_events:
+                    window.events.popitem(last=False)
+
+            if now_bucket <= window.last - self.buckets:
+                return window.total  # older than the window (late timestamp)
+            window.counts[now_bucket % self.buckets] += 1
+            window.total += 1
+            self._stats["hits"] += 1
+            return window.total
+
+    def count(self, key: Hashable, now: Optional[float] = None) -> int:
+        """Events of ``key`` in the window (does not refresh its LRU position)."""
+        now_bucket = int((time.time() if now is None else now) // self.bucket_s)
+        with self._lock:
+            window = self._keys.get(key)
+            if window is None:
+                return 0
+            self._advance(window, now_bucket)
+            return window.total
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        stats.update({"keys": len(self._keys), "window_s": self.window_s, "buckets": self.buckets})
+        return stats
+
+
+@lru_cache(maxsize=None)
+def get_velocity_counter(name: str, window_s: float = 3600.0, buckets: int = 60, max_keys: int = 100_000) -> SlidingWindowCounter:
+    """Shared counter per name and window (e.g. ``"vendor"`` over an hour)."""
+    return SlidingWindowCounter(window_s, buckets, max_keys)
@@ -0,0 +1,204 @@
+"""
+Per-vendor rolling invoice-amount statistics.
+
+"Unusual amount" means unusual for this vendor: a 40k invoice is routine for
+one supplier and an outlier for another. ``VendorStatsStore`` keeps, per
+normalized vendor name:
+
+- ``count``, ``mean`` and ``m2`` (Welford's running variance), so the mean
+  and standard deviation of every amount seen cost O(1) per update
+- ``ewma`` / ``ewm_var``: exponentially weighted mean and variance
+  (``alpha``), which follow a vendor whose amounts drift over time
+- ``last_seen``
+
+``zscore(vendor, amount)`` compares an amount with the vendor's history
+(``None`` until it has ``min_count`` invoices). Only approved or paid
+invoices are added with ``update`` (RiskAgent.record_approved_amount), so
+rejected, duplicate or unusual invoices do not shift the baseline they are
+judged against. Re-running a process id (retries, resumes, also after a
+restart) does not count its amount twice.
+
+Updates are applied under a lock and written through to one SQLite row per
+vendor (UPSERT), in the same transaction as the counted process id, so the
+store survives restarts without losing or double counting an invoice.
+
+Usage:
+    python -m utils.vendor_stats show --db output/vendor_stats/vendor_stats.sqlite3 [--vendor "Acme Corp"]
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import sqlite3
+import argparse
+import threading
+from functools import lru_cache
+from typing import Dict, Any, List, Optional
+
+from utils.po_repository import normalize_name
+from utils.logger import get_logger
+
+# count, mean, m2, ewma, ewm_var, last_seen
+_COUNT, _MEAN, _M2, _EWMA, _EWM_VAR, _LAST_SEEN = range(6)
+
+
+class VendorStatsStore:
+    """Welford / EWMA amount statistics per vendor, persisted one row per vendor."""
+
+    def __init__(
+        self,
+        db_path: str = os.path.join("output", "vendor_stats", "vendor_stats.sqlite3"),
+        alpha: float = 0.1,
+    ):
+        self.db_path = db_path
+        self.alpha = min(1.0, max(1e-6, float(alpha)))
+        self.logger = get_logger("VendorStatsStore")
+        self._lock = threading.Lock()
+        self._vendors: Dict[str, List[float]] = {}
+        self._stats = {"updates": 0, "repeats": 0, "lookups": 0, "scored": 0}
+
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS vendor_stats (
+                vendor    TEXT PRIMARY KEY,
+                count     INTEGER NOT NULL,
+                mean      REAL NOT NULL,
+                m2        REAL NOT NULL,
+                ewma      REAL NOT NULL,
+                ewm_var   REAL NOT NULL,
+                last_seen REAL NOT NULL
+            )
+            """
+        )
+        # process ids already counted, so a resumed run is not counted again after a restart
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS vendor_stats_processes (process_id TEXT PRIMARY KEY, vendor TEXT NOT NULL)"
+        )
+        for row in self._conn.execute("SELECT vendor, count, mean, m2, ewma, ewm_var, last_seen FROM vendor_stats"):
+            self._vendors[row[0]] = list(row[1:])
+        self.logger.info(f"Loaded amount statistics for {len(self._vendors)} vendors from {self.db_path}")
+
+    # ------------------------------------------------------------------
+    # Update
+    # ------------------------------------------------------------------
+    def update(self, customer_name: Any, amount: float, process_id: Optional[str] = None) -> bool:
+        """Add one invoice amount; ``False`` when the vendor is unknown or ``process_id`` was already counted."""
+        vendor = normalize_name(customer_name)
+        if not vendor:
+            return False
+        x = float(amount)
+        with self._lock:
+            # updated on a copy: the cached entry only changes once the write commits
+            entry = list(self._vendors.get(vendor) or [0, 0.0, 0.0, x, 0.0, 0.0])
+            entry[_COUNT] += 1
+            delta = x - entry[_MEAN]
+            entry[_MEAN] += delta / entry[_COUNT]
+            entry[_M2] += delta * (x - entry[_MEAN])
+            if entry[_COUNT] > 1:
+                ew_delta = x - entry[_EWMA]
+                entry[_EWMA] += self.alpha * ew_delta
+                entry[_EWM_VAR] = (1 - self.alpha) * (entry[_EWM_VAR] + self.alpha * ew_delta * ew_delta)
+            entry[_LAST_SEEN] = time.time()
+
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if process_id is not None:
+                    cur = self._conn.execute(
+                        "INSERT OR IGNORE INTO vendor_stats_processes (process_id, vendor) VALUES (?, ?)",
+                        (process_id, vendor),
+                    )
+                    if not cur.rowcount:
+                        self._conn.execute("ROLLBACK")
+                        self._stats["repeats"] += 1
+                        return False
+                self._conn.execute(
+                    "INSERT INTO vendor_stats (vendor, count, mean, m2, ewma, ewm_var, last_seen) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(vendor) DO UPDATE SET count = excluded.count, mean = excluded.mean, m2 = excluded.m2, "
+                    "ewma = excluded.ewma, ewm_var = excluded.ewm_var, last_seen = excluded.last_seen",
+                    (vendor, *entry),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._vendors[vendor] = entry
+            self._stats["updates"] += 1
+        return True
+
+    # ------------------------------------------------------------------
+    # Lookups
+    # ------------------------------------------------------------------
+    def get(self, customer_name: Any) -> Optional[Dict[str, Any]]:
+        """Count, mean / std, EWMA / EW std and last-seen time of one vendor (``None`` if never seen)."""
+        entry = self._vendors.get(normalize_name(customer_name))
+        self._stats["lookups"] += 1
+        if entry is None:
+            return None
+        count, mean, m2, ewma, ewm_var, last_seen = entry
+        return {
+            "count": int(count),
+            "mean": mean,
+            "std": math.sqrt(m2 / (count - 1)) if count > 1 else 0.0,
+            "ewma": ewma,
+            "ewm_std": math.sqrt(ewm_var),
+            "last_seen": last_seen,
+        }
+
+    def zscore(self, customer_name: Any, amount: float, min_count: int = 5) -> Optional[float]:
+        """
+        Standard score of ``amount`` against the vendor's amounts, or ``None``
+        with fewer than ``min_count`` of them. The deviation is floored at 1%
+        of the mean (and 1.0), so a vendor that always bills the same amount
+        does not make every cent of difference an outlier.
+        """
+        stats = self.get(customer_name)
+        if stats is None or stats["count"] < max(2, int(min_count)):
+            return None
+        self._stats["scored"] += 1
+        std = max(stats["std"], 0.01 * abs(stats["mean"]), 1.0)
+        return (float(amount) - stats["mean"]) / std
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        stats.update({"db_path": self.db_path, "vendors": len(self._vendors), "alpha": self.alpha})
+        return stats
+
+
+@lru_cache(maxsize=None)
+def _shared_store(db_path: str) -> VendorStatsStore:
+    return VendorStatsStore(db_path)
+
+
+def get_vendor_stats(db_path: str, alpha: Optional[float] = None) -> VendorStatsStore:
+    """Shared store per database file (one set of running statistics per file, whatever the caller)."""
+    store = _shared_store(os.path.abspath(db_path))
+    if alpha is not None:
+        store.alpha = min(1.0, max(1e-6, float(alpha)))
+    return store
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Per-vendor invoice amount statistics")
+    parser.add_argument("command", choices=["show"])
+    parser.add_argument("--db", default=os.path.join("output", "vendor_stats", "vendor_stats.sqlite3"))
+    parser.add_argument("--vendor", help="one vendor (default: store summary)")
+    args = parser.parse_args(argv)
+
+    store = VendorStatsStore(args.db)
+    if args.vendor:
+        vendor = store.get(args.vendor)
+        print(json.dumps(vendor, indent=2) if vendor else f"No history for {args.vendor}")
+    else:
+        print(json.dumps(store.stats(), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())